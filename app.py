@@ -7,35 +7,50 @@ import datetime
 import base64
 import binascii
 import time
+import hashlib
 import json
-from collections import deque
-from threading import Lock
 
 from fastapi import BackgroundTasks, FastAPI, File, Form, HTTPException, Request, UploadFile
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, StreamingResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, RedirectResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.sessions import SessionMiddleware
 from pydantic import BaseModel
 
+from core import change_stream
 from core import db
 from core import settings as app_settings
-from core.ocr_pipeline import prepare_debug_artifacts, run_face_match_scan, run_security_scan
+from core.ocr_pipeline import (
+    decode_image,
+    models_loaded,
+    prepare_debug_artifacts,
+    run_security_scan,
+)
+from core import docai
 from core import face_match
 from core import media
+from core import media_writer
+from core import metrics
+from core import idempotency
+from core import inference
+from core import telemetry
+from core.deadline import Deadline, request_deadline
 from core import queue as rq_queue
+from core import rate_limit
 from core import tasks as background_tasks_runner
 
 RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
 RATE_LIMIT_WINDOW_SEC = int(os.getenv("RATE_LIMIT_WINDOW_SEC", "60"))
 RATE_LIMIT_MAX = int(os.getenv("RATE_LIMIT_MAX", "20"))
-SSE_POLL_INTERVAL_SEC = float(os.getenv("SSE_POLL_INTERVAL_SEC", "2"))
+RATE_LIMIT_KEY_MAX = int(os.getenv("RATE_LIMIT_KEY_MAX", "0"))
+RATE_LIMIT_GATE_MAX = int(os.getenv("RATE_LIMIT_GATE_MAX", "30"))
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(8 * 1024 * 1024)))
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
 REPROCESS_BATCH_MAX = int(os.getenv("REPROCESS_BATCH_MAX", "50"))
 MANUAL_ISSUES_MAX = int(os.getenv("MANUAL_ISSUES_MAX", "2000"))
 KEEP_FAILED_UPLOADS = os.getenv("KEEP_FAILED_UPLOADS", "0") == "1"
 TRUST_PROXY = os.getenv("TRUST_PROXY", "1") == "1"
-_rate_lock = Lock()
-_rate_buckets: dict[str, deque[float]] = {}
 ADMIN_USERNAME = os.getenv("ADMIN_USERNAME", "")
 ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "")
 DEBUG_PIN = os.getenv("DEBUG_PIN", "1150445")
@@ -81,10 +96,16 @@ class UnblockRequest(BaseModel):
 
 class SettingsRequest(BaseModel):
     docai_grayscale: bool
+    docai_mosaic: Optional[bool] = None
     face_match_enabled: Optional[bool] = None
     face_match_threshold: Optional[float] = None
     docai_max_dim: Optional[int] = None
     docai_jpeg_quality: Optional[int] = None
+    quality_gate_enabled: Optional[bool] = None
+    quality_min_sharpness: Optional[float] = None
+    quality_max_glare: Optional[float] = None
+    quality_min_brightness: Optional[int] = None
+    quality_max_brightness: Optional[int] = None
 
 
 class UpdatePersonRequest(BaseModel):
@@ -112,12 +133,22 @@ class BatchRotateRequest(BaseModel):
 def on_startup() -> None:
     media.ensure_dirs()
     db.init_db()
+    if inference.INFERENCE_WORKERS > 0:
+        # Models live in the inference processes; this worker only loads them lazily for debug scans.
+        inference.start()
+        return
     try:
         face_match.warm_up()
     except Exception as exc:
         print(f"[FACE] Warm-up failed: {exc}")
 
 
+@app.on_event("shutdown")
+def on_shutdown() -> None:
+    inference.shutdown()
+    media_writer.drain()
+
+
 def _require_api_key(request: Request) -> None:
     expected = os.getenv("SECURITY_API_KEY")
     if not expected:
@@ -143,22 +174,92 @@ def _decode_base64_image(value: str) -> bytes:
         raise HTTPException(status_code=400, detail="Base64 غير صالح")
 
 
-def _cleanup_raw_file(raw_path: Optional[str]) -> None:
-    if not raw_path:
-        return
+def _parse_gate_number(value: Optional[str]) -> Optional[int]:
+    if value is None or not str(value).strip():
+        return None
     try:
-        Path(raw_path).unlink()
-    except Exception:
-        pass
+        return int(str(value).strip())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="رقم البوابة غير صالح")
 
 
-def _cleanup_card_file(card_filename: Optional[str]) -> None:
-    if not card_filename:
-        return
+def _content_length(request: Request, allowance: int = 0) -> Optional[int]:
+    header = request.headers.get("content-length")
+    if not header:
+        return None
     try:
-        (CARD_DIR / card_filename).unlink()
-    except Exception:
-        pass
+        length = int(header)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Content-Length غير صالح")
+    if length > UPLOAD_MAX_BYTES + allowance:
+        raise HTTPException(status_code=413, detail="حجم الصورة أكبر من المسموح")
+    return length
+
+
+async def _read_body_into_buffer(request: Request) -> bytearray:
+    length = _content_length(request)
+    if length is None:
+        # Chunked upload: grow with the body instead of reserving UPLOAD_MAX_BYTES per request.
+        buffer = bytearray()
+        async for chunk in request.stream():
+            if len(buffer) + len(chunk) > UPLOAD_MAX_BYTES:
+                raise HTTPException(status_code=413, detail="حجم الصورة أكبر من المسموح")
+            buffer += chunk
+        return buffer
+    # One buffer sized up front; chunks are copied straight into it instead of joined later.
+    buffer = bytearray(length)
+    view = memoryview(buffer)
+    size = 0
+    try:
+        async for chunk in request.stream():
+            end = size + len(chunk)
+            if end > len(buffer):
+                raise HTTPException(status_code=413, detail="حجم الصورة أكبر من المسموح")
+            view[size:end] = chunk
+            size = end
+    finally:
+        view.release()
+    if size < len(buffer):
+        del buffer[size:]
+    return buffer
+
+
+async def _read_multipart_image(request: Request) -> tuple[bytes, Optional[str]]:
+    _content_length(request, MULTIPART_OVERHEAD_BYTES)
+    form = await request.form(max_files=1, max_fields=4)
+    try:
+        upload = form.get("image") or form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="الحقل image مطلوب")
+        if upload.size is not None and upload.size > UPLOAD_MAX_BYTES:
+            raise HTTPException(status_code=413, detail="حجم الصورة أكبر من المسموح")
+        gate_value = form.get("gate_number")
+        return await upload.read(), gate_value if isinstance(gate_value, str) else None
+    finally:
+        await form.close()
+
+
+async def _read_binary_upload(request: Request) -> tuple[bytes, Optional[str]]:
+    content_type = (request.headers.get("content-type") or "").split(";")[0].strip().lower()
+    if content_type == "multipart/form-data":
+        image_bytes, gate_value = await _read_multipart_image(request)
+    elif not content_type or content_type == "application/octet-stream" or content_type.startswith("image/"):
+        image_bytes, gate_value = await _read_body_into_buffer(request), None
+    else:
+        raise HTTPException(status_code=415, detail="نوع المحتوى غير مدعوم، استخدم application/octet-stream أو multipart/form-data")
+    if not image_bytes:
+        raise HTTPException(status_code=400, detail="بيانات الصورة فارغة")
+    return image_bytes, gate_value
+
+
+def _decode_upload(image_bytes: bytes, timings: dict) -> object:
+    t0 = time.perf_counter()
+    try:
+        image = decode_image(image_bytes)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="تعذر قراءة الصورة")
+    timings["decode_ms"] = (time.perf_counter() - t0) * 1000
+    return image
 
 
 def _failed_debug_files(raw_path: Optional[str], card_filename: Optional[str]) -> Optional[dict]:
@@ -172,11 +273,29 @@ def _failed_debug_files(raw_path: Optional[str], card_filename: Optional[str]) -
     return payload or None
 
 
-def _cleanup_failed_files(raw_path: Optional[str], card_filename: Optional[str]) -> None:
-    if KEEP_FAILED_UPLOADS:
-        return
-    _cleanup_raw_file(raw_path)
-    _cleanup_card_file(card_filename)
+def _persist_upload(image_bytes: bytes, image, upload_timings: dict) -> tuple[Optional[str], Optional[str]]:
+    t0 = time.perf_counter()
+    original_card_filename = media.save_original_card_image(image_bytes, image)
+    raw_path = None
+    if original_card_filename is None or not media.is_jpeg(image_bytes):
+        raw_path = media.save_raw_upload(image_bytes)
+    upload_timings["persist_upload_ms"] = (time.perf_counter() - t0) * 1000
+    print(
+        "[TIMING][upload]",
+        {key: round(value, 2) for key, value in upload_timings.items()},
+        f"bytes={len(image_bytes)} jpeg_passthrough={raw_path is None}",
+    )
+    return original_card_filename, raw_path
+
+
+def _with_failed_upload(payload: dict, image_bytes: bytes, image) -> dict:
+    if not KEEP_FAILED_UPLOADS:
+        return payload
+    original_card_filename, raw_path = _persist_upload(image_bytes, image, {})
+    debug_files = _failed_debug_files(raw_path, original_card_filename)
+    if debug_files:
+        payload["debug_files"] = debug_files
+    return payload
 
 
 def _client_ip(request: Request) -> str:
@@ -187,19 +306,20 @@ def _client_ip(request: Request) -> str:
     return request.client.host if request.client else "unknown"
 
 
-def _enforce_rate_limit(request: Request) -> None:
+def _enforce_rate_limit(request: Request, gate_number: Optional[int] = None) -> None:
     if not RATE_LIMIT_ENABLED:
         return
-    ip = _client_ip(request)
-    now = time.time()
-    with _rate_lock:
-        bucket = _rate_buckets.setdefault(ip, deque())
-        cutoff = now - RATE_LIMIT_WINDOW_SEC
-        while bucket and bucket[0] < cutoff:
-            bucket.popleft()
-        if len(bucket) >= RATE_LIMIT_MAX:
-            raise HTTPException(status_code=429, detail="معدل الطلبات عالي، حاول لاحقاً")
-        bucket.append(now)
+    limits = [(f"ip:{_client_ip(request)}", RATE_LIMIT_MAX, RATE_LIMIT_WINDOW_SEC)]
+    api_key = request.headers.get("x-api-key") or ""
+    if api_key:
+        key_id = hashlib.sha256(api_key.encode()).hexdigest()[:16]
+        limits.append((f"key:{key_id}", RATE_LIMIT_KEY_MAX, RATE_LIMIT_WINDOW_SEC))
+    if gate_number is not None:
+        limits.append((f"gate:{gate_number}", RATE_LIMIT_GATE_MAX, RATE_LIMIT_WINDOW_SEC))
+    try:
+        rate_limit.check(limits)
+    except rate_limit.RateLimited as exc:
+        raise HTTPException(status_code=429, detail=str(exc), headers={"Retry-After": str(exc.retry_after)})
 
 
 def _is_authenticated(request: Request) -> bool:
@@ -234,7 +354,18 @@ def _error_payload(
     return payload
 
 
-def _map_scan_error(message: str) -> tuple[str, str]:
+SCAN_ERROR_HINTS = {
+    "image_blurry": "ثبّت الكاميرا وانتظر حتى يتضح التركيز قبل التصوير.",
+    "image_glare": "غيّر زاوية البطاقة لتجنب انعكاس الإضاءة أو الفلاش عليها.",
+    "image_too_dark": "صوّر البطاقة في مكان أكثر إضاءة.",
+    "image_too_bright": "قلل الإضاءة المباشرة على البطاقة أو أوقف الفلاش.",
+    "deadline_exceeded": "السيرفر مشغول حالياً، أعد المحاولة بعد لحظات.",
+}
+
+
+def _map_scan_error(message: str, code: Optional[str] = None) -> tuple[str, str]:
+    if code in SCAN_ERROR_HINTS:
+        return code, SCAN_ERROR_HINTS[code]
     if "بطاقة" in message:
         return (
             "card_not_found",
@@ -281,10 +412,13 @@ def _allow_or_block_matched_person(person: dict, source: str, ocr: Optional[dict
 
 
 def _process_scan(image_bytes: bytes) -> dict:
-    original_card_filename = media.save_original_card_image(image_bytes)
-    scan = run_security_scan(image_bytes)
+    upload_timings: dict[str, float] = {}
+    image = _decode_upload(image_bytes, upload_timings)
+    original_card_filename = media.save_original_card_image(image_bytes, image)
+    scan = run_security_scan(image_bytes, image=image)
+    scan.timings.update(upload_timings)
     if scan.error:
-        code, hint = _map_scan_error(scan.error)
+        code, hint = _map_scan_error(scan.error, scan.error_code)
         return {
             **_error_payload(
                 scan.error,
@@ -336,17 +470,14 @@ def _process_scan(image_bytes: bytes) -> dict:
             card_filename = media.save_card_image(scan.card_image, nid)
         embedding_blob = media.serialize_embedding(scan.face_embedding)
 
-        db.increment_visit(nid)
-        if photo_filename or card_filename or embedding_blob:
-            db.update_media(
-                nid,
-                photo_path=photo_filename,
-                card_path=card_filename,
-                face_embedding=embedding_blob,
-            )
-            if embedding_blob:
-                face_match.mark_index_dirty()
-        person = db.get_person_by_nid(nid) or matched_person
+        person = db.record_visit(
+            nid,
+            photo_path=photo_filename,
+            card_path=card_filename,
+            face_embedding=embedding_blob,
+        ) or matched_person
+        if embedding_blob:
+            face_match.mark_index_dirty()
 
         if person.get("blocked"):
             return {
@@ -402,6 +533,7 @@ def _process_scan(image_bytes: bytes) -> dict:
                     photo_path=photo_filename,
                     card_path=card_filename,
                     face_embedding=embedding_blob,
+                    fetch=False,
                 )
                 if embedding_blob:
                     face_match.mark_index_dirty()
@@ -414,18 +546,15 @@ def _process_scan(image_bytes: bytes) -> dict:
                 "source": ocr_source,
             }
 
-        db.increment_visit(national_id)
-        db.update_name_if_missing(national_id, full_name)
-        if photo_filename or card_filename or embedding_blob:
-            db.update_media(
-                national_id,
-                photo_path=photo_filename,
-                card_path=card_filename,
-                face_embedding=embedding_blob,
-            )
-            if embedding_blob:
-                face_match.mark_index_dirty()
-        person = db.get_person_by_nid(national_id)
+        person = db.record_visit(
+            national_id,
+            photo_path=photo_filename,
+            card_path=card_filename,
+            face_embedding=embedding_blob,
+            full_name=full_name,
+        )
+        if embedding_blob:
+            face_match.mark_index_dirty()
 
         return {
             "status": "allowed",
@@ -453,85 +582,140 @@ def _process_scan(image_bytes: bytes) -> dict:
     }
 
 
+def _scan_outcome(result: dict) -> str:
+    if result.get("status") == "error":
+        return result.get("error_code") or "error"
+    if result.get("is_new"):
+        return "new"
+    if result.get("status") == "blocked":
+        return "blocked"
+    return "matched"
+
+
 def _process_scan_external(
     image_bytes: bytes,
     background_tasks: Optional[BackgroundTasks],
     gate_number: Optional[int] = None,
+    deadline: Optional[Deadline] = None,
+    upload_ms: Optional[float] = None,
+    subject: Optional[dict] = None,
 ) -> dict:
-    raw_path = media.save_raw_upload(image_bytes)
-    original_card_filename = media.save_original_card_image(image_bytes)
-    scan = run_face_match_scan(image_bytes)
+    started = time.perf_counter()
+    trace: dict = {"timings": {}}
+    if upload_ms is not None:
+        trace["timings"]["upload_read_ms"] = upload_ms
+    try:
+        with inference.admission() as queued:
+            trace["timings"]["inference_queue_depth"] = float(queued)
+            result = _scan_external(image_bytes, background_tasks, gate_number, trace, deadline)
+    except inference.InferenceBusy:
+        metrics.observe_scan({"request_ms": (time.perf_counter() - started) * 1000}, "server_busy", path="match")
+        raise
+    if deadline is not None and deadline.degraded:
+        result["degraded"] = list(deadline.degraded)
+    if subject is not None and trace.get("subject_id") is not None:
+        subject["id"] = trace["subject_id"]
+    timings = trace["timings"]
+    timings["request_ms"] = (time.perf_counter() - started) * 1000
+    outcome = _scan_outcome(result)
+    metrics.observe_scan(timings, outcome, path="match")
+    telemetry.record_scan(
+        timings,
+        outcome,
+        gate_number=gate_number,
+        match_score=trace.get("match_score"),
+        image_bytes=len(image_bytes),
+        image_size=trace.get("image_size"),
+    )
+    return result
+
+
+def _scan_external(
+    image_bytes: bytes,
+    background_tasks: Optional[BackgroundTasks],
+    gate_number: Optional[int],
+    trace: dict,
+    deadline: Optional[Deadline] = None,
+) -> dict:
+    upload_timings: dict[str, float] = {}
+    image = None
+    if inference.INFERENCE_WORKERS <= 0:
+        # With a process pool the inference worker decodes; decoding here too would double the cost.
+        image = _decode_upload(image_bytes, upload_timings)
+        trace["image_size"] = (int(image.shape[1]), int(image.shape[0]))
+
+    try:
+        scan = inference.run_face_match(image_bytes, image=image, deadline=deadline)
+    except inference.InvalidImage:
+        raise HTTPException(status_code=400, detail="تعذر قراءة الصورة")
+    if scan.image_size is not None:
+        trace["image_size"] = scan.image_size
+    scan.timings.update(upload_timings)
+    trace["timings"].update(scan.timings)
+    if scan.face_match:
+        trace["match_score"] = scan.face_match.get("score")
     if scan.error:
-        code, hint = _map_scan_error(scan.error)
-        _cleanup_failed_files(raw_path, original_card_filename)
+        code, hint = _map_scan_error(scan.error, scan.error_code)
         payload = _error_payload(
             scan.error,
             code=code,
             hint=hint,
             timings=scan.timings,
         )
-        debug_files = _failed_debug_files(raw_path, original_card_filename)
-        if debug_files:
-            payload["debug_files"] = debug_files
-        return payload
+        return _with_failed_upload(payload, image_bytes, image)
     if scan.photo_image is None:
-        _cleanup_failed_files(raw_path, original_card_filename)
         payload = _error_payload(
             "لم يتم استخراج صورة واضحة من البطاقة",
             code="face_crop_missing",
             hint="الصورة المقصوصة للوجه غير واضحة. حاول تقريب البطاقة وتجنب الانعكاس.",
         )
-        debug_files = _failed_debug_files(raw_path, original_card_filename)
-        if debug_files:
-            payload["debug_files"] = debug_files
-        return payload
+        return _with_failed_upload(payload, image_bytes, image)
     if _detect_face_embedding(scan) is None:
-        _cleanup_failed_files(raw_path, original_card_filename)
         payload = _error_payload(
             "لم يتم اكتشاف وجه واضح في صورة البطاقة",
             code="face_not_detected",
             hint="تأكد أن وجه صاحب البطاقة ظاهر بالكامل وبوضوح بدون انعكاس أو قصّ.",
         )
-        debug_files = _failed_debug_files(raw_path, original_card_filename)
-        if debug_files:
-            payload["debug_files"] = debug_files
-        return payload
+        return _with_failed_upload(payload, image_bytes, image)
 
     match_info = scan.face_match
     if match_info and match_info.get("matched"):
         person = match_info.get("person") or {}
         nid = person.get("national_id") or ""
+        trace["subject_id"] = person.get("id")
         if not nid:
-            _cleanup_failed_files(raw_path, original_card_filename)
             payload = _allow_or_block_matched_person(person, source="face_match")
             payload.pop("ocr", None)
             payload["is_new"] = False
-            debug_files = _failed_debug_files(raw_path, original_card_filename)
-            if debug_files:
-                payload["debug_files"] = debug_files
-            return payload
-
-        photo_filename = media.save_person_photo(scan.photo_image, nid)
-        card_filename = original_card_filename
-        if card_filename is None and scan.card_image is not None:
-            card_filename = media.save_card_image(scan.card_image, nid)
+            return _with_failed_upload(payload, image_bytes, image)
+
+        # Known visitor: the decision does not depend on these files, so they are written behind the response.
+        # The row keeps its previous paths until the writer has the new file on disk.
+        t0 = time.perf_counter()
+        media.queue_person_photo(
+            scan.photo_image,
+            nid,
+            on_commit=lambda filename: db.update_media(nid, photo_path=filename, fetch=False),
+        )
+        media.queue_original_card_image(
+            image_bytes,
+            image,
+            on_commit=lambda filename: db.update_media(nid, card_path=filename, fetch=False),
+        )
+        trace["timings"]["media_queue_ms"] = (time.perf_counter() - t0) * 1000
         embedding_blob = media.serialize_embedding(scan.face_embedding)
-        db.increment_visit(nid)
-        if photo_filename or card_filename or embedding_blob:
-            db.update_media(
-                nid,
-                photo_path=photo_filename,
-                card_path=card_filename,
-                face_embedding=embedding_blob,
-            )
-            if embedding_blob:
-                face_match.mark_index_dirty()
-        if gate_number is not None:
-            db.update_gate_number_if_missing(nid, gate_number)
-        person = db.get_person_by_nid(nid) or person
+        t0 = time.perf_counter()
+        person = db.record_visit(
+            nid,
+            face_embedding=embedding_blob,
+            gate_number=gate_number,
+        ) or person
+        trace["timings"]["record_visit_ms"] = (time.perf_counter() - t0) * 1000
+        trace["subject_id"] = person.get("id")
+        if embedding_blob:
+            face_match.mark_index_dirty()
 
         if person.get("blocked"):
-            _cleanup_raw_file(raw_path)
             return {
                 "status": "blocked",
                 "message": "هذا الشخص محظور من الدخول",
@@ -539,20 +723,21 @@ def _process_scan_external(
                 "is_new": False,
             }
 
-        _cleanup_raw_file(raw_path)
         return {
             "status": "allowed",
             "message": "مسموح بالدخول",
             "is_new": False,
         }
 
+    # New visitor: the registration job reads these files, so they are on disk before it is enqueued.
+    original_card_filename, raw_path = _persist_upload(image_bytes, image, trace["timings"])
     placeholder_nid = media.generate_temp_nid()
     photo_filename = media.save_person_photo(scan.photo_image, placeholder_nid)
     card_filename = original_card_filename
     if card_filename is None and scan.card_image is not None:
         card_filename = media.save_card_image(scan.card_image, placeholder_nid)
     embedding_blob = media.serialize_embedding(scan.face_embedding)
-    db.add_person(
+    created = db.add_person(
         placeholder_nid,
         "",
         photo_filename,
@@ -560,10 +745,24 @@ def _process_scan_external(
         embedding_blob,
         gate_number=gate_number,
     )
+    trace["subject_id"] = (created or {}).get("id")
     if embedding_blob:
         face_match.mark_index_dirty()
 
-    job_id = rq_queue.enqueue_registration(raw_path, original_card_filename, placeholder_nid, gate_number)
+    artifacts_key = None
+    if scan.card_image is not None:
+        try:
+            artifacts_key = media.save_scan_artifacts(scan.card_image, scan.fields, scan.card_bbox, scan.photo_image)
+        except Exception as exc:
+            print(f"[SCAN] Failed to persist scan artifacts: {exc}")
+
+    job_id = rq_queue.enqueue_registration(
+        raw_path,
+        original_card_filename,
+        placeholder_nid,
+        gate_number,
+        artifacts_key,
+    )
     if job_id is None:
         if background_tasks is not None:
             background_tasks.add_task(
@@ -572,9 +771,16 @@ def _process_scan_external(
                 original_card_filename,
                 placeholder_nid,
                 gate_number,
+                artifacts_key,
             )
         else:
-            background_tasks_runner.register_person_job(raw_path, original_card_filename, placeholder_nid, gate_number)
+            background_tasks_runner.register_person_job(
+                raw_path,
+                original_card_filename,
+                placeholder_nid,
+                gate_number,
+                artifacts_key,
+            )
 
     return {
         "status": "allowed",
@@ -636,6 +842,19 @@ def admin(request: Request):
     )
 
 
+@app.get("/admin/telemetry", response_class=HTMLResponse)
+def admin_telemetry(request: Request):
+    if not _is_authenticated(request):
+        return RedirectResponse("/login", status_code=303)
+    return templates.TemplateResponse(
+        "telemetry.html",
+        {
+            "request": request,
+            "is_authenticated": True,
+        },
+    )
+
+
 @app.get("/settings", response_class=HTMLResponse)
 def settings(request: Request):
     raise HTTPException(status_code=404, detail="Not Found")
@@ -665,15 +884,123 @@ def unlock_debug(request: Request, payload: DebugPinRequest):
     raise HTTPException(status_code=403, detail="الرمز غير صحيح")
 
 
+def _revalidate_replay(response: tuple[int, dict], subject_id: Optional[int]) -> Optional[tuple[int, dict]]:
+    status_code, body = response
+    if body.get("status") not in {"allowed", "blocked"}:
+        return response
+    person = db.get_person_by_id(subject_id) if subject_id is not None else None
+    if person is None:
+        # Without the row the stored decision cannot be confirmed; scan again.
+        return None
+    if bool(person.get("blocked")) == (body["status"] == "blocked"):
+        return response
+    if person.get("blocked"):
+        return status_code, {
+            "status": "blocked",
+            "message": "هذا الشخص محظور من الدخول",
+            "reason": person.get("block_reason") or "غير محدد",
+            "is_new": bool(body.get("is_new")),
+        }
+    return status_code, {"status": "allowed", "message": "مسموح بالدخول", "is_new": bool(body.get("is_new"))}
+
+
+def _gate_scan_response(
+    image_bytes: bytes,
+    background_tasks: BackgroundTasks,
+    gate_number: Optional[int],
+    deadline: Deadline,
+    upload_ms: Optional[float] = None,
+    idempotency_key: Optional[str] = None,
+):
+    started = time.perf_counter()
+    image_digest = hashlib.sha256(image_bytes).hexdigest()
+
+    def compute() -> tuple[tuple[int, dict], Optional[int]]:
+        subject: dict = {}
+        result = _process_scan_external(
+            image_bytes, background_tasks, gate_number, deadline, upload_ms, subject
+        )
+        return ((422 if result["status"] == "error" else 200), result), subject.get("id")
+
+    key = idempotency.request_key(idempotency_key, image_digest, gate_number)
+    try:
+        (status_code, result), mode = idempotency.run(
+            key,
+            image_digest,
+            compute,
+            idempotency.wait_budget(deadline.remaining()),
+            revalidate=_revalidate_replay,
+        )
+    except idempotency.KeyReused as exc:
+        return JSONResponse(
+            _error_payload(
+                str(exc),
+                code="idempotency_key_reused",
+                hint="استخدم مفتاح Idempotency-Key جديد لكل صورة.",
+            ),
+            status_code=422,
+        )
+    except inference.InferenceBusy as exc:
+        return JSONResponse(
+            _error_payload(
+                str(exc),
+                code="server_busy",
+                hint="عدد الطلبات الحالية أكبر من قدرة السيرفر، أعد المحاولة بعد لحظات.",
+            ),
+            status_code=503,
+            headers={"Retry-After": str(exc.retry_after)},
+        )
+    if mode != "executed":
+        metrics.observe_scan({"request_ms": (time.perf_counter() - started) * 1000}, mode, path="match")
+        print(f"[SCAN] Duplicate request served from idempotency cache mode={mode} gate={gate_number}")
+        return JSONResponse(result, status_code=status_code, headers={"Idempotent-Replayed": "true"})
+    if status_code != 200:
+        return JSONResponse(result, status_code=status_code)
+    return result
+
+
 @app.post("/api/v1/security/scan-base64")
 def security_scan_base64(request: Request, payload: Base64ScanRequest, background_tasks: BackgroundTasks):
     _require_api_key(request)
-    _enforce_rate_limit(request)
+    _enforce_rate_limit(request, payload.gate_number)
+    deadline = request_deadline(request.headers.get("x-deadline-ms"))
+    t0 = time.perf_counter()
     image_bytes = _decode_base64_image(payload.image_base64)
-    result = _process_scan_external(image_bytes, background_tasks, payload.gate_number)
-    if result["status"] == "error":
-        return JSONResponse(result, status_code=422)
-    return result
+    upload_ms = (time.perf_counter() - t0) * 1000
+    return _gate_scan_response(
+        image_bytes,
+        background_tasks,
+        payload.gate_number,
+        deadline,
+        upload_ms,
+        request.headers.get("idempotency-key"),
+    )
+
+
+@app.post("/api/v1/security/scan")
+async def security_scan_binary(request: Request, background_tasks: BackgroundTasks):
+    _require_api_key(request)
+    gate_number = _parse_gate_number(request.headers.get("x-gate-number") or request.query_params.get("gate_number"))
+    # The limiter makes a blocking Redis round trip; a slow Redis must not stall the event loop.
+    if gate_number is not None:
+        await run_in_threadpool(_enforce_rate_limit, request, gate_number)
+    deadline = request_deadline(request.headers.get("x-deadline-ms"))
+    t0 = time.perf_counter()
+    image_bytes, form_gate = await _read_binary_upload(request)
+    upload_ms = (time.perf_counter() - t0) * 1000
+    if gate_number is None:
+        # The gate may only be in the form: check every limit at once so a gate rejection spends nothing.
+        gate_number = _parse_gate_number(form_gate)
+        await run_in_threadpool(_enforce_rate_limit, request, gate_number)
+    return await run_in_threadpool(
+        _gate_scan_response,
+        image_bytes,
+        background_tasks,
+        gate_number,
+        deadline,
+        upload_ms,
+        request.headers.get("idempotency-key"),
+    )
 
 
 @app.post("/api/debug")
@@ -698,19 +1025,32 @@ async def debug_scan(request: Request, image: UploadFile = File(...)):
         "docai": artifacts["docai"],
         "docai_entities": artifacts["docai_entities"],
         "timings": artifacts.get("timings", {}),
+        "quality": artifacts.get("quality"),
         "final": artifacts["final"],
     }
 
 
+@app.get("/api/debug/docai-stats")
+def docai_stats(request: Request):
+    _require_debug_access(request)
+    return docai.stats()
+
+
 @app.get("/api/settings")
 def get_settings(request: Request):
     _require_debug_access(request)
     return {
         "docai_grayscale": app_settings.get_docai_grayscale(),
+        "docai_mosaic": app_settings.get_docai_mosaic(),
         "face_match_enabled": app_settings.get_face_match_enabled(),
         "face_match_threshold": app_settings.get_face_match_threshold(),
         "docai_max_dim": app_settings.get_docai_max_dim(),
         "docai_jpeg_quality": app_settings.get_docai_jpeg_quality(),
+        "quality_gate_enabled": app_settings.get_quality_gate_enabled(),
+        "quality_min_sharpness": app_settings.get_quality_min_sharpness(),
+        "quality_max_glare": app_settings.get_quality_max_glare(),
+        "quality_min_brightness": app_settings.get_quality_min_brightness(),
+        "quality_max_brightness": app_settings.get_quality_max_brightness(),
     }
 
 
@@ -718,6 +1058,8 @@ def get_settings(request: Request):
 def update_settings(request: Request, payload: SettingsRequest):
     _require_debug_access(request)
     app_settings.set_docai_grayscale(payload.docai_grayscale)
+    if payload.docai_mosaic is not None:
+        app_settings.set_docai_mosaic(payload.docai_mosaic)
     if payload.face_match_enabled is not None:
         app_settings.set_face_match_enabled(payload.face_match_enabled)
     if payload.face_match_threshold is not None:
@@ -726,13 +1068,29 @@ def update_settings(request: Request, payload: SettingsRequest):
         app_settings.set_docai_max_dim(payload.docai_max_dim)
     if payload.docai_jpeg_quality is not None:
         app_settings.set_docai_jpeg_quality(payload.docai_jpeg_quality)
+    if payload.quality_gate_enabled is not None:
+        app_settings.set_quality_gate_enabled(payload.quality_gate_enabled)
+    if payload.quality_min_sharpness is not None:
+        app_settings.set_quality_min_sharpness(payload.quality_min_sharpness)
+    if payload.quality_max_glare is not None:
+        app_settings.set_quality_max_glare(payload.quality_max_glare)
+    if payload.quality_min_brightness is not None:
+        app_settings.set_quality_min_brightness(payload.quality_min_brightness)
+    if payload.quality_max_brightness is not None:
+        app_settings.set_quality_max_brightness(payload.quality_max_brightness)
     return {
         "status": "ok",
         "docai_grayscale": app_settings.get_docai_grayscale(),
+        "docai_mosaic": app_settings.get_docai_mosaic(),
         "face_match_enabled": app_settings.get_face_match_enabled(),
         "face_match_threshold": app_settings.get_face_match_threshold(),
         "docai_max_dim": app_settings.get_docai_max_dim(),
         "docai_jpeg_quality": app_settings.get_docai_jpeg_quality(),
+        "quality_gate_enabled": app_settings.get_quality_gate_enabled(),
+        "quality_min_sharpness": app_settings.get_quality_min_sharpness(),
+        "quality_max_glare": app_settings.get_quality_max_glare(),
+        "quality_min_brightness": app_settings.get_quality_min_brightness(),
+        "quality_max_brightness": app_settings.get_quality_max_brightness(),
     }
 
 
@@ -796,51 +1154,53 @@ def list_manual_issues(
     }
 
 
+def _parse_utc(value: Optional[str], default: datetime.datetime) -> datetime.datetime:
+    if not value:
+        return default
+    try:
+        parsed = datetime.datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="صيغة التاريخ غير صحيحة")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+@app.get("/api/admin/telemetry")
+def telemetry_dashboard(
+    request: Request,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    gate_number: Optional[int] = None,
+    path: str = "match",
+    stage: str = "request",
+):
+    _require_admin(request)
+    now = datetime.datetime.utcnow()
+    end = _parse_utc(until, now)
+    start = _parse_utc(since, end - datetime.timedelta(hours=24))
+    if start >= end:
+        raise HTTPException(status_code=400, detail="بداية الفترة يجب أن تكون قبل نهايتها")
+    if path not in {"match", "registration"}:
+        raise HTTPException(status_code=400, detail="مسار غير معروف")
+    return telemetry.dashboard(start, end, gate_number=gate_number, path=path, stage=stage)
+
+
 @app.get("/api/admin/stream")
-def admin_stream(request: Request, cursor_ts: Optional[str] = None, cursor_id: Optional[int] = None):
+async def admin_stream(request: Request, cursor_ts: Optional[str] = None, cursor_id: Optional[int] = None):
     _require_admin(request)
     try:
         cursor_id_value = int(cursor_id or 0)
     except Exception:
         cursor_id_value = 0
-    cursor_ts_value = (cursor_ts or "").strip() or "1970-01-01T00:00:00"
-
-    def _event(name: str, payload: dict) -> str:
-        data = json.dumps(payload, ensure_ascii=False)
-        return f"event: {name}\ndata: {data}\n\n"
+    cursor_ts_value = (cursor_ts or "").strip() or None
 
-    def _stream():
-        nonlocal cursor_ts_value, cursor_id_value
-        while True:
-            try:
-                changes = db.get_people_updated_since(cursor_ts_value, cursor_id_value, limit=500)
-                if changes:
-                    last = changes[-1]
-                    cursor_ts_value = last.get("updated_at") or cursor_ts_value
-                    cursor_id_value = last.get("id") or cursor_id_value
-                    yield _event(
-                        "changed",
-                        {
-                            "count": len(changes),
-                            "cursor_ts": cursor_ts_value,
-                            "cursor_id": cursor_id_value,
-                        },
-                    )
-                else:
-                    yield _event(
-                        "heartbeat",
-                        {"time": datetime.datetime.utcnow().isoformat() + "Z"},
-                    )
-                time.sleep(SSE_POLL_INTERVAL_SEC)
-            except GeneratorExit:
-                break
-            except Exception as exc:
-                print(f"[SSE] Stream error: {exc}")
-                yield _event(
-                    "heartbeat",
-                    {"time": datetime.datetime.utcnow().isoformat() + "Z"},
-                )
-                time.sleep(SSE_POLL_INTERVAL_SEC)
+    async def _stream():
+        async for event in change_stream.events(cursor_ts_value, cursor_id_value):
+            payload = dict(event)
+            name = payload.pop("name")
+            data = json.dumps(payload, ensure_ascii=False)
+            yield f"event: {name}\ndata: {data}\n\n"
 
     headers = {
         "Cache-Control": "no-cache",
@@ -849,6 +1209,45 @@ def admin_stream(request: Request, cursor_ts: Optional[str] = None, cursor_id: O
     return StreamingResponse(_stream(), media_type="text/event-stream", headers=headers)
 
 
+@app.get("/metrics")
+def metrics_endpoint(request: Request):
+    token = os.getenv("METRICS_TOKEN", "").strip()
+    if token and request.headers.get("authorization", "") != f"Bearer {token}":
+        raise HTTPException(status_code=401, detail="غير مصرح")
+    gauges = []
+    depth = rq_queue.queue_depth()
+    if depth is not None:
+        gauges.append(("gates_queue_depth", "Registration jobs waiting in the RQ queue.", {}, depth))
+    gauges.append(("gates_face_index_size", "Embeddings loaded in this worker's face index.", {}, face_match.index_size()))
+    loaded = {**models_loaded(), "face": face_match.model_loaded()}
+    for name, state in loaded.items():
+        gauges.append(("gates_model_loaded", "1 when the model is loaded in this worker.", {"model": name}, int(state)))
+    gauges.append(("gates_inference_inflight", "Scans admitted to this worker's inference executor.", {}, inference.inflight()))
+    gauges.append(("gates_inference_capacity", "Inference workers plus admission queue slots.", {}, inference.CAPACITY))
+    for mode, count in idempotency.stats().items():
+        gauges.append(("gates_idempotency", "Idempotency cache counters for this worker.", {"kind": mode}, count))
+    writer = media_writer.stats()
+    for kind in ("queued", "capacity", "written", "inline", "errors", "batches"):
+        gauges.append(("gates_media_writer", "Write-behind media writer counters.", {"kind": kind}, writer[kind]))
+    gauges.append(("gates_media_writer_lag_ms", "Enqueue-to-fsync lag of the last media batch.", {}, writer["lag_ms"]))
+    gauges.append(("gates_media_writer_lag_max_ms", "Worst enqueue-to-fsync media lag seen.", {}, writer["lag_max_ms"]))
+    pool = db.pool_stats()
+    if pool["backend"] == "postgres":
+        for kind in ("size", "in_use", "idle", "opened", "discarded", "timeouts", "acquired"):
+            gauges.append(("gates_db_pool", "PostgreSQL connection pool state for this worker.", {"kind": kind}, pool[kind]))
+        gauges.append(("gates_db_pool_utilization", "Share of pool connections checked out.", {}, pool["utilization"]))
+        gauges.append(("gates_db_pool_wait_ms_total", "Total time spent waiting for a pooled connection.", {}, pool["wait_ms_total"]))
+        gauges.append(("gates_db_pool_wait_ms_max", "Longest wait for a pooled connection.", {}, pool["wait_ms_max"]))
+    else:
+        gauges.append(("gates_db_sqlite_connections", "Per-thread SQLite connections opened by this worker.", {}, pool["opened"]))
+    for kind, count in rate_limit.stats().items():
+        gauges.append(("gates_rate_limit", "Rate limiter decisions and fallback usage in this worker.", {"kind": kind}, count))
+    for kind, count in change_stream.stats().items():
+        gauges.append(("gates_admin_stream", "Admin change stream hub state in this worker.", {"kind": kind}, count))
+    gauges.append(("gates_worker_pid", "PID of the worker that served this scrape.", {}, os.getpid()))
+    return PlainTextResponse(metrics.render(gauges), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/api/health")
 def health_check():
     return {"status": "ok", "time": datetime.datetime.utcnow().isoformat() + "Z"}
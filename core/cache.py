@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import os
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Optional, Tuple
+
+try:
+    from redis import Redis
+except Exception:  # pragma: no cover - optional in dev
+    Redis = None
+
+REDIS_RETRY_SEC = float(os.getenv("REDIS_RETRY_SEC", "30"))
+REDIS_SOCKET_TIMEOUT_SEC = float(os.getenv("REDIS_SOCKET_TIMEOUT_SEC", "0.5"))
+
+_redis_lock = Lock()
+_redis_client: Optional[Any] = None
+_redis_down_until = 0.0
+
+
+def redis_url() -> str:
+    return os.getenv("REDIS_URL", "").strip()
+
+
+def redis_client():
+    global _redis_client
+    if Redis is None or not redis_url():
+        return None
+    if time.monotonic() < _redis_down_until:
+        return None
+    if _redis_client is not None:
+        return _redis_client
+    with _redis_lock:
+        if _redis_client is None:
+            _redis_client = Redis.from_url(
+                redis_url(),
+                socket_timeout=REDIS_SOCKET_TIMEOUT_SEC,
+                socket_connect_timeout=REDIS_SOCKET_TIMEOUT_SEC,
+            )
+        return _redis_client
+
+
+def mark_redis_down(exc: Exception) -> None:
+    global _redis_down_until
+    if time.monotonic() >= _redis_down_until:
+        print(f"[REDIS] Unavailable, using in-process fallback for {REDIS_RETRY_SEC:.0f}s: {exc}")
+    _redis_down_until = time.monotonic() + REDIS_RETRY_SEC
+
+
+class TTLCache:
+    def __init__(self, max_items: int, ttl_sec: float) -> None:
+        self.max_items = max(1, int(max_items))
+        self.ttl_sec = float(ttl_sec)
+        self._items: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < now:
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl_sec: Optional[float] = None) -> None:
+        expires_at = time.monotonic() + (self.ttl_sec if ttl_sec is None else ttl_sec)
+        with self._lock:
+            self._items[key] = (expires_at, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def pop(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._items.pop(key, None)
+        return item[1] if item else None
+
+    def __len__(self) -> int:
+        return len(self._items)
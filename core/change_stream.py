@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import asyncio
+import datetime
+import os
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional, Set
+
+from core import cache
+from core import db
+
+try:
+    from redis import asyncio as redis_asyncio
+except Exception:  # pragma: no cover - optional in dev
+    redis_asyncio = None
+
+SSE_POLL_INTERVAL_SEC = float(os.getenv("SSE_POLL_INTERVAL_SEC", "2"))
+SSE_RESYNC_SEC = float(os.getenv("SSE_RESYNC_SEC", "30"))
+SSE_HEARTBEAT_SEC = float(os.getenv("SSE_HEARTBEAT_SEC", "5"))
+SSE_DEBOUNCE_SEC = float(os.getenv("SSE_DEBOUNCE_SEC", "0.25"))
+SSE_SUBSCRIBER_QUEUE = max(1, int(os.getenv("SSE_SUBSCRIBER_QUEUE", "8")))
+SSE_BATCH = 500
+
+Event = Dict[str, Any]
+
+_subscribers: Set["asyncio.Queue[Event]"] = set()
+_ready: Optional[asyncio.Event] = None
+_task: Optional["asyncio.Task[None]"] = None
+_redis: Any = None
+_cursor: Dict[str, Any] = {"cursor_ts": None, "cursor_id": 0}
+_stats = {"broadcasts": 0, "polls": 0, "wakeups": 0, "dropped": 0}
+
+
+def _iso(value: Any) -> Optional[str]:
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return str(value) if value else None
+
+
+def _publish(event: Event) -> None:
+    for queue in list(_subscribers):
+        if queue.full():
+            # A slow tab only needs the newest cursor; older events carry nothing it still needs.
+            try:
+                queue.get_nowait()
+                _stats["dropped"] += 1
+            except asyncio.QueueEmpty:
+                pass
+        queue.put_nowait(event)
+
+
+async def _poll() -> None:
+    _stats["polls"] += 1
+    count = 0
+    cursor_ts, cursor_id = _cursor["cursor_ts"], _cursor["cursor_id"]
+    if cursor_ts is None:
+        # Empty table or a failed start: take the head instead of paging the whole table from the epoch.
+        head_ts, head_id = await asyncio.to_thread(db.get_people_cursor)
+        if head_ts:
+            _cursor.update(cursor_ts=_iso(head_ts), cursor_id=head_id)
+            _stats["broadcasts"] += 1
+            _publish({"name": "changed", "count": None, **_cursor})
+        return
+    while True:
+        changes = await asyncio.to_thread(db.get_people_updated_since, cursor_ts, cursor_id, SSE_BATCH)
+        if not changes:
+            break
+        count += len(changes)
+        last = changes[-1]
+        cursor_ts = _iso(last.get("updated_at")) or cursor_ts
+        cursor_id = last.get("id") or cursor_id
+        if len(changes) < SSE_BATCH:
+            break
+    if count:
+        _cursor.update(cursor_ts=cursor_ts, cursor_id=cursor_id)
+        _stats["broadcasts"] += 1
+        _publish({"name": "changed", "count": count, "cursor_ts": cursor_ts, "cursor_id": cursor_id})
+
+
+async def _open_listener() -> Any:
+    global _redis
+    if redis_asyncio is None or cache.redis_client() is None:
+        return None
+    if _redis is None:
+        _redis = redis_asyncio.Redis.from_url(cache.redis_url(), socket_connect_timeout=cache.REDIS_SOCKET_TIMEOUT_SEC)
+    pubsub = _redis.pubsub(ignore_subscribe_messages=True)
+    try:
+        await pubsub.subscribe(db.PEOPLE_CHANNEL)
+    except Exception as exc:
+        cache.mark_redis_down(exc)
+        await _close_listener(pubsub)
+        return None
+    return pubsub
+
+
+async def _close_listener(pubsub: Any) -> None:
+    if pubsub is None:
+        return
+    try:
+        await (getattr(pubsub, "aclose", None) or pubsub.close)()
+    except Exception:
+        pass
+
+
+async def _wait_for_change(pubsub: Any) -> Any:
+    if pubsub is None:
+        await asyncio.sleep(SSE_POLL_INTERVAL_SEC)
+        return None
+    try:
+        message = await pubsub.get_message(timeout=SSE_RESYNC_SEC)
+        if message is not None:
+            _stats["wakeups"] += 1
+            # Let a burst of writes from one scan settle into a single query.
+            await asyncio.sleep(SSE_DEBOUNCE_SEC)
+            while await pubsub.get_message(timeout=0):
+                pass
+        return pubsub
+    except Exception as exc:
+        cache.mark_redis_down(exc)
+        await _close_listener(pubsub)
+        return None
+
+
+async def _run(ready: asyncio.Event) -> None:
+    # One loop per worker, alive only while a tab is connected: a single query per change, none while idle.
+    global _task
+    pubsub = None
+    try:
+        try:
+            cursor_ts, cursor_id = await asyncio.to_thread(db.get_people_cursor)
+            _cursor.update(cursor_ts=_iso(cursor_ts), cursor_id=cursor_id)
+        except Exception as exc:
+            print(f"[SSE] Cursor load failed: {exc}")
+        ready.set()
+        while _subscribers:
+            if pubsub is None:
+                pubsub = await _open_listener()
+            pubsub = await _wait_for_change(pubsub)
+            if not _subscribers:
+                break
+            try:
+                await _poll()
+            except Exception as exc:
+                print(f"[SSE] Poll failed: {exc}")
+    finally:
+        # Detach before awaiting the close so a tab arriving meanwhile starts a fresh loop.
+        if _task is asyncio.current_task():
+            _task = None
+        ready.set()
+        await _close_listener(pubsub)
+
+
+def _ensure_running() -> asyncio.Event:
+    global _task, _ready
+    if _task is None or _task.done():
+        _ready = asyncio.Event()
+        _task = asyncio.get_running_loop().create_task(_run(_ready))
+    return _ready
+
+
+@asynccontextmanager
+async def subscribe(cursor_ts: Optional[str], cursor_id: int) -> AsyncIterator["asyncio.Queue[Event]"]:
+    queue: "asyncio.Queue[Event]" = asyncio.Queue(maxsize=SSE_SUBSCRIBER_QUEUE)
+    _subscribers.add(queue)
+    try:
+        await _ensure_running().wait()
+        head_ts, head_id = _cursor["cursor_ts"], _cursor["cursor_id"]
+        if head_ts and (cursor_ts != head_ts or cursor_id != head_id):
+            # The tab missed changes while it was disconnected; one refresh brings it to the shared cursor.
+            queue.put_nowait({"name": "changed", "count": None, "cursor_ts": head_ts, "cursor_id": head_id})
+        yield queue
+    finally:
+        _subscribers.discard(queue)
+
+
+async def events(cursor_ts: Optional[str], cursor_id: int) -> AsyncIterator[Event]:
+    async with subscribe(cursor_ts, cursor_id) as queue:
+        while True:
+            try:
+                yield await asyncio.wait_for(queue.get(), timeout=SSE_HEARTBEAT_SEC)
+            except asyncio.TimeoutError:
+                yield {"name": "heartbeat", "time": datetime.datetime.utcnow().isoformat() + "Z"}
+
+
+def stats() -> Dict[str, int]:
+    return {**_stats, "subscribers": len(_subscribers), "running": int(_task is not None and not _task.done())}
@@ -4,8 +4,12 @@ import datetime
 import os
 import re
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Sequence, Tuple
+from threading import BoundedSemaphore, Lock
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
 
 try:
     import psycopg2
@@ -13,8 +17,11 @@ try:
 except Exception:  # pragma: no cover - optional in dev
     psycopg2 = None
 
+from core import cache
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 PG_SCHEMA_ENV = os.getenv("PG_SCHEMA", "gates")
+PEOPLE_CHANNEL = "gates:people:changed"
 
 
 def _detect_backend() -> str:
@@ -75,6 +82,7 @@ def _ensure_pg_schema(conn) -> None:
             cur.execute(f"SET search_path TO {schema}")
     except Exception:
         try:
+            conn.rollback()
             with conn.cursor() as cur:
                 cur.execute("SET search_path TO public")
         except Exception:
@@ -82,6 +90,15 @@ def _ensure_pg_schema(conn) -> None:
 
 
 DB_PATH = _sqlite_path()
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_POOL_TIMEOUT_SEC = float(os.getenv("DB_POOL_TIMEOUT_SEC", "10"))
+SQLITE_BUSY_TIMEOUT_SEC = float(os.getenv("SQLITE_BUSY_TIMEOUT_SEC", "5"))
+SQLITE_MMAP_BYTES = int(os.getenv("SQLITE_MMAP_BYTES", str(256 * 1024 * 1024)))
+SQLITE_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+PERSON_COLUMNS = (
+    "id, national_id, full_name, blocked, block_reason, visits, created_at, "
+    "last_seen_at, updated_at, gate_number, photo_path, card_path"
+)
 
 
 def _sql(query: str) -> str:
@@ -90,18 +107,149 @@ def _sql(query: str) -> str:
     return query
 
 
-def get_connection():
-    if DB_BACKEND == "postgres":
-        if psycopg2 is None:
-            raise RuntimeError("psycopg2 غير مثبت")
+class _PgPool:
+    def __init__(self, size: int) -> None:
+        self.size = max(1, size)
+        self._slots = BoundedSemaphore(self.size)
+        self._lock = Lock()
+        self._idle: List[Any] = []
+        self.in_use = 0
+        self.stats = {"acquired": 0, "opened": 0, "discarded": 0, "timeouts": 0, "wait_ms_total": 0.0, "wait_ms_max": 0.0}
+
+    def _open(self):
         conn = psycopg2.connect(_pg_dsn(), cursor_factory=psycopg2.extras.RealDictCursor)
         _ensure_pg_schema(conn)
+        # Commit so a later rollback on this connection cannot undo SET search_path.
+        conn.commit()
+        with self._lock:
+            self.stats["opened"] += 1
+        return conn
+
+    def acquire(self):
+        started = time.perf_counter()
+        if not self._slots.acquire(timeout=DB_POOL_TIMEOUT_SEC):
+            with self._lock:
+                self.stats["timeouts"] += 1
+            raise RuntimeError("انتهت مهلة انتظار اتصال قاعدة البيانات")
+        waited_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self.in_use += 1
+            self.stats["acquired"] += 1
+            self.stats["wait_ms_total"] += waited_ms
+            self.stats["wait_ms_max"] = max(self.stats["wait_ms_max"], waited_ms)
+            conn = self._idle.pop() if self._idle else None
+        try:
+            if conn is None or conn.closed:
+                conn = self._open()
+        except Exception:
+            self._give_back(None)
+            raise
+        return conn
+
+    def _give_back(self, conn) -> None:
+        with self._lock:
+            self.in_use -= 1
+            if conn is not None:
+                self._idle.append(conn)
+        self._slots.release()
+
+    def release(self, conn, broken: bool = False) -> None:
+        if broken or conn.closed:
+            with self._lock:
+                self.stats["discarded"] += 1
+            try:
+                conn.close()
+            except Exception:
+                pass
+            conn = None
+        self._give_back(conn)
+
+
+_pool_lock = Lock()
+_pg_pool: Optional[_PgPool] = None
+_pool_pid: Optional[int] = None
+_sqlite_local = threading.local()
+_sqlite_opened = 0
+# Handles inherited across fork (RQ work-horse): closing them would end the parent's sessions.
+_inherited: List[Any] = []
+
+
+def _get_pg_pool() -> _PgPool:
+    global _pg_pool, _pool_pid
+    pid = os.getpid()
+    if _pg_pool is not None and _pool_pid == pid:
+        return _pg_pool
+    with _pool_lock:
+        if _pg_pool is None or _pool_pid != pid:
+            if _pg_pool is not None:
+                _inherited.append(_pg_pool)
+            _pg_pool = _PgPool(DB_POOL_SIZE)
+            _pool_pid = pid
+        return _pg_pool
+
+
+def _sqlite_connection() -> sqlite3.Connection:
+    global _sqlite_opened
+    conn = getattr(_sqlite_local, "conn", None)
+    if conn is not None and getattr(_sqlite_local, "pid", None) == os.getpid():
         return conn
-    conn = sqlite3.connect(DB_PATH)
+    if conn is not None:
+        _inherited.append(conn)
+    conn = sqlite3.connect(DB_PATH, timeout=SQLITE_BUSY_TIMEOUT_SEC)
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA mmap_size={int(SQLITE_MMAP_BYTES)}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    _sqlite_local.conn = conn
+    _sqlite_local.pid = os.getpid()
+    with _pool_lock:
+        _sqlite_opened += 1
     return conn
 
 
+@contextmanager
+def get_connection() -> Iterator[Any]:
+    if DB_BACKEND == "postgres":
+        if psycopg2 is None:
+            raise RuntimeError("psycopg2 غير مثبت")
+        pool = _get_pg_pool()
+        conn = pool.acquire()
+        broken = False
+        try:
+            yield conn
+            conn.commit()
+        except Exception as exc:
+            broken = isinstance(exc, (psycopg2.OperationalError, psycopg2.InterfaceError))
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+            raise
+        finally:
+            pool.release(conn, broken)
+        return
+    conn = _sqlite_connection()
+    with conn:
+        yield conn
+
+
+def pool_stats() -> Dict[str, Any]:
+    if DB_BACKEND != "postgres":
+        with _pool_lock:
+            return {"backend": "sqlite", "opened": _sqlite_opened}
+    pool = _get_pg_pool()
+    with pool._lock:
+        return {
+            "backend": "postgres",
+            "size": pool.size,
+            "in_use": pool.in_use,
+            "idle": len(pool._idle),
+            "utilization": round(pool.in_use / pool.size, 3),
+            **pool.stats,
+        }
+
+
 def _execute(query: str, params: Sequence[Any] = ()) -> int:
     with get_connection() as conn:
         cur = conn.cursor()
@@ -201,6 +349,10 @@ def _init_db_sqlite() -> None:
             "INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)",
             ("docai_grayscale", "0"),
         )
+        conn.execute(
+            "INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)",
+            ("docai_mosaic", "0"),
+        )
         conn.execute(
             "INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)",
             ("face_match_enabled", "1"),
@@ -217,6 +369,58 @@ def _init_db_sqlite() -> None:
             "INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)",
             ("docai_jpeg_quality", "85"),
         )
+        conn.execute(
+            "INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)",
+            ("quality_gate_enabled", "0"),
+        )
+        conn.execute(
+            "INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)",
+            ("quality_min_sharpness", "25"),
+        )
+        conn.execute(
+            "INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)",
+            ("quality_max_glare", "0.25"),
+        )
+        conn.execute(
+            "INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)",
+            ("quality_min_brightness", "35"),
+        )
+        conn.execute(
+            "INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)",
+            ("quality_max_brightness", "225"),
+        )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS scan_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at TEXT NOT NULL,
+                gate_number INTEGER,
+                path TEXT NOT NULL,
+                outcome TEXT NOT NULL,
+                match_score REAL,
+                image_bytes INTEGER,
+                image_width INTEGER,
+                image_height INTEGER,
+                total_ms REAL,
+                timings TEXT
+            );
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_scan_events_created ON scan_events(created_at);")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS scan_stage_hist (
+                bucket_start TEXT NOT NULL,
+                path TEXT NOT NULL,
+                gate_number INTEGER NOT NULL DEFAULT 0,
+                stage TEXT NOT NULL,
+                le_idx INTEGER NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0,
+                sum_ms REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (bucket_start, path, gate_number, stage, le_idx)
+            );
+            """
+        )
         _ensure_updated_at_sqlite(conn)
         _ensure_gate_number_sqlite(conn)
 
@@ -255,6 +459,10 @@ def _init_db_postgres() -> None:
         "INSERT INTO settings (key, value) VALUES (%s, %s) ON CONFLICT (key) DO NOTHING",
         ("docai_grayscale", "0"),
     )
+    _execute(
+        "INSERT INTO settings (key, value) VALUES (%s, %s) ON CONFLICT (key) DO NOTHING",
+        ("docai_mosaic", "0"),
+    )
     _execute(
         "INSERT INTO settings (key, value) VALUES (%s, %s) ON CONFLICT (key) DO NOTHING",
         ("face_match_enabled", "1"),
@@ -271,6 +479,58 @@ def _init_db_postgres() -> None:
         "INSERT INTO settings (key, value) VALUES (%s, %s) ON CONFLICT (key) DO NOTHING",
         ("docai_jpeg_quality", "85"),
     )
+    _execute(
+        "INSERT INTO settings (key, value) VALUES (%s, %s) ON CONFLICT (key) DO NOTHING",
+        ("quality_gate_enabled", "0"),
+    )
+    _execute(
+        "INSERT INTO settings (key, value) VALUES (%s, %s) ON CONFLICT (key) DO NOTHING",
+        ("quality_min_sharpness", "25"),
+    )
+    _execute(
+        "INSERT INTO settings (key, value) VALUES (%s, %s) ON CONFLICT (key) DO NOTHING",
+        ("quality_max_glare", "0.25"),
+    )
+    _execute(
+        "INSERT INTO settings (key, value) VALUES (%s, %s) ON CONFLICT (key) DO NOTHING",
+        ("quality_min_brightness", "35"),
+    )
+    _execute(
+        "INSERT INTO settings (key, value) VALUES (%s, %s) ON CONFLICT (key) DO NOTHING",
+        ("quality_max_brightness", "225"),
+    )
+    _execute(
+        """
+        CREATE TABLE IF NOT EXISTS scan_events (
+            id BIGSERIAL PRIMARY KEY,
+            created_at TIMESTAMP NOT NULL,
+            gate_number INTEGER,
+            path TEXT NOT NULL,
+            outcome TEXT NOT NULL,
+            match_score REAL,
+            image_bytes INTEGER,
+            image_width INTEGER,
+            image_height INTEGER,
+            total_ms REAL,
+            timings TEXT
+        );
+        """
+    )
+    _execute("CREATE INDEX IF NOT EXISTS idx_scan_events_created ON scan_events(created_at);")
+    _execute(
+        """
+        CREATE TABLE IF NOT EXISTS scan_stage_hist (
+            bucket_start TEXT NOT NULL,
+            path TEXT NOT NULL,
+            gate_number INTEGER NOT NULL DEFAULT 0,
+            stage TEXT NOT NULL,
+            le_idx INTEGER NOT NULL,
+            hits BIGINT NOT NULL DEFAULT 0,
+            sum_ms DOUBLE PRECISION NOT NULL DEFAULT 0,
+            PRIMARY KEY (bucket_start, path, gate_number, stage, le_idx)
+        );
+        """
+    )
     _ensure_updated_at_postgres()
     _ensure_gate_number_postgres()
 
@@ -336,6 +596,50 @@ def get_face_embedding(national_id: str) -> Optional[bytes]:
     return _row_value(row, "face_embedding")
 
 
+def _publish_change() -> None:
+    # Wakes the admin change stream in every web worker; a missed message is caught by its resync poll.
+    client = cache.redis_client()
+    if client is None:
+        return
+    try:
+        client.publish(PEOPLE_CHANNEL, "1")
+    except Exception as exc:
+        cache.mark_redis_down(exc)
+
+
+def _write_person(
+    query: str,
+    params: Sequence[Any],
+    national_id: str,
+    fetch: bool = True,
+    conditional: bool = False,
+) -> Optional[Dict[str, Any]]:
+    if not fetch:
+        with get_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(_sql(query), params)
+            changed = getattr(cur, "rowcount", 0) or 0
+        if changed:
+            _publish_change()
+        return None
+    if DB_BACKEND == "postgres" or SQLITE_RETURNING:
+        row = _fetchone(f"{query} RETURNING {PERSON_COLUMNS}", params)
+        changed = row is not None
+    else:
+        with get_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(_sql(query), params)
+            changed = getattr(cur, "rowcount", 0) or 0
+            cur.execute(_sql(f"SELECT {PERSON_COLUMNS} FROM people WHERE national_id = %s"), (national_id,))
+            row = cur.fetchone()
+    if changed:
+        _publish_change()
+    if row is None and conditional:
+        # The WHERE guard skipped the write; the caller still expects the current row.
+        return get_person_by_nid(national_id)
+    return _row_to_dict(row) if row else None
+
+
 def add_person(
     national_id: str,
     full_name: str,
@@ -343,10 +647,10 @@ def add_person(
     card_path: Optional[str] = None,
     face_embedding: Optional[bytes] = None,
     gate_number: Optional[int] = None,
-) -> Dict[str, Any]:
+    fetch: bool = True,
+) -> Optional[Dict[str, Any]]:
     now = _utcnow()
-    _execute(
-        """
+    query = """
         INSERT INTO people (
             national_id,
             full_name,
@@ -362,63 +666,103 @@ def add_person(
             face_embedding
         )
         VALUES (%s, %s, %s, NULL, 1, %s, %s, %s, %s, %s, %s, %s)
-        """,
+        """
+    if DB_BACKEND == "postgres":
+        query += " ON CONFLICT (national_id) DO NOTHING"
+    return _write_person(
+        query,
         (national_id, full_name, False, now, now, now, gate_number, photo_path, card_path, face_embedding),
+        national_id,
+        fetch=fetch,
+        conditional=True,
     )
-    return get_person_by_nid(national_id)  # type: ignore[return-value]
 
 
-def increment_visit(national_id: str) -> Optional[Dict[str, Any]]:
+def increment_visit(national_id: str, fetch: bool = True) -> Optional[Dict[str, Any]]:
     now = _utcnow()
-    _execute(
+    return _write_person(
         "UPDATE people SET visits = visits + 1, last_seen_at = %s, updated_at = %s WHERE national_id = %s",
         (now, now, national_id),
+        national_id,
+        fetch=fetch,
     )
-    return get_person_by_nid(national_id)
 
 
-def update_name_if_missing(national_id: str, full_name: str) -> Optional[Dict[str, Any]]:
-    if not full_name:
-        return get_person_by_nid(national_id)
+def record_visit(
+    national_id: str,
+    photo_path: Optional[str] = None,
+    card_path: Optional[str] = None,
+    face_embedding: Optional[bytes] = None,
+    gate_number: Optional[int] = None,
+    full_name: Optional[str] = None,
+    fetch: bool = True,
+) -> Optional[Dict[str, Any]]:
     now = _utcnow()
-    _execute(
-        "UPDATE people SET full_name = COALESCE(NULLIF(full_name, ''), %s), updated_at = %s WHERE national_id = %s",
-        (full_name, now, national_id),
+    return _write_person(
+        """
+        UPDATE people SET
+            visits = visits + 1,
+            last_seen_at = %s,
+            updated_at = %s,
+            full_name = COALESCE(NULLIF(full_name, ''), %s, full_name),
+            gate_number = COALESCE(gate_number, %s),
+            photo_path = COALESCE(%s, photo_path),
+            card_path = COALESCE(%s, card_path),
+            face_embedding = COALESCE(%s, face_embedding)
+        WHERE national_id = %s
+        """,
+        (
+            now,
+            now,
+            full_name or None,
+            gate_number,
+            photo_path or None,
+            card_path or None,
+            face_embedding,
+            national_id,
+        ),
+        national_id,
+        fetch=fetch,
     )
-    return get_person_by_nid(national_id)
 
 
-def update_photo_if_missing(national_id: str, photo_path: Optional[str]) -> Optional[Dict[str, Any]]:
-    if not photo_path:
-        return get_person_by_nid(national_id)
-    now = _utcnow()
-    _execute(
-        "UPDATE people SET photo_path = COALESCE(NULLIF(photo_path, ''), %s), updated_at = %s WHERE national_id = %s",
-        (photo_path, now, national_id),
+def _fill_if_missing(national_id: str, column: str, value: Any, fetch: bool) -> Optional[Dict[str, Any]]:
+    if not value:
+        return get_person_by_nid(national_id) if fetch else None
+    return _write_person(
+        f"UPDATE people SET {column} = COALESCE(NULLIF({column}, ''), %s), updated_at = %s WHERE national_id = %s",
+        (value, _utcnow(), national_id),
+        national_id,
+        fetch=fetch,
     )
-    return get_person_by_nid(national_id)
 
 
-def update_card_if_missing(national_id: str, card_path: Optional[str]) -> Optional[Dict[str, Any]]:
-    if not card_path:
-        return get_person_by_nid(national_id)
-    now = _utcnow()
-    _execute(
-        "UPDATE people SET card_path = COALESCE(NULLIF(card_path, ''), %s), updated_at = %s WHERE national_id = %s",
-        (card_path, now, national_id),
-    )
-    return get_person_by_nid(national_id)
+def update_name_if_missing(national_id: str, full_name: str, fetch: bool = True) -> Optional[Dict[str, Any]]:
+    return _fill_if_missing(national_id, "full_name", full_name, fetch)
+
 
+def update_photo_if_missing(national_id: str, photo_path: Optional[str], fetch: bool = True) -> Optional[Dict[str, Any]]:
+    return _fill_if_missing(national_id, "photo_path", photo_path, fetch)
 
-def update_gate_number_if_missing(national_id: str, gate_number: Optional[int]) -> Optional[Dict[str, Any]]:
+
+def update_card_if_missing(national_id: str, card_path: Optional[str], fetch: bool = True) -> Optional[Dict[str, Any]]:
+    return _fill_if_missing(national_id, "card_path", card_path, fetch)
+
+
+def update_gate_number_if_missing(
+    national_id: str,
+    gate_number: Optional[int],
+    fetch: bool = True,
+) -> Optional[Dict[str, Any]]:
     if gate_number is None:
-        return get_person_by_nid(national_id)
-    now = _utcnow()
-    _execute(
+        return get_person_by_nid(national_id) if fetch else None
+    return _write_person(
         "UPDATE people SET gate_number = %s, updated_at = %s WHERE national_id = %s AND gate_number IS NULL",
-        (gate_number, now, national_id),
+        (gate_number, _utcnow(), national_id),
+        national_id,
+        fetch=fetch,
+        conditional=True,
     )
-    return get_person_by_nid(national_id)
 
 
 def update_media(
@@ -426,6 +770,7 @@ def update_media(
     photo_path: Optional[str] = None,
     card_path: Optional[str] = None,
     face_embedding: Optional[bytes] = None,
+    fetch: bool = True,
 ) -> Optional[Dict[str, Any]]:
     updates = []
     params: List[Any] = []
@@ -439,24 +784,30 @@ def update_media(
         updates.append("face_embedding = %s")
         params.append(face_embedding)
     if not updates:
-        return get_person_by_nid(national_id)
+        return get_person_by_nid(national_id) if fetch else None
     updates.append("updated_at = %s")
     params.append(_utcnow())
     params.append(national_id)
-    _execute(
+    return _write_person(
         f"UPDATE people SET {', '.join(updates)} WHERE national_id = %s",
         params,
+        national_id,
+        fetch=fetch,
     )
-    return get_person_by_nid(national_id)
 
 
-def set_block_status(national_id: str, blocked: bool, reason: Optional[str]) -> Optional[Dict[str, Any]]:
-    now = _utcnow()
-    _execute(
+def set_block_status(
+    national_id: str,
+    blocked: bool,
+    reason: Optional[str],
+    fetch: bool = True,
+) -> Optional[Dict[str, Any]]:
+    return _write_person(
         "UPDATE people SET blocked = %s, block_reason = %s, updated_at = %s WHERE national_id = %s",
-        (bool(blocked), reason, now, national_id),
+        (bool(blocked), reason, _utcnow(), national_id),
+        national_id,
+        fetch=fetch,
     )
-    return get_person_by_nid(national_id)
 
 
 def delete_person(national_id: str) -> bool:
@@ -559,6 +910,21 @@ def get_manual_issues(limit: Optional[int] = 200, offset: int = 0) -> List[Dict[
     return [_row_to_dict(row) for row in rows]
 
 
+def get_people_cursor() -> Tuple[Optional[str], int]:
+    row = _fetchone(
+        """
+        SELECT updated_at, id
+        FROM people
+        WHERE updated_at IS NOT NULL
+        ORDER BY updated_at DESC, id DESC
+        LIMIT 1
+        """
+    )
+    if row is None:
+        return None, 0
+    return _row_value(row, "updated_at"), int(_row_value(row, "id", 0) or 0)
+
+
 def get_people_updated_since(
     cursor_ts: Optional[str],
     cursor_id: int = 0,
@@ -596,6 +962,7 @@ def update_person(
     national_id: str,
     full_name: Optional[str] = None,
     new_national_id: Optional[str] = None,
+    fetch: bool = True,
 ) -> Optional[Dict[str, Any]]:
     updates = []
     params: List[Any] = []
@@ -606,14 +973,16 @@ def update_person(
         updates.append("national_id = %s")
         params.append(new_national_id.strip())
     if not updates:
-        return get_person_by_nid(national_id)
+        return get_person_by_nid(national_id) if fetch else None
     updates.append("updated_at = %s")
     params.append(_utcnow())
     params.append(national_id)
     try:
-        _execute(
+        return _write_person(
             f"UPDATE people SET {', '.join(updates)} WHERE national_id = %s",
             params,
+            (new_national_id or "").strip() or national_id,
+            fetch=fetch,
         )
     except Exception as exc:
         if DB_BACKEND == "postgres" and getattr(exc, "pgcode", "") == "23505":
@@ -621,7 +990,6 @@ def update_person(
         if isinstance(exc, sqlite3.IntegrityError):
             raise ValueError("duplicate_nid") from exc
         raise
-    return get_person_by_nid(new_national_id or national_id)
 
 
 def get_people_with_embeddings(limit: int = 10000) -> List[Dict[str, Any]]:
@@ -643,6 +1011,11 @@ def get_people_with_embeddings(limit: int = 10000) -> List[Dict[str, Any]]:
     return results
 
 
+def get_all_settings() -> Dict[str, str]:
+    rows = _fetchall("SELECT key, value FROM settings")
+    return {_row_value(row, "key"): _row_value(row, "value") for row in rows}
+
+
 def get_setting(key: str, default: Optional[str] = None) -> Optional[str]:
     row = _fetchone("SELECT value FROM settings WHERE key = %s", (key,))
     return _row_value(row, "value", default)
@@ -657,3 +1030,179 @@ def set_setting(key: str, value: str) -> None:
         """,
         (key, value),
     )
+
+
+def insert_scan_telemetry(
+    events: List[Tuple[Any, ...]],
+    buckets: List[Tuple[Any, ...]],
+) -> None:
+    with get_connection() as conn:
+        cur = conn.cursor()
+        if events:
+            cur.executemany(
+                _sql(
+                    """
+                    INSERT INTO scan_events (
+                        created_at, gate_number, path, outcome, match_score,
+                        image_bytes, image_width, image_height, total_ms, timings
+                    )
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    """
+                ),
+                events,
+            )
+        if buckets:
+            cur.executemany(
+                _sql(
+                    """
+                    INSERT INTO scan_stage_hist (bucket_start, path, gate_number, stage, le_idx, hits, sum_ms)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                    ON CONFLICT (bucket_start, path, gate_number, stage, le_idx) DO UPDATE SET
+                        hits = scan_stage_hist.hits + excluded.hits,
+                        sum_ms = scan_stage_hist.sum_ms + excluded.sum_ms
+                    """
+                ),
+                buckets,
+            )
+
+
+def purge_scan_events(before: str) -> int:
+    return _execute("DELETE FROM scan_events WHERE created_at < %s", (before,))
+
+
+def get_scan_stage_histogram(
+    since: str,
+    until: str,
+    path: str = "match",
+    gate_number: Optional[int] = None,
+    by_gate: bool = False,
+    stage: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    clauses = ["path = %s", "bucket_start >= %s", "bucket_start < %s"]
+    params: List[Any] = [path, since, until]
+    if gate_number is not None:
+        clauses.append("gate_number = %s")
+        params.append(gate_number)
+    if stage:
+        clauses.append("stage = %s")
+        params.append(stage)
+    group = "gate_number, stage, le_idx" if by_gate else "stage, le_idx"
+    rows = _fetchall(
+        f"""
+        SELECT {group}, SUM(hits) AS hits, SUM(sum_ms) AS sum_ms
+        FROM scan_stage_hist
+        WHERE {" AND ".join(clauses)}
+        GROUP BY {group}
+        """,
+        params,
+    )
+    return [
+        {
+            "gate_number": _row_value(row, "gate_number") if by_gate else None,
+            "stage": _row_value(row, "stage"),
+            "le_idx": int(_row_value(row, "le_idx", 0)),
+            "hits": int(_row_value(row, "hits", 0) or 0),
+            "sum_ms": float(_row_value(row, "sum_ms", 0) or 0),
+        }
+        for row in rows
+    ]
+
+
+def get_scan_stage_series(
+    since: str,
+    until: str,
+    stage: str,
+    path: str = "match",
+    gate_number: Optional[int] = None,
+    daily: bool = False,
+) -> List[Dict[str, Any]]:
+    clauses = ["path = %s", "stage = %s", "bucket_start >= %s", "bucket_start < %s"]
+    params: List[Any] = [path, stage, since, until]
+    if gate_number is not None:
+        clauses.append("gate_number = %s")
+        params.append(gate_number)
+    width = 10 if daily else 13
+    rows = _fetchall(
+        f"""
+        SELECT substr(bucket_start, 1, {width}) AS bucket, le_idx, SUM(hits) AS hits
+        FROM scan_stage_hist
+        WHERE {" AND ".join(clauses)}
+        GROUP BY substr(bucket_start, 1, {width}), le_idx
+        ORDER BY bucket
+        """,
+        params,
+    )
+    return [
+        {
+            "bucket": _row_value(row, "bucket"),
+            "le_idx": int(_row_value(row, "le_idx", 0)),
+            "hits": int(_row_value(row, "hits", 0) or 0),
+        }
+        for row in rows
+    ]
+
+
+def get_scan_outcomes(
+    since: str,
+    until: str,
+    path: str = "match",
+    gate_number: Optional[int] = None,
+) -> Dict[str, int]:
+    clauses = ["path = %s", "created_at >= %s", "created_at < %s"]
+    params: List[Any] = [path, since, until]
+    if gate_number is not None:
+        clauses.append("gate_number = %s")
+        params.append(gate_number)
+    rows = _fetchall(
+        f"""
+        SELECT outcome, COUNT(*) AS total
+        FROM scan_events
+        WHERE {" AND ".join(clauses)}
+        GROUP BY outcome
+        """,
+        params,
+    )
+    return {_row_value(row, "outcome"): int(_row_value(row, "total", 0) or 0) for row in rows}
+
+
+def get_scan_events(
+    since: str,
+    until: str,
+    path: str = "match",
+    gate_number: Optional[int] = None,
+    limit: int = 50,
+) -> List[Dict[str, Any]]:
+    clauses = ["path = %s", "created_at >= %s", "created_at < %s"]
+    params: List[Any] = [path, since, until]
+    if gate_number is not None:
+        clauses.append("gate_number = %s")
+        params.append(gate_number)
+    params.append(limit)
+    rows = _fetchall(
+        f"""
+        SELECT created_at, gate_number, outcome, match_score, image_bytes,
+               image_width, image_height, total_ms, timings
+        FROM scan_events
+        WHERE {" AND ".join(clauses)}
+        ORDER BY created_at DESC
+        LIMIT %s
+        """,
+        params,
+    )
+    items = []
+    for row in rows:
+        created_at = _row_value(row, "created_at")
+        items.append(
+            {
+                "created_at": created_at.isoformat() if hasattr(created_at, "isoformat") else created_at,
+                "gate_number": _row_value(row, "gate_number"),
+                "outcome": _row_value(row, "outcome"),
+                "match_score": _row_value(row, "match_score"),
+                "image_bytes": _row_value(row, "image_bytes"),
+                "image_width": _row_value(row, "image_width"),
+                "image_height": _row_value(row, "image_height"),
+                "total_ms": _row_value(row, "total_ms"),
+                "timings": _row_value(row, "timings"),
+            }
+        )
+    return items
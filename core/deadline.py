@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import math
+import os
+from time import monotonic
+from typing import List, Optional
+
+SCAN_DEADLINE_SEC = float(os.getenv("SCAN_DEADLINE_SEC", "10"))
+ROTATION_MIN_BUDGET_SEC = float(os.getenv("ROTATION_MIN_BUDGET_SEC", "2"))
+DOC_AI_MIN_BUDGET_SEC = float(os.getenv("DOC_AI_MIN_BUDGET_SEC", "1.5"))
+FACE_INDEX_MIN_BUDGET_SEC = float(os.getenv("FACE_INDEX_MIN_BUDGET_SEC", "0.5"))
+
+
+class DeadlineExceeded(Exception):
+    def __init__(self, stage: str) -> None:
+        super().__init__("انتهت مهلة المعالجة قبل اكتمال الفحص")
+        self.stage = stage
+        self.code = "deadline_exceeded"
+
+
+class Deadline:
+    def __init__(self, budget_sec: Optional[float]) -> None:
+        self.budget_sec = budget_sec if budget_sec and budget_sec > 0 else None
+        self.expires_at = monotonic() + self.budget_sec if self.budget_sec else None
+        self.degraded: List[str] = []
+
+    def remaining(self) -> float:
+        if self.expires_at is None:
+            return float("inf")
+        return self.expires_at - monotonic()
+
+    def allows(self, needed_sec: float) -> bool:
+        return self.remaining() >= needed_sec
+
+    def degrade(self, stage: str) -> None:
+        if stage not in self.degraded:
+            self.degraded.append(stage)
+            print(f"[DEADLINE] Stage degraded: {stage} remaining={self.remaining():.2f}s")
+
+    def check(self, stage: str) -> None:
+        if self.remaining() <= 0:
+            raise DeadlineExceeded(stage)
+
+
+def request_deadline(header_ms: Optional[str] = None) -> Deadline:
+    budget = SCAN_DEADLINE_SEC
+    if header_ms:
+        try:
+            requested = float(header_ms) / 1000.0
+        except ValueError:
+            requested = 0.0
+        # Only a real, positive budget may tighten the server's; 0, negatives, nan or inf never lift it.
+        if math.isfinite(requested) and requested > 0:
+            budget = min(budget, requested) if budget > 0 else requested
+    return Deadline(budget)
@@ -0,0 +1,286 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import time
+from functools import lru_cache
+from threading import Lock
+from time import perf_counter
+from typing import Any, Dict, Optional, Tuple
+
+from core import cache
+
+try:
+    from google.cloud import documentai
+    from google.api_core import exceptions as api_exceptions
+except Exception:  # pragma: no cover - optional in dev
+    documentai = None
+    api_exceptions = None
+
+DOC_AI_CACHE_ENABLED = os.getenv("DOC_AI_CACHE", "1").strip().lower() in {"1", "true", "yes", "on"}
+DOC_AI_CACHE_TTL_SEC = int(os.getenv("DOC_AI_CACHE_TTL_SEC", str(7 * 24 * 3600)))
+DOC_AI_CACHE_MAX = int(os.getenv("DOC_AI_CACHE_MAX", "5000"))
+_CACHE_PREFIX = "gates:docai:"
+_CACHE_INDEX = f"{_CACHE_PREFIX}index"
+_CACHE_STATS = f"{_CACHE_PREFIX}stats"
+
+_client_lock = Lock()
+_clients: Dict[Tuple[str, bool], Any] = {}
+_result_cache = cache.TTLCache(DOC_AI_CACHE_MAX, DOC_AI_CACHE_TTL_SEC)
+_stats_lock = Lock()
+_stats = {"hits": 0, "misses": 0, "avoided": 0}
+_requests: Dict[str, Dict[str, float]] = {}
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)).strip())
+    except Exception:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)).strip())
+    except Exception:
+        return default
+
+
+def available() -> bool:
+    return documentai is not None
+
+
+def request_timeout() -> float:
+    return max(1.0, _env_float("DOC_AI_TIMEOUT_SEC", 20.0))
+
+
+def endpoint_for(location: str) -> str:
+    override = os.getenv("DOC_AI_ENDPOINT", "").strip()
+    if override:
+        return override
+    return f"{location}-documentai.googleapis.com"
+
+
+def _insecure() -> bool:
+    return os.getenv("DOC_AI_INSECURE", "0").strip().lower() in {"1", "true", "yes", "on"}
+
+
+def _channel_options() -> list:
+    keepalive_ms = _env_int("DOC_AI_KEEPALIVE_MS", 30000)
+    return [
+        ("grpc.max_send_message_length", -1),
+        ("grpc.max_receive_message_length", -1),
+        ("grpc.keepalive_time_ms", keepalive_ms),
+        ("grpc.keepalive_timeout_ms", 10000),
+        ("grpc.keepalive_permit_without_calls", 1),
+        ("grpc.http2.max_pings_without_data", 0),
+    ]
+
+
+def _create_client(endpoint: str, insecure: bool):
+    transport_cls = documentai.DocumentProcessorServiceClient.get_transport_class("grpc")
+    target = endpoint if ":" in endpoint else f"{endpoint}:443"
+    if insecure:
+        # Plain-text channel for a local fake processor (tests, offline dev).
+        import grpc
+
+        channel = grpc.insecure_channel(target, options=_channel_options())
+    else:
+        channel = transport_cls.create_channel(target, options=_channel_options())
+    transport = transport_cls(host=endpoint, channel=channel)
+    print(f"[DOC-AI] Client created: endpoint={endpoint} insecure={insecure}")
+    return documentai.DocumentProcessorServiceClient(transport=transport)
+
+
+def get_client(endpoint: str):
+    key = (endpoint, _insecure())
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _client_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _create_client(*key)
+            _clients[key] = client
+        return client
+
+
+def reset_client(endpoint: str, client: Any) -> None:
+    key = (endpoint, _insecure())
+    with _client_lock:
+        # Another thread may already have replaced the broken client; never drop the healthy one.
+        if _clients.get(key) is not client:
+            return
+        _clients.pop(key, None)
+    try:
+        client.transport.close()
+    except Exception:
+        pass
+
+
+@lru_cache(maxsize=16)
+def processor_path(project_id: str, location: str, processor_id: str, processor_version: str = "") -> str:
+    if processor_version:
+        return documentai.DocumentProcessorServiceClient.processor_version_path(
+            project_id, location, processor_id, processor_version
+        )
+    return documentai.DocumentProcessorServiceClient.processor_path(project_id, location, processor_id)
+
+
+def _is_unavailable(exc: Exception) -> bool:
+    return api_exceptions is not None and isinstance(exc, api_exceptions.ServiceUnavailable)
+
+
+def _is_deadline(exc: Exception) -> bool:
+    return api_exceptions is not None and isinstance(exc, api_exceptions.DeadlineExceeded)
+
+
+def process_document(
+    settings: Dict[str, str],
+    content: bytes,
+    mime_type: str = "image/jpeg",
+    timeout: Optional[float] = None,
+):
+    endpoint = endpoint_for(settings["location"])
+    name = processor_path(
+        settings["project_id"],
+        settings["location"],
+        settings["processor_id"],
+        settings.get("processor_version", ""),
+    )
+    request = documentai.ProcessRequest(
+        name=name,
+        raw_document=documentai.RawDocument(content=content, mime_type=mime_type),
+        skip_human_review=True,
+    )
+    budget = timeout if timeout is not None else request_timeout()
+    started = perf_counter()
+    attempt = 0
+    while True:
+        attempt += 1
+        client = get_client(endpoint)
+        remaining = budget - (perf_counter() - started)
+        try:
+            return client.process_document(request=request, timeout=max(remaining, 0.5), retry=None)
+        except Exception as exc:
+            if not (_is_unavailable(exc) or _is_deadline(exc)):
+                raise
+            # The channel is broken or wedged: drop it so the next call gets a fresh one.
+            reset_client(endpoint, client)
+            remaining = budget - (perf_counter() - started)
+            if attempt >= 2 or not _is_unavailable(exc) or remaining < 1.0:
+                raise
+            print(f"[DOC-AI] Channel unavailable, retrying with a new client: {exc}")
+
+
+def result_cache_key(
+    settings: Dict[str, str],
+    content: bytes,
+    max_dim: int,
+    jpeg_quality: int,
+    grayscale: bool,
+) -> str:
+    digest = hashlib.sha256(content).hexdigest()
+    # Results from a different processor or version are not interchangeable.
+    processor = hashlib.sha256(
+        "|".join(
+            settings.get(field, "") or "" for field in ("project_id", "location", "processor_id", "processor_version")
+        ).encode()
+    ).hexdigest()[:12]
+    return f"{digest}:{processor}:{max_dim}:{jpeg_quality}:{int(bool(grayscale))}"
+
+
+def record_request(mode: str, content_bytes: int, elapsed_ms: float) -> None:
+    with _stats_lock:
+        item = _requests.setdefault(mode, {"calls": 0, "bytes": 0, "total_ms": 0.0})
+        item["calls"] += 1
+        item["bytes"] += content_bytes
+        item["total_ms"] += elapsed_ms
+
+
+def record_avoided() -> None:
+    _count("avoided")
+
+
+def _count(name: str) -> None:
+    with _stats_lock:
+        _stats[name] += 1
+    client = cache.redis_client()
+    if client is None:
+        return
+    try:
+        client.hincrby(_CACHE_STATS, name, 1)
+    except Exception as exc:
+        cache.mark_redis_down(exc)
+
+
+def cached_result(key: str) -> Optional[Dict[str, Any]]:
+    if not DOC_AI_CACHE_ENABLED:
+        return None
+    payload = _result_cache.get(key)
+    if payload is None:
+        client = cache.redis_client()
+        if client is not None:
+            try:
+                raw = client.get(_CACHE_PREFIX + key)
+                if raw:
+                    payload = json.loads(raw)
+                    _result_cache.set(key, payload)
+            except Exception as exc:
+                cache.mark_redis_down(exc)
+    _count("hits" if payload is not None else "misses")
+    return payload
+
+
+def store_result(key: str, payload: Dict[str, Any]) -> None:
+    if not DOC_AI_CACHE_ENABLED:
+        return
+    _result_cache.set(key, payload)
+    client = cache.redis_client()
+    if client is None:
+        return
+    try:
+        pipe = client.pipeline()
+        pipe.set(_CACHE_PREFIX + key, json.dumps(payload, ensure_ascii=False), ex=DOC_AI_CACHE_TTL_SEC)
+        pipe.zadd(_CACHE_INDEX, {key: time.time()})
+        pipe.zcard(_CACHE_INDEX)
+        size = pipe.execute()[-1]
+        overflow = int(size or 0) - DOC_AI_CACHE_MAX
+        if overflow > 0:
+            evicted = [item[0] for item in client.zpopmin(_CACHE_INDEX, overflow)]
+            if evicted:
+                client.delete(*[_CACHE_PREFIX + (k.decode() if isinstance(k, bytes) else k) for k in evicted])
+    except Exception as exc:
+        cache.mark_redis_down(exc)
+
+
+def stats() -> Dict[str, Any]:
+    with _stats_lock:
+        local = dict(_stats)
+        requests = {
+            mode: {
+                "calls": item["calls"],
+                "avg_bytes": round(item["bytes"] / item["calls"]) if item["calls"] else 0,
+                "avg_ms": round(item["total_ms"] / item["calls"], 2) if item["calls"] else 0.0,
+            }
+            for mode, item in _requests.items()
+        }
+    payload: Dict[str, Any] = {
+        "cache_enabled": DOC_AI_CACHE_ENABLED,
+        "process": {**local, "entries": len(_result_cache)},
+        "requests": requests,
+    }
+    client = cache.redis_client()
+    if client is not None:
+        try:
+            shared = client.hgetall(_CACHE_STATS) or {}
+            payload["shared"] = {
+                "hits": int(shared.get(b"hits", 0)),
+                "misses": int(shared.get(b"misses", 0)),
+                "avoided": int(shared.get(b"avoided", 0)),
+                "entries": int(client.zcard(_CACHE_INDEX) or 0),
+            }
+        except Exception as exc:
+            cache.mark_redis_down(exc)
+    return payload
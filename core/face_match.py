@@ -8,9 +8,11 @@ import os
 
 import cv2
 import numpy as np
+import onnxruntime
 from insightface.app import FaceAnalysis
 
 from core import db
+from core.deadline import FACE_INDEX_MIN_BUDGET_SEC, Deadline
 
 EMBEDDING_DIM = 512
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -26,6 +28,7 @@ _embedding_matrix: Optional[np.ndarray] = None
 _embedding_people: List[Dict[str, Any]] = []
 _index_dirty = True
 _index_version_mtime = 0.0
+_intra_op_threads = int(os.getenv("FACE_INTRA_OP_THREADS", "0"))
 
 
 def _parse_det_size(value: str) -> Tuple[int, int]:
@@ -40,6 +43,12 @@ def _parse_det_size(value: str) -> Tuple[int, int]:
         return (640, 640)
 
 
+def set_intra_op_threads(threads: int) -> None:
+    # Must run before the first _get_face_app(); sessions keep the thread count they were built with.
+    global _intra_op_threads
+    _intra_op_threads = max(0, int(threads))
+
+
 @lru_cache(maxsize=1)
 def _get_face_app() -> FaceAnalysis:
     det_size = _parse_det_size(FACE_DET_SIZE_RAW)
@@ -47,6 +56,17 @@ def _get_face_app() -> FaceAnalysis:
         name="buffalo_l",
         providers=["CPUExecutionProvider"],
     )
+    if _intra_op_threads > 0:
+        # insightface drops sess_options, so the sessions are rebuilt with a capped intra-op pool.
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = _intra_op_threads
+        options.inter_op_num_threads = 1
+        for model in app.models.values():
+            model.session = onnxruntime.InferenceSession(
+                model.model_file,
+                sess_options=options,
+                providers=["CPUExecutionProvider"],
+            )
     app.prepare(ctx_id=-1, det_size=det_size)
     return app
 
@@ -137,6 +157,14 @@ def mark_index_dirty() -> None:
         pass
 
 
+def model_loaded() -> bool:
+    return _get_face_app.cache_info().currsize > 0
+
+
+def index_size() -> int:
+    return len(_embedding_people)
+
+
 def _get_index_version_mtime() -> float:
     try:
         return INDEX_VERSION_FILE.stat().st_mtime
@@ -184,14 +212,26 @@ def warm_up() -> None:
             _build_embedding_cache()
 
 
-def find_best_match(embedding: np.ndarray, threshold: float) -> Optional[Tuple[Dict[str, Any], float]]:
+def find_best_match(
+    embedding: np.ndarray,
+    threshold: float,
+    deadline: Optional[Deadline] = None,
+) -> Optional[Tuple[Dict[str, Any], float]]:
     embedding = _normalize_embedding(embedding)
     if embedding is None:
         return None
     with _cache_lock:
         _refresh_index_state()
         if _index_dirty:
-            _build_embedding_cache()
+            if (
+                deadline is not None
+                and _embedding_matrix is not None
+                and not deadline.allows(FACE_INDEX_MIN_BUDGET_SEC)
+            ):
+                # Match against the current index; the next request rebuilds it.
+                deadline.degrade("face_index_refresh")
+            else:
+                _build_embedding_cache()
         matrix = _embedding_matrix
         people = list(_embedding_people)
     if matrix is None or not people:
@@ -0,0 +1,225 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import time
+import uuid
+from threading import Event, Lock
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from core import cache
+
+IDEMPOTENCY_ENABLED = os.getenv("IDEMPOTENCY_ENABLED", "1").strip().lower() in {"1", "true", "yes", "on"}
+IDEMPOTENCY_HASH_IMAGES = os.getenv("IDEMPOTENCY_HASH_IMAGES", "1").strip().lower() in {"1", "true", "yes", "on"}
+IDEMPOTENCY_TTL_SEC = int(os.getenv("IDEMPOTENCY_TTL_SEC", "300"))
+IDEMPOTENCY_MAX = int(os.getenv("IDEMPOTENCY_MAX", "2000"))
+IDEMPOTENCY_LOCK_SEC = float(os.getenv("IDEMPOTENCY_LOCK_SEC", "30"))
+IDEMPOTENCY_POLL_SEC = 0.05
+TRANSIENT_CODES = {"server_busy", "deadline_exceeded"}
+_PREFIX = "gates:idem:"
+_RELEASE_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+Response = Tuple[int, Dict[str, Any]]
+Entry = Dict[str, Any]
+
+
+class KeyReused(Exception):
+    def __init__(self) -> None:
+        super().__init__("مفتاح Idempotency-Key مستخدم مسبقاً مع صورة مختلفة")
+
+
+class _Flight:
+    def __init__(self, fingerprint: str) -> None:
+        self.done = Event()
+        self.fingerprint = fingerprint
+        self.entry: Optional[Entry] = None
+
+
+_results = cache.TTLCache(IDEMPOTENCY_MAX, IDEMPOTENCY_TTL_SEC)
+_flights: Dict[str, _Flight] = {}
+_lock = Lock()
+_stats = {"executed": 0, "replayed": 0, "coalesced": 0}
+
+
+def request_key(header_value: Optional[str], image_digest: str, gate_number: Optional[int]) -> Optional[str]:
+    if not IDEMPOTENCY_ENABLED:
+        return None
+    scope = f"gate={gate_number if gate_number is not None else '-'}"
+    value = (header_value or "").strip()
+    if value:
+        digest = hashlib.sha256(f"{scope}|key|{value[:200]}".encode()).hexdigest()
+    elif IDEMPOTENCY_HASH_IMAGES:
+        digest = hashlib.sha256(f"{scope}|image|{image_digest}".encode()).hexdigest()
+    else:
+        return None
+    return digest[:40]
+
+
+def _cacheable(response: Response) -> bool:
+    status_code, body = response
+    if status_code == 200:
+        return True
+    return status_code == 422 and body.get("error_code") not in TRANSIENT_CODES
+
+
+def _decode(raw: Any) -> Optional[Entry]:
+    try:
+        item = json.loads(raw)
+        item["status_code"] = int(item["status_code"])
+    except Exception:
+        return None
+    return item if isinstance(item.get("body"), dict) else None
+
+
+def _cached(key: str) -> Optional[Entry]:
+    entry = _results.get(key)
+    if entry is not None:
+        return entry
+    client = cache.redis_client()
+    if client is None:
+        return None
+    try:
+        raw = client.get(_PREFIX + key)
+    except Exception as exc:
+        cache.mark_redis_down(exc)
+        return None
+    entry = _decode(raw) if raw else None
+    if entry is not None:
+        _results.set(key, entry)
+    return entry
+
+
+def _store(key: str, entry: Entry) -> None:
+    if not _cacheable(_response(entry)):
+        return
+    _results.set(key, entry)
+    client = cache.redis_client()
+    if client is None:
+        return
+    try:
+        client.set(_PREFIX + key, json.dumps(entry, ensure_ascii=False, default=str), ex=IDEMPOTENCY_TTL_SEC)
+    except Exception as exc:
+        cache.mark_redis_down(exc)
+
+
+def _response(entry: Entry) -> Response:
+    return int(entry["status_code"]), entry["body"]
+
+
+def _replay(
+    entry: Entry,
+    fingerprint: str,
+    revalidate: Optional[Callable[[Response, Optional[int]], Optional[Response]]],
+) -> Optional[Response]:
+    if not entry.get("fingerprint"):
+        return None
+    if entry["fingerprint"] != fingerprint:
+        raise KeyReused()
+    response = _response(entry)
+    if revalidate is None:
+        return response
+    # A stored decision may be stale (an admin blocked the person since); the caller re-reads the row.
+    return revalidate(response, entry.get("subject_id"))
+
+
+def _claim_shared(key: str, wait_sec: float) -> Tuple[Optional[Entry], Optional[str]]:
+    # Another worker may own the same key; wait for its answer rather than scanning twice.
+    client = cache.redis_client()
+    if client is None:
+        return None, None
+    token = uuid.uuid4().hex
+    give_up_at = time.monotonic() + wait_sec
+    try:
+        while True:
+            if client.set(_PREFIX + "lock:" + key, token, nx=True, px=int(IDEMPOTENCY_LOCK_SEC * 1000)):
+                raw = client.get(_PREFIX + key)
+                if raw:
+                    _release_shared(key, token)
+                    return _decode(raw), None
+                return None, token
+            raw = client.get(_PREFIX + key)
+            if raw:
+                return _decode(raw), None
+            if time.monotonic() >= give_up_at:
+                return None, None
+            time.sleep(IDEMPOTENCY_POLL_SEC)
+    except Exception as exc:
+        cache.mark_redis_down(exc)
+        return None, None
+
+
+def _release_shared(key: str, token: Optional[str]) -> None:
+    if token is None:
+        return
+    client = cache.redis_client()
+    if client is None:
+        return
+    try:
+        client.eval(_RELEASE_SCRIPT, 1, _PREFIX + "lock:" + key, token)
+    except Exception as exc:
+        cache.mark_redis_down(exc)
+
+
+def _count(mode: str) -> str:
+    with _lock:
+        _stats[mode] += 1
+    return mode
+
+
+def run(
+    key: Optional[str],
+    fingerprint: str,
+    compute: Callable[[], Tuple[Response, Optional[int]]],
+    wait_sec: float,
+    revalidate: Optional[Callable[[Response, Optional[int]], Optional[Response]]] = None,
+) -> Tuple[Response, str]:
+    if key is None:
+        return compute()[0], _count("executed")
+    entry = _cached(key)
+    if entry is not None:
+        response = _replay(entry, fingerprint, revalidate)
+        if response is not None:
+            return response, _count("replayed")
+
+    with _lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _Flight(fingerprint)
+            _flights[key] = flight
+    if not leader:
+        if flight.fingerprint != fingerprint:
+            raise KeyReused()
+        if flight.done.wait(max(0.0, wait_sec)) and flight.entry is not None:
+            return _response(flight.entry), _count("coalesced")
+        # The first request failed or overran; this one scans on its own.
+        return compute()[0], _count("executed")
+
+    token = None
+    try:
+        entry, token = _claim_shared(key, max(0.0, wait_sec))
+        if entry is not None:
+            response = _replay(entry, fingerprint, revalidate)
+            if response is not None:
+                flight.entry = {**entry, "status_code": response[0], "body": response[1]}
+                return response, _count("coalesced")
+        response, subject_id = compute()
+        entry = {"status_code": response[0], "body": response[1], "fingerprint": fingerprint, "subject_id": subject_id}
+        _store(key, entry)
+        flight.entry = entry
+        return response, _count("executed")
+    finally:
+        _release_shared(key, token)
+        with _lock:
+            _flights.pop(key, None)
+        flight.done.set()
+
+
+def wait_budget(remaining_sec: float) -> float:
+    return min(IDEMPOTENCY_LOCK_SEC, remaining_sec)
+
+
+def stats() -> Dict[str, int]:
+    with _lock:
+        return {**_stats, "inflight": len(_flights), "entries": len(_results)}
@@ -0,0 +1,242 @@
+from __future__ import annotations
+
+import multiprocessing
+import os
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from threading import BoundedSemaphore, Lock, local
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from core.deadline import Deadline, DeadlineExceeded
+from core.ocr_pipeline import OcrResult, ScanResult, decode_image, run_face_match_scan
+
+
+def _web_workers() -> int:
+    try:
+        return max(1, int(os.getenv("WEB_CONCURRENCY", "2")))
+    except ValueError:
+        return 2
+
+
+def _default_workers() -> int:
+    return max(1, (os.cpu_count() or 1) // _web_workers())
+
+
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "").strip() or _default_workers())
+INFERENCE_QUEUE_MAX = max(0, int(os.getenv("INFERENCE_QUEUE_MAX", "4")))
+INFERENCE_RETRY_AFTER_SEC = max(1, int(os.getenv("INFERENCE_RETRY_AFTER_SEC", "2")))
+# Every web worker runs its own pool: split the cores across all of their processes, not per process.
+INFERENCE_THREADS = int(
+    os.getenv("INFERENCE_THREADS", "").strip()
+    or max(1, (os.cpu_count() or 1) // (_web_workers() * max(1, INFERENCE_WORKERS)))
+)
+INFERENCE_TIMEOUT_SEC = float(os.getenv("INFERENCE_TIMEOUT_SEC", "30"))
+INFERENCE_TIMEOUT_GRACE_SEC = float(os.getenv("INFERENCE_TIMEOUT_GRACE_SEC", "0.5"))
+# In-process mode (INFERENCE_WORKERS=0) has no pool to protect, so admission never rejects there.
+CAPACITY = INFERENCE_WORKERS + INFERENCE_QUEUE_MAX if INFERENCE_WORKERS > 0 else 0
+
+_slots = BoundedSemaphore(max(1, CAPACITY))
+_lock = Lock()
+_inflight = 0
+_pool: Optional[ProcessPoolExecutor] = None
+_admitted = local()
+
+
+class InferenceBusy(Exception):
+    def __init__(self, inflight: int) -> None:
+        super().__init__("السيرفر مشغول حالياً، حاول مرة أخرى")
+        self.inflight = inflight
+        self.retry_after = INFERENCE_RETRY_AFTER_SEC
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def _limit_threads(threads: int) -> None:
+    import cv2
+
+    for name in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[name] = str(threads)
+    cv2.setNumThreads(threads)
+    try:
+        import torch
+
+        torch.set_num_threads(threads)
+    except Exception:
+        pass
+
+
+def _init_worker() -> None:
+    from core import face_match
+    from core import ocr_pipeline
+
+    started = time.perf_counter()
+    try:
+        _limit_threads(INFERENCE_THREADS)
+        face_match.set_intra_op_threads(INFERENCE_THREADS)
+        ocr_pipeline.warm_up()
+        face_match.warm_up()
+    except Exception as exc:
+        print(f"[INFERENCE] Worker {os.getpid()} failed to start: {exc}")
+        raise
+    print(f"[INFERENCE] Worker {os.getpid()} ready in {(time.perf_counter() - started):.1f}s")
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _lock:
+        if _pool is None:
+            # spawn: forking a parent that already holds torch/onnx threads can deadlock the child.
+            _pool = ProcessPoolExecutor(
+                max_workers=INFERENCE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+            print(
+                f"[INFERENCE] Process pool started workers={INFERENCE_WORKERS} "
+                f"queue={INFERENCE_QUEUE_MAX} threads={INFERENCE_THREADS}"
+            )
+        return _pool
+
+
+def _reset_pool() -> None:
+    global _pool
+    with _lock:
+        pool = _pool
+        _pool = None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+def start() -> None:
+    if INFERENCE_WORKERS <= 0:
+        return
+    # Spawn a worker now: a broken initializer (a missing model) must fail startup, not every scan.
+    try:
+        _get_pool().submit(_ping).result()
+    except BrokenProcessPool:
+        _reset_pool()
+        raise RuntimeError("Inference worker failed to start; see the worker log above") from None
+
+
+def shutdown() -> None:
+    _reset_pool()
+
+
+def inflight() -> int:
+    return _inflight
+
+
+def _release(limited: bool) -> None:
+    global _inflight
+    with _lock:
+        _inflight -= 1
+    if limited:
+        _slots.release()
+
+
+@contextmanager
+def admission() -> Iterator[int]:
+    global _inflight
+    limited = INFERENCE_WORKERS > 0
+    if limited and not _slots.acquire(blocking=False):
+        raise InferenceBusy(_inflight)
+    with _lock:
+        _inflight += 1
+        queued = max(0, _inflight - INFERENCE_WORKERS) if limited else 0
+    ticket = {"limited": limited, "detached": False}
+    previous = getattr(_admitted, "ticket", None)
+    _admitted.ticket = ticket
+    try:
+        yield queued
+    finally:
+        _admitted.ticket = previous
+        if not ticket["detached"]:
+            _release(limited)
+
+
+def _hold_until_done(future: Future) -> None:
+    # A running job cannot be cancelled: its slot stays taken until the child actually finishes.
+    ticket = getattr(_admitted, "ticket", None)
+    if ticket is None or ticket["detached"]:
+        return
+    ticket["detached"] = True
+    future.add_done_callback(lambda _: _release(ticket["limited"]))
+
+
+def _face_match_job(image_bytes: bytes, budget_sec: Optional[float]) -> Tuple[ScanResult, List[str], float]:
+    # The only decode on the pooled path: the parent ships bytes, never a pickled pixel array.
+    started_at = time.time()
+    deadline = Deadline(budget_sec) if budget_sec is not None else None
+    t0 = time.perf_counter()
+    try:
+        image = decode_image(image_bytes)
+    except ValueError as exc:
+        raise InvalidImage(str(exc)) from None
+    decode_ms = (time.perf_counter() - t0) * 1000
+    scan = run_face_match_scan(image_bytes, image=image, deadline=deadline)
+    scan.timings["decode_ms"] = decode_ms
+    scan.image_size = (int(image.shape[1]), int(image.shape[0]))
+    return scan, (deadline.degraded if deadline is not None else []), started_at
+
+
+def _timed_out_scan(stage: str) -> ScanResult:
+    exc = DeadlineExceeded(stage)
+    return ScanResult(
+        ocr=OcrResult(full_name="", national_id="", tesseract_raw={}, debug={}),
+        photo_image=None,
+        card_image=None,
+        fields=[],
+        card_bbox=None,
+        docai={},
+        face_match=None,
+        face_embedding=None,
+        timings={},
+        error=str(exc),
+        error_code=exc.code,
+    )
+
+
+def run_face_match(
+    image_bytes: bytes,
+    image: Optional[np.ndarray] = None,
+    deadline: Optional[Deadline] = None,
+) -> ScanResult:
+    if INFERENCE_WORKERS <= 0:
+        return run_face_match_scan(image_bytes, image=image, deadline=deadline)
+    budget = None
+    wait_sec = INFERENCE_TIMEOUT_SEC
+    if deadline is not None and deadline.expires_at is not None:
+        budget = max(deadline.remaining(), 0.001)
+        # The job honours the same deadline itself; the grace only catches a worker that stopped responding.
+        wait_sec = budget + INFERENCE_TIMEOUT_GRACE_SEC
+    submitted_at = time.time()
+    future = _get_pool().submit(_face_match_job, image_bytes, budget)
+    try:
+        scan, degraded, started_at = future.result(timeout=wait_sec)
+    except FutureTimeout:
+        if not future.cancel():
+            _hold_until_done(future)
+        print(f"[INFERENCE] No result within {wait_sec:.1f}s, giving up on the job")
+        if deadline is not None:
+            deadline.degrade("inference")
+        return _timed_out_scan("inference")
+    except BrokenProcessPool:
+        print("[INFERENCE] Worker process died, restarting the pool")
+        _reset_pool()
+        raise InferenceBusy(_inflight) from None
+    scan.timings["inference_wait_ms"] = max(0.0, (started_at - submitted_at) * 1000)
+    if deadline is not None:
+        for stage in degraded:
+            deadline.degrade(stage)
+    return scan
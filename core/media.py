@@ -1,13 +1,15 @@
 from __future__ import annotations
 
 from pathlib import Path
-from typing import Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import json
 import uuid
 
 import cv2
 import numpy as np
 
 from core import face_match
+from core import media_writer
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 DATA_DIR = BASE_DIR / "data"
@@ -29,15 +31,39 @@ def _safe_id(value: str) -> str:
     return "".join(ch for ch in value if ch.isdigit())
 
 
+def _person_photo_filename(national_id: str) -> str:
+    return f"{_safe_id(national_id)}_{uuid.uuid4().hex[:8]}.jpg"
+
+
+def _original_card_filename() -> str:
+    return f"orig_{uuid.uuid4().hex[:10]}.jpg"
+
+
 def save_person_photo(photo_image, national_id: str) -> str:
     ensure_dirs()
-    safe_id = _safe_id(national_id)
-    filename = f"{safe_id}_{uuid.uuid4().hex[:8]}.jpg"
+    filename = _person_photo_filename(national_id)
     output_path = PHOTO_DIR / filename
     cv2.imwrite(str(output_path), photo_image)
     return filename
 
 
+def _bind(on_commit: Optional[Callable[[str], None]], filename: str) -> Optional[Callable[[], None]]:
+    if on_commit is None:
+        return None
+    return lambda: on_commit(filename)
+
+
+def queue_person_photo(
+    photo_image: np.ndarray,
+    national_id: str,
+    on_commit: Optional[Callable[[str], None]] = None,
+) -> str:
+    ensure_dirs()
+    filename = _person_photo_filename(national_id)
+    media_writer.submit(PHOTO_DIR / filename, photo_image, _bind(on_commit, filename))
+    return filename
+
+
 def save_card_image(card_image, national_id: str) -> str:
     ensure_dirs()
     safe_id = _safe_id(national_id) or "unknown"
@@ -47,18 +73,39 @@ def save_card_image(card_image, national_id: str) -> str:
     return filename
 
 
-def save_original_card_image(image_bytes: bytes) -> Optional[str]:
+def is_jpeg(image_bytes: bytes) -> bool:
+    return image_bytes[:3] == b"\xff\xd8\xff"
+
+
+def save_original_card_image(image_bytes: bytes, image: Optional[np.ndarray] = None) -> Optional[str]:
     ensure_dirs()
-    data = np.frombuffer(image_bytes, np.uint8)
-    image = cv2.imdecode(data, cv2.IMREAD_COLOR)
+    filename = _original_card_filename()
+    output_path = CARD_DIR / filename
+    if is_jpeg(image_bytes):
+        output_path.write_bytes(image_bytes)
+        return filename
+    if image is None:
+        data = np.frombuffer(image_bytes, np.uint8)
+        image = cv2.imdecode(data, cv2.IMREAD_COLOR)
     if image is None:
         return None
-    filename = f"orig_{uuid.uuid4().hex[:10]}.jpg"
-    output_path = CARD_DIR / filename
     cv2.imwrite(str(output_path), image)
     return filename
 
 
+def queue_original_card_image(
+    image_bytes: bytes,
+    image: Optional[np.ndarray] = None,
+    on_commit: Optional[Callable[[str], None]] = None,
+) -> str:
+    ensure_dirs()
+    filename = _original_card_filename()
+    # Non-JPEG bytes without a decoded frame are re-encoded by the writer, off the request path.
+    payload = image_bytes if is_jpeg(image_bytes) or image is None else image
+    media_writer.submit(CARD_DIR / filename, payload, _bind(on_commit, filename))
+    return filename
+
+
 def save_raw_upload(image_bytes: bytes) -> str:
     ensure_dirs()
     filename = f"raw_{uuid.uuid4().hex}.bin"
@@ -67,6 +114,67 @@ def save_raw_upload(image_bytes: bytes) -> str:
     return str(output_path)
 
 
+def _scan_artifact_paths(key: str) -> Tuple[Path, Path]:
+    safe_key = "".join(ch for ch in key if ch.isalnum())
+    return RAW_DIR / f"scan_{safe_key}.npz", RAW_DIR / f"scan_{safe_key}.json"
+
+
+def save_scan_artifacts(
+    card_image: np.ndarray,
+    fields: List[Dict[str, Any]],
+    card_bbox: Optional[Tuple[int, int, int, int]],
+    photo_image: Optional[np.ndarray],
+) -> str:
+    ensure_dirs()
+    key = uuid.uuid4().hex
+    arrays_path, meta_path = _scan_artifact_paths(key)
+    arrays: Dict[str, np.ndarray] = {"card_image": np.ascontiguousarray(card_image)}
+    if photo_image is not None:
+        arrays["photo_image"] = np.ascontiguousarray(photo_image)
+    with arrays_path.open("wb") as handle:
+        np.savez(handle, **arrays)
+    meta = {
+        "fields": [
+            {"label": field.get("label"), "bbox": list(field.get("bbox") or ()), "conf": field.get("conf", 0.0)}
+            for field in fields
+        ],
+        "card_bbox": list(card_bbox) if card_bbox else None,
+    }
+    meta_path.write_text(json.dumps(meta), encoding="utf-8")
+    return key
+
+
+def load_scan_artifacts(key: str) -> Optional[Dict[str, Any]]:
+    arrays_path, meta_path = _scan_artifact_paths(key)
+    try:
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        with np.load(arrays_path) as arrays:
+            card_image = arrays["card_image"]
+            photo_image = arrays["photo_image"] if "photo_image" in arrays.files else None
+    except Exception:
+        return None
+    card_bbox = meta.get("card_bbox")
+    return {
+        "card_image": card_image,
+        "fields": [
+            {"label": field.get("label") or "", "bbox": tuple(field.get("bbox") or ()), "conf": field.get("conf", 0.0)}
+            for field in meta.get("fields") or []
+        ],
+        "card_bbox": tuple(card_bbox) if card_bbox else None,
+        "photo_image": photo_image,
+    }
+
+
+def delete_scan_artifacts(key: Optional[str]) -> None:
+    if not key:
+        return
+    for path in _scan_artifact_paths(key):
+        try:
+            path.unlink()
+        except Exception:
+            pass
+
+
 def generate_temp_nid() -> str:
     return f"TEMP-{uuid.uuid4().hex[:12]}"
 
@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import atexit
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from threading import Lock
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+MEDIA_WRITE_BEHIND = os.getenv("MEDIA_WRITE_BEHIND", "1").strip().lower() in {"1", "true", "yes", "on"}
+MEDIA_WRITER_QUEUE_MAX = max(1, int(os.getenv("MEDIA_WRITER_QUEUE_MAX", "64")))
+MEDIA_FSYNC = os.getenv("MEDIA_FSYNC", "1").strip().lower() in {"1", "true", "yes", "on"}
+MEDIA_FSYNC_BATCH = max(1, int(os.getenv("MEDIA_FSYNC_BATCH", "32")))
+MEDIA_FSYNC_INTERVAL_SEC = float(os.getenv("MEDIA_FSYNC_INTERVAL_SEC", "0.5"))
+
+Item = Tuple[Path, Any, float, Optional[Callable[[], None]]]
+
+_queue: "queue.Queue[Item]" = queue.Queue(maxsize=MEDIA_WRITER_QUEUE_MAX)
+_lock = Lock()
+_writer: Optional[threading.Thread] = None
+_writer_pid: Optional[int] = None
+_stats: Dict[str, float] = {"written": 0, "inline": 0, "errors": 0, "batches": 0, "lag_ms": 0.0, "lag_max_ms": 0.0}
+
+
+def _encode(path: Path, payload: Any) -> Any:
+    if isinstance(payload, (bytes, bytearray)) and path.suffix.lower() in {".jpg", ".jpeg"} and payload[:3] != b"\xff\xd8\xff":
+        payload = cv2.imdecode(np.frombuffer(payload, np.uint8), cv2.IMREAD_COLOR)
+        if payload is None:
+            raise ValueError(f"decode failed for {path.name}")
+    if isinstance(payload, np.ndarray):
+        ok, encoded = cv2.imencode(path.suffix or ".jpg", payload)
+        if not ok:
+            raise ValueError(f"encode failed for {path.name}")
+        return encoded
+    return payload
+
+
+def _fsync_dir(directory: Path) -> None:
+    try:
+        fd = os.open(str(directory), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _write_batch(batch: List[Item]) -> None:
+    # Stage every file first, then fsync and rename together: one directory fsync per batch, not per file.
+    staged = []
+    for path, payload, queued_at, on_commit in batch:
+        tmp = path.with_name(f".{path.name}.part")
+        try:
+            data = _encode(path, payload)
+            handle = open(tmp, "wb")
+        except Exception as exc:
+            print(f"[MEDIA] Failed to write {path.name}: {exc}")
+            with _lock:
+                _stats["errors"] += 1
+            continue
+        try:
+            handle.write(data)
+            handle.flush()
+            staged.append((path, tmp, handle, queued_at, on_commit))
+        except Exception as exc:
+            handle.close()
+            tmp.unlink(missing_ok=True)
+            print(f"[MEDIA] Failed to write {path.name}: {exc}")
+            with _lock:
+                _stats["errors"] += 1
+
+    directories = set()
+    committed = []
+    oldest = None
+    for path, tmp, handle, queued_at, on_commit in staged:
+        try:
+            if MEDIA_FSYNC:
+                os.fsync(handle.fileno())
+            handle.close()
+            os.replace(tmp, path)
+            directories.add(path.parent)
+            committed.append((path, on_commit))
+            oldest = queued_at if oldest is None else min(oldest, queued_at)
+        except Exception as exc:
+            handle.close()
+            tmp.unlink(missing_ok=True)
+            print(f"[MEDIA] Failed to commit {path.name}: {exc}")
+            with _lock:
+                _stats["errors"] += 1
+    if MEDIA_FSYNC:
+        for directory in directories:
+            _fsync_dir(directory)
+    lag_ms = (time.monotonic() - oldest) * 1000 if oldest is not None else 0.0
+
+    # Only now is the file durable under its final name; callers point rows at it from here.
+    for path, on_commit in committed:
+        if on_commit is None:
+            continue
+        try:
+            on_commit()
+        except Exception as exc:
+            # No row points at the new file, so it would only be an orphan; the row keeps its previous media.
+            print(f"[MEDIA] Commit callback failed for {path.name}, removing the file: {exc}")
+            try:
+                path.unlink(missing_ok=True)
+            except OSError as unlink_exc:
+                print(f"[MEDIA] Failed to remove orphaned {path.name}: {unlink_exc}")
+            with _lock:
+                _stats["errors"] += 1
+
+    if oldest is not None:
+        with _lock:
+            _stats["written"] += len(committed)
+            _stats["batches"] += 1
+            _stats["lag_ms"] = lag_ms
+            _stats["lag_max_ms"] = max(_stats["lag_max_ms"], lag_ms)
+
+
+def _run_writer() -> None:
+    while True:
+        batch = [_queue.get()]
+        flush_at = time.monotonic() + MEDIA_FSYNC_INTERVAL_SEC
+        while len(batch) < MEDIA_FSYNC_BATCH:
+            remaining = flush_at - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        try:
+            _write_batch(batch)
+        finally:
+            for _ in batch:
+                _queue.task_done()
+
+
+def _ensure_writer() -> None:
+    global _writer, _writer_pid
+    pid = os.getpid()
+    if _writer is not None and _writer_pid == pid:
+        return
+    with _lock:
+        if _writer is not None and _writer_pid == pid:
+            return
+        _writer = threading.Thread(target=_run_writer, name="media-writer", daemon=True)
+        _writer_pid = pid
+        _writer.start()
+
+
+def submit(path: Path, payload: Any, on_commit: Optional[Callable[[], None]] = None) -> None:
+    if MEDIA_WRITE_BEHIND:
+        _ensure_writer()
+        try:
+            _queue.put_nowait((path, payload, time.monotonic(), on_commit))
+            return
+        except queue.Full:
+            with _lock:
+                _stats["inline"] += 1
+    _write_batch([(path, payload, time.monotonic(), on_commit)])
+
+
+def drain(timeout_sec: float = 10.0) -> bool:
+    give_up_at = time.monotonic() + timeout_sec
+    while _queue.unfinished_tasks:
+        if _writer is None or _writer_pid != os.getpid() or time.monotonic() >= give_up_at:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+atexit.register(drain)
+
+
+def stats() -> Dict[str, float]:
+    with _lock:
+        return {**_stats, "queued": _queue.qsize(), "capacity": MEDIA_WRITER_QUEUE_MAX}
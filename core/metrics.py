@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import os
+import time
+from bisect import bisect_left
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+from core import cache
+
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+METRICS_FLUSH_SEC = float(os.getenv("METRICS_FLUSH_SEC", "2"))
+_METRICS_KEY = "gates:metrics:scan"
+# Measured stages only: estimates such as detect_fields_saved_ms also end in _ms but are not latencies.
+SCAN_STAGES = frozenset(
+    {
+        "request_ms",
+        "total_ms",
+        "upload_read_ms",
+        "decode_ms",
+        "persist_upload_ms",
+        "model_load_ms",
+        "inference_wait_ms",
+        "quality_check_ms",
+        "detect_card_ms",
+        "detect_fields_ms",
+        "extract_photo_ms",
+        "speculative_face_ms",
+        "face_embedding_ms",
+        "face_match_ms",
+        "docai_ms",
+        "tesseract_wait_ms",
+        "tesseract_nid_ms",
+        "tesseract_fields_ms",
+        "media_queue_ms",
+        "record_visit_ms",
+    }
+)
+
+Labels = Tuple[str, str, str]
+
+_lock = Lock()
+_local: Dict[Labels, List[float]] = {}
+_pending: Dict[Labels, List[float]] = {}
+_last_flush = time.monotonic()
+
+
+def _add(store: Dict[Labels, List[float]], labels: Labels, value: float) -> None:
+    item = store.get(labels)
+    if item is None:
+        # One slot per bucket plus +Inf, then sum and count.
+        item = [0] * (len(BUCKETS_MS) + 1) + [0.0, 0]
+        store[labels] = item
+    item[bisect_left(BUCKETS_MS, value)] += 1
+    item[-2] += value
+    item[-1] += 1
+
+
+def observe_scan(timings: Dict[str, float], outcome: str, path: str = "match") -> None:
+    with _lock:
+        for key, value in timings.items():
+            if key not in SCAN_STAGES:
+                continue
+            labels = (path, key[:-3], outcome or "unknown")
+            _add(_local, labels, float(value))
+            _add(_pending, labels, float(value))
+        due = time.monotonic() - _last_flush >= METRICS_FLUSH_SEC
+    if due:
+        flush()
+
+
+def flush() -> None:
+    global _pending, _last_flush
+    with _lock:
+        pending = _pending
+        _pending = {}
+        _last_flush = time.monotonic()
+    if not pending:
+        return
+    client = cache.redis_client()
+    if client is None:
+        return
+    try:
+        pipe = client.pipeline(transaction=False)
+        for labels, item in pending.items():
+            field = "|".join(labels)
+            for idx, count in enumerate(item[:-2]):
+                if count:
+                    pipe.hincrby(_METRICS_KEY, f"{field}|{idx}", int(count))
+            pipe.hincrbyfloat(_METRICS_KEY, f"{field}|sum", item[-2])
+            pipe.hincrby(_METRICS_KEY, f"{field}|count", int(item[-1]))
+        pipe.execute()
+    except Exception as exc:
+        cache.mark_redis_down(exc)
+
+
+def _shared() -> Optional[Dict[Labels, List[float]]]:
+    client = cache.redis_client()
+    if client is None:
+        return None
+    try:
+        raw = client.hgetall(_METRICS_KEY) or {}
+    except Exception as exc:
+        cache.mark_redis_down(exc)
+        return None
+    store: Dict[Labels, List[float]] = {}
+    for field, value in raw.items():
+        field = field.decode() if isinstance(field, bytes) else field
+        parts = field.split("|")
+        if len(parts) != 4:
+            continue
+        labels = (parts[0], parts[1], parts[2])
+        item = store.get(labels)
+        if item is None:
+            item = [0] * (len(BUCKETS_MS) + 1) + [0.0, 0]
+            store[labels] = item
+        slot = parts[3]
+        if slot == "sum":
+            item[-2] = float(value)
+        elif slot == "count":
+            item[-1] = int(value)
+        elif slot.isdigit() and int(slot) <= len(BUCKETS_MS):
+            item[int(slot)] = int(value)
+    return store
+
+
+def _label_text(labels: Dict[str, str]) -> str:
+    return ",".join(f'{key}="{value}"' for key, value in labels.items())
+
+
+def _format_value(value: float) -> str:
+    if float(value).is_integer():
+        return str(int(value))
+    return f"{value:.3f}"
+
+
+def render(gauges: Optional[List[Tuple[str, str, Dict[str, str], float]]] = None) -> str:
+    flush()
+    store = _shared()
+    scope = "cluster"
+    if store is None:
+        with _lock:
+            store = {labels: list(item) for labels, item in _local.items()}
+        scope = "process"
+
+    lines = [
+        "# HELP gates_scan_stage_ms Scan pipeline stage latency in milliseconds.",
+        "# TYPE gates_scan_stage_ms histogram",
+    ]
+    for (path, stage, outcome), item in sorted(store.items()):
+        base = {"path": path, "stage": stage, "outcome": outcome}
+        cumulative = 0
+        for idx, bound in enumerate(BUCKETS_MS):
+            cumulative += item[idx]
+            lines.append(f"gates_scan_stage_ms_bucket{{{_label_text({**base, 'le': str(bound)})}}} {int(cumulative)}")
+        lines.append(f"gates_scan_stage_ms_bucket{{{_label_text({**base, 'le': '+Inf'})}}} {int(item[-1])}")
+        lines.append(f"gates_scan_stage_ms_sum{{{_label_text(base)}}} {_format_value(item[-2])}")
+        lines.append(f"gates_scan_stage_ms_count{{{_label_text(base)}}} {int(item[-1])}")
+
+    lines.append("# HELP gates_metrics_scope 1 when histograms are aggregated across workers through Redis.")
+    lines.append("# TYPE gates_metrics_scope gauge")
+    lines.append(f"gates_metrics_scope{{{_label_text({'scope': scope})}}} 1")
+
+    seen = set()
+    for name, help_text, labels, value in gauges or []:
+        if name not in seen:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            seen.add(name)
+        suffix = f"{{{_label_text(labels)}}}" if labels else ""
+        lines.append(f"{name}{suffix} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import datetime
+from typing import Any, Dict, Optional
+
+CENTURY_DIGITS = {"2": 1900, "3": 2000}
+
+GOVERNORATE_CODES = {
+    "01": "القاهرة",
+    "02": "الإسكندرية",
+    "03": "بورسعيد",
+    "04": "السويس",
+    "11": "دمياط",
+    "12": "الدقهلية",
+    "13": "الشرقية",
+    "14": "القليوبية",
+    "15": "كفر الشيخ",
+    "16": "الغربية",
+    "17": "المنوفية",
+    "18": "البحيرة",
+    "19": "الإسماعيلية",
+    "21": "الجيزة",
+    "22": "بني سويف",
+    "23": "الفيوم",
+    "24": "المنيا",
+    "25": "أسيوط",
+    "26": "سوهاج",
+    "27": "قنا",
+    "28": "أسوان",
+    "29": "الأقصر",
+    "31": "البحر الأحمر",
+    "32": "الوادي الجديد",
+    "33": "مطروح",
+    "34": "شمال سيناء",
+    "35": "جنوب سيناء",
+    "88": "خارج الجمهورية",
+}
+
+MAX_AGE_YEARS = 120
+
+
+def parse_national_id(value: str, today: Optional[datetime.date] = None) -> Optional[Dict[str, Any]]:
+    if not value or len(value) != 14 or not value.isdigit():
+        return None
+    century = CENTURY_DIGITS.get(value[0])
+    if century is None:
+        return None
+    try:
+        birth_date = datetime.date(century + int(value[1:3]), int(value[3:5]), int(value[5:7]))
+    except ValueError:
+        return None
+    today = today or datetime.date.today()
+    if birth_date > today or today.year - birth_date.year > MAX_AGE_YEARS:
+        return None
+    governorate_code = value[7:9]
+    if governorate_code not in GOVERNORATE_CODES:
+        return None
+    return {
+        "birth_date": birth_date.isoformat(),
+        "governorate_code": governorate_code,
+        "governorate": GOVERNORATE_CODES[governorate_code],
+        "gender": "male" if int(value[12]) % 2 else "female",
+    }
+
+
+def is_valid_national_id(value: str) -> bool:
+    return parse_national_id(value) is not None
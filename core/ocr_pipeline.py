@@ -3,19 +3,27 @@ from __future__ import annotations
 import os
 import re
 import uuid
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeout
 from io import BytesIO
+from threading import Lock
 from time import perf_counter
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import cv2
 import numpy as np
-import pytesseract
 from PIL import Image, ImageOps
 from ultralytics import YOLO
 from core import settings as app_settings
+from core import cache
+from core import docai
 from core import face_match
+from core import nid
+from core import tesseract
+from core.deadline import DOC_AI_MIN_BUDGET_SEC, ROTATION_MIN_BUDGET_SEC, Deadline, DeadlineExceeded
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 MODEL_DIR = BASE_DIR / "models"
@@ -30,6 +38,25 @@ _id_card_model: Optional[YOLO] = None
 _fields_model: Optional[YOLO] = None
 _tess_warned: set[str] = set()
 _docai_warned: bool = False
+_ocr_pool: Optional[ThreadPoolExecutor] = None
+_field_pool: Optional[ThreadPoolExecutor] = None
+_docai_pool: Optional[ThreadPoolExecutor] = None
+_ocr_pool_lock = Lock()
+OCR_WORKERS = max(1, int(os.getenv("OCR_WORKERS", "4")))
+FIELD_OCR_WORKERS = max(1, int(os.getenv("FIELD_OCR_WORKERS", "4")))
+DOC_AI_WORKERS = max(1, int(os.getenv("DOC_AI_WORKERS", "4")))
+DOC_AI_HEDGE_DELAY_SEC = max(0.0, float(os.getenv("DOC_AI_HEDGE_DELAY_MS", "250")) / 1000.0)
+NID_FIELD_LABELS = {"nid", "id", "nationalid", "national_id"}
+NID_TESS_CONFIG = "-c tessedit_char_whitelist=0123456789٠١٢٣٤٥٦٧٨٩"
+MOSAIC_PAD_RATIO = 0.06
+MOSAIC_GAP_PX = 16
+QUALITY_MAX_DIM = 480
+QUALITY_GLARE_LEVEL = 250
+FACE_FAST_PATH = os.getenv("FACE_FAST_PATH", "1").strip().lower() in {"1", "true", "yes", "on"}
+DETECT_FIELDS_AVG_REFRESH_SEC = 60.0
+_DETECT_FIELDS_AVG_KEY = "gates:detect_fields_avg_ms"
+_detect_fields_avg_ms: Optional[float] = None
+_detect_fields_avg_checked: Optional[float] = None
 
 
 @dataclass
@@ -52,12 +79,21 @@ class ScanResult:
     face_embedding: Optional[np.ndarray]
     timings: Dict[str, float]
     error: Optional[str] = None
+    error_code: Optional[str] = None
+    quality: Optional[Dict[str, float]] = None
+    image_size: Optional[Tuple[int, int]] = None
 
 
 class CardNotFoundError(Exception):
     pass
 
 
+class ImageQualityError(Exception):
+    def __init__(self, message: str, code: str) -> None:
+        super().__init__(message)
+        self.code = code
+
+
 def _card_rotation_enabled() -> bool:
     raw = os.getenv("CARD_AUTO_ROTATE", "0").strip().lower()
     return raw in {"1", "true", "yes", "on"}
@@ -76,6 +112,43 @@ def _ensure_models() -> None:
         os.environ["TESSDATA_PREFIX"] = str(TESSDATA_DIR)
 
 
+def warm_up() -> None:
+    _ensure_models()
+
+
+def models_loaded() -> Dict[str, bool]:
+    return {"id_card": _id_card_model is not None, "fields": _fields_model is not None}
+
+
+def _ocr_executor() -> ThreadPoolExecutor:
+    global _ocr_pool
+    if _ocr_pool is None:
+        with _ocr_pool_lock:
+            if _ocr_pool is None:
+                _ocr_pool = ThreadPoolExecutor(max_workers=OCR_WORKERS, thread_name_prefix="ocr")
+    return _ocr_pool
+
+
+def _field_executor() -> ThreadPoolExecutor:
+    # Separate from _ocr_executor: hedged NID tasks run there, and a task waiting
+    # on field crops queued behind it in the same pool could deadlock.
+    global _field_pool
+    if _field_pool is None:
+        with _ocr_pool_lock:
+            if _field_pool is None:
+                _field_pool = ThreadPoolExecutor(max_workers=FIELD_OCR_WORKERS, thread_name_prefix="field-ocr")
+    return _field_pool
+
+
+def _docai_executor() -> ThreadPoolExecutor:
+    global _docai_pool
+    if _docai_pool is None:
+        with _ocr_pool_lock:
+            if _docai_pool is None:
+                _docai_pool = ThreadPoolExecutor(max_workers=DOC_AI_WORKERS, thread_name_prefix="docai")
+    return _docai_pool
+
+
 def _tessdata_exists(lang: str) -> bool:
     return (TESSDATA_DIR / f"{lang}.traineddata").exists()
 
@@ -89,13 +162,6 @@ def _tess_lang(lang: str) -> str:
     return "ara"
 
 
-def _tess_config(base_config: str = "") -> str:
-    if TESSDATA_DIR.exists():
-        extra = f"--tessdata-dir {TESSDATA_DIR}"
-        return f"{base_config} {extra}".strip()
-    return base_config
-
-
 def _docai_settings() -> Optional[Dict[str, str]]:
     global _docai_warned
     processor_id = os.getenv("DOC_AI_PROCESSOR_ID")
@@ -122,6 +188,7 @@ def _docai_settings() -> Optional[Dict[str, str]]:
         "processor_id": processor_id,
         "project_id": project_id,
         "location": location,
+        "processor_version": os.getenv("DOC_AI_PROCESSOR_VERSION", "").strip(),
     }
 
 
@@ -265,48 +332,149 @@ def _serialize_docai_entity(entity: Any, doc_text: str) -> Dict[str, Any]:
     return item
 
 
-def _docai_extract_fields(card_image: np.ndarray) -> Optional[Dict[str, Any]]:
+def _pad_bbox(
+    bbox: Tuple[int, int, int, int],
+    shape: Tuple[int, ...],
+    ratio: float = MOSAIC_PAD_RATIO,
+) -> Tuple[int, int, int, int]:
+    x1, y1, x2, y2 = bbox
+    pad_x = int((x2 - x1) * ratio)
+    pad_y = int((y2 - y1) * ratio * 2)
+    return (max(0, x1 - pad_x), max(0, y1 - pad_y), min(shape[1], x2 + pad_x), min(shape[0], y2 + pad_y))
+
+
+def _docai_mosaic(
+    card_image: np.ndarray,
+    fields: List[Dict[str, Any]],
+    with_nid: bool = True,
+) -> Optional[np.ndarray]:
+    name_fields = _collect_name_fields(fields)
+    name_fields.sort(key=lambda item: (item["priority"], -item["x"]))
+    nid_field = _best_box([f for f in fields if f["label"].lower() in NID_FIELD_LABELS]) if with_nid else None
+    if not name_fields or (with_nid and not nid_field):
+        return None
+    boxes = [field["bbox"] for field in name_fields] + ([nid_field["bbox"]] if nid_field else [])
+    crops = [_crop(card_image, _pad_bbox(bbox, card_image.shape)) for bbox in boxes]
+    crops = [crop for crop in crops if crop.size]
+    if not crops:
+        return None
+    width = max(crop.shape[1] for crop in crops)
+    height = sum(crop.shape[0] for crop in crops) + MOSAIC_GAP_PX * (len(crops) - 1)
+    canvas = np.full((height, width, 3), 255, dtype=np.uint8)
+    y = 0
+    for crop in crops:
+        h, w = crop.shape[:2]
+        # Right-aligned, like the Arabic text on the card.
+        canvas[y:y + h, width - w:width] = crop
+        y += h + MOSAIC_GAP_PX
+    return canvas
+
+
+def _docai_payload_image(card_image: np.ndarray, fields: Optional[List[Dict[str, Any]]]) -> Tuple[np.ndarray, str]:
+    if fields and app_settings.get_docai_mosaic():
+        mosaic = _docai_mosaic(card_image, fields)
+        if mosaic is not None:
+            return mosaic, "mosaic"
+    return card_image, "full"
+
+
+def _docai_extract_fields(
+    card_image: np.ndarray,
+    timeout: Optional[float] = None,
+    fields: Optional[List[Dict[str, Any]]] = None,
+    deadline: Optional[Deadline] = None,
+) -> Optional[Dict[str, Any]]:
     settings = _docai_settings()
     if settings is None:
         return None
 
-    try:
-        from google.cloud import documentai
-    except Exception as exc:
-        print(f"[DOC-AI] Library not available: {exc}")
+    if not docai.available():
+        print("[DOC-AI] Library not available: google-cloud-documentai")
         return None
 
-    try:
-        project_id = settings["project_id"]
-        location = settings["location"]
-        processor_id = settings["processor_id"]
+    image, mode = _docai_payload_image(card_image, fields)
+    if mode == "mosaic":
+        payload = _docai_request(settings, image, mode, timeout)
+        if payload and payload.get("full_name") and payload.get("national_id"):
+            return payload
+        if deadline is not None and not deadline.allows(DOC_AI_MIN_BUDGET_SEC):
+            deadline.degrade("docai_full_card")
+            return payload
+        print("[DOC-AI] Mosaic extraction incomplete, falling back to full card.")
+        if deadline is not None and timeout is not None:
+            timeout = min(timeout, deadline.remaining())
+    return _docai_request(settings, card_image, "full", timeout)
+
+
+def _docai_extract_name(
+    card_image: np.ndarray,
+    timeout: Optional[float] = None,
+    fields: Optional[List[Dict[str, Any]]] = None,
+    deadline: Optional[Deadline] = None,
+) -> Optional[Dict[str, Any]]:
+    # The NID is already validated locally; only the name rows go to DocAI.
+    settings = _docai_settings()
+    if settings is None or not docai.available():
+        return _docai_extract_fields(card_image, timeout=timeout, fields=fields, deadline=deadline)
+    mosaic = _docai_mosaic(card_image, fields, with_nid=False) if fields else None
+    if mosaic is not None:
+        payload = _docai_request(settings, mosaic, "name", timeout)
+        if payload and payload.get("full_name"):
+            return payload
+        if deadline is not None and not deadline.allows(DOC_AI_MIN_BUDGET_SEC):
+            deadline.degrade("docai_full_card")
+            return payload
+        print("[DOC-AI] Name-only extraction incomplete, falling back to full card.")
+        if deadline is not None and timeout is not None:
+            timeout = min(timeout, deadline.remaining())
+    return _docai_request(settings, card_image, "full", timeout)
+
+
+def _docai_timeout(deadline: Optional[Deadline]) -> float:
+    timeout = docai.request_timeout()
+    if deadline is not None:
+        timeout = min(timeout, deadline.remaining())
+    return timeout
+
+
+def _timed_docai(extract: Callable[..., Optional[Dict[str, Any]]], *args: Any, **kwargs: Any) -> Tuple[Dict[str, Any], float]:
+    t0 = perf_counter()
+    payload = extract(*args, **kwargs) or {}
+    return payload, (perf_counter() - t0) * 1000
 
-        client_options = {"api_endpoint": f"{location}-documentai.googleapis.com"}
-        client = documentai.DocumentProcessorServiceClient(client_options=client_options)
-        name = client.processor_path(project_id, location, processor_id)
 
-        docai_image = _prepare_docai_image(card_image)
+def _docai_request(
+    settings: Dict[str, str],
+    image: np.ndarray,
+    mode: str,
+    timeout: Optional[float],
+) -> Optional[Dict[str, Any]]:
+    try:
+        docai_image = _prepare_docai_image(image)
+        content = _encode_jpeg(docai_image, quality=_docai_jpeg_quality())
         try:
             height, width = docai_image.shape[:2]
             print(
                 "[DOC-AI] Input image size="
-                f"{width}x{height} gray={app_settings.get_docai_grayscale()} "
+                f"{width}x{height} bytes={len(content)} mode={mode} gray={app_settings.get_docai_grayscale()} "
                 f"max_dim={_docai_max_dim()} jpeg_quality={_docai_jpeg_quality()}"
             )
         except Exception:
             pass
-        raw_doc = documentai.RawDocument(
-            content=_encode_jpeg(docai_image, quality=_docai_jpeg_quality()),
-            mime_type="image/jpeg",
+        cache_key = docai.result_cache_key(
+            settings,
+            content,
+            _docai_max_dim(),
+            _docai_jpeg_quality(),
+            app_settings.get_docai_grayscale(),
         )
-
-        request = documentai.ProcessRequest(
-            name=name,
-            raw_document=raw_doc,
-            skip_human_review=True,
-        )
-
-        result = client.process_document(request=request)
+        cached = docai.cached_result(cache_key)
+        if cached is not None:
+            print(f"[DOC-AI] Cache hit key={cache_key[:12]}")
+            return cached
+        t0 = perf_counter()
+        result = docai.process_document(settings, content, mime_type="image/jpeg", timeout=timeout)
+        docai.record_request(mode, len(content), (perf_counter() - t0) * 1000)
         doc_text = getattr(result.document, "text", "") or ""
         if not doc_text:
             print("[DOC-AI] Warning: document text is empty.")
@@ -343,6 +511,7 @@ def _docai_extract_fields(card_image: np.ndarray) -> Optional[Dict[str, Any]]:
             "entities": entity_items,
         }
         print("[OCR][docai]", payload)
+        docai.store_result(cache_key, payload)
         return payload
     except Exception as exc:
         print(f"[DOC-AI] Failed to process document: {exc}")
@@ -378,6 +547,10 @@ def _decode_image(image_bytes: bytes) -> np.ndarray:
         return image
 
 
+def decode_image(image_bytes: bytes) -> np.ndarray:
+    return _decode_image(image_bytes)
+
+
 def _rotate_image(image: np.ndarray, angle: int) -> np.ndarray:
     if angle == 90:
         return cv2.rotate(image, cv2.ROTATE_90_CLOCKWISE)
@@ -417,7 +590,7 @@ def _best_box(boxes: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
 
 def _tesseract_text(image: np.ndarray, lang: str, config: str = "") -> str:
     try:
-        return pytesseract.image_to_string(image, lang=lang, config=_tess_config(config)).strip()
+        return tesseract.image_to_text(image, lang=lang, config=config)
     except Exception:
         return ""
 
@@ -489,25 +662,157 @@ def _collect_name_fields(fields: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     return name_fields
 
 
-def _tesseract_nid_from_fields(card_image: np.ndarray, fields: List[Dict[str, Any]]) -> str:
-    nid_candidates = [f for f in fields if f["label"].lower() in {"nid", "id", "nationalid", "national_id"}]
+FieldJob = Tuple[Optional[Tuple[int, int, int, int]], str, str]
+
+
+def _ocr_field_crop(card_image: np.ndarray, bbox: Optional[Tuple[int, int, int, int]], lang: str, config: str) -> str:
+    crop = _crop(card_image, bbox) if bbox else card_image
+    return _tesseract_text(_prep_for_tesseract(crop), lang=lang, config=config)
+
+
+def _ocr_fields(card_image: np.ndarray, jobs: List[FieldJob]) -> List[str]:
+    if len(jobs) <= 1:
+        return [_ocr_field_crop(card_image, *job) for job in jobs]
+    executor = _field_executor()
+    futures = [executor.submit(_ocr_field_crop, card_image, *job) for job in jobs]
+    return [future.result() for future in futures]
+
+
+def _nid_field_job(fields: List[Dict[str, Any]]) -> FieldJob:
+    nid_candidates = [f for f in fields if f["label"].lower() in NID_FIELD_LABELS]
     nid_field = _best_box(nid_candidates)
+    tess_nid_lang = _tess_lang("ara_number")
     if nid_field:
-        nid_crop = _crop(card_image, nid_field["bbox"])
-        tess_nid_lang = _tess_lang("ara_number")
-        nid_text = _tesseract_text(
-            _prep_for_tesseract(nid_crop),
-            lang=tess_nid_lang,
-            config="--psm 7 -c tessedit_char_whitelist=0123456789٠١٢٣٤٥٦٧٨٩",
-        )
-    else:
-        tess_nid_lang = _tess_lang("ara_number")
-        nid_text = _tesseract_text(
-            _prep_for_tesseract(card_image),
-            lang=tess_nid_lang,
-            config="--psm 6 -c tessedit_char_whitelist=0123456789٠١٢٣٤٥٦٧٨٩",
-        )
-    return _normalize_digits(nid_text)
+        return nid_field["bbox"], tess_nid_lang, f"--psm 7 {NID_TESS_CONFIG}"
+    return None, tess_nid_lang, f"--psm 6 {NID_TESS_CONFIG}"
+
+
+def _name_field_jobs(fields: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[FieldJob]]:
+    name_fields = _collect_name_fields(fields)
+    name_fields.sort(key=lambda item: (item["priority"], -item["x"]))
+    if not name_fields:
+        return [], []
+    tess_name_lang = _tess_lang("ara_combined")
+    return name_fields, [(field["bbox"], tess_name_lang, "--psm 7") for field in name_fields]
+
+
+def _join_name_texts(name_fields: List[Dict[str, Any]], texts: List[str]) -> str:
+    tess_parts = [
+        {"priority": field["priority"], "x": field["x"], "text": text}
+        for field, text in zip(name_fields, texts)
+        if text
+    ]
+    return _normalize_name_parts(tess_parts)
+
+
+def _tesseract_nid_from_fields(card_image: np.ndarray, fields: List[Dict[str, Any]]) -> str:
+    return _normalize_digits(_ocr_field_crop(card_image, *_nid_field_job(fields)))
+
+
+def _tesseract_fields(card_image: np.ndarray, fields: List[Dict[str, Any]]) -> Tuple[str, str]:
+    name_fields, jobs = _name_field_jobs(fields)
+    texts = _ocr_fields(card_image, jobs + [_nid_field_job(fields)])
+    return _join_name_texts(name_fields, texts[:-1]), _normalize_digits(texts[-1])
+
+
+def _ocr_images(images: List[np.ndarray], lang: str, config: str) -> List[str]:
+    if len(images) <= 1:
+        return [_tesseract_text(image, lang=lang, config=config) for image in images]
+    executor = _field_executor()
+    futures = [executor.submit(_tesseract_text, image, lang, config) for image in images]
+    return [future.result() for future in futures]
+
+
+def _nid_variants(crop: np.ndarray) -> List[np.ndarray]:
+    gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+    _, otsu = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    upscaled = cv2.resize(gray, None, fx=2.0, fy=2.0, interpolation=cv2.INTER_CUBIC)
+    _, upscaled_otsu = cv2.threshold(upscaled, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    adaptive = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 10)
+    return [otsu, upscaled_otsu, adaptive]
+
+
+def _local_nid(card_image: np.ndarray, fields: List[Dict[str, Any]]) -> Tuple[str, bool]:
+    bbox, lang, config = _nid_field_job(fields)
+    if not bbox:
+        text = _normalize_digits(_ocr_field_crop(card_image, bbox, lang, config))
+        return text, nid.is_valid_national_id(text)
+    variants = _nid_variants(_crop(card_image, bbox))
+    first = _normalize_digits(_tesseract_text(variants[0], lang=lang, config=config))
+    if nid.is_valid_national_id(first):
+        return first, True
+    candidates = [first] + [_normalize_digits(text) for text in _ocr_images(variants[1:], lang, config)]
+    valid = [candidate for candidate in candidates if nid.is_valid_national_id(candidate)]
+    if valid:
+        return Counter(valid).most_common(1)[0][0], True
+    return next((candidate for candidate in candidates if len(candidate) == 14), first), False
+
+
+def _timed_local_nid(card_image: np.ndarray, fields: List[Dict[str, Any]]) -> Tuple[str, bool, float]:
+    t0 = perf_counter()
+    text, valid = _local_nid(card_image, fields)
+    return text, valid, (perf_counter() - t0) * 1000
+
+
+def _await_local_nid(
+    future: Future, timings: Dict[str, float], deadline: Optional[Deadline] = None
+) -> Tuple[str, bool]:
+    t0 = perf_counter()
+    timeout = None
+    if deadline is not None and deadline.expires_at is not None:
+        timeout = max(deadline.remaining(), 0.0)
+    try:
+        text, valid, elapsed_ms = future.result(timeout=timeout)
+    except FutureTimeout:
+        future.cancel()
+        deadline.degrade("tesseract_nid")
+        timings["tesseract_wait_ms"] = (perf_counter() - t0) * 1000
+        return "", False
+    except Exception as exc:
+        print(f"[TESSERACT] NID extraction failed: {exc}")
+        return "", False
+    timings["tesseract_wait_ms"] = (perf_counter() - t0) * 1000
+    timings["tesseract_nid_ms"] = elapsed_ms
+    return text, valid
+
+
+def _quality_gray(image: np.ndarray) -> np.ndarray:
+    height, width = image.shape[:2]
+    scale = QUALITY_MAX_DIM / float(max(height, width))
+    if scale < 1:
+        image = cv2.resize(image, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+    return image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+def _check_image_quality(image: np.ndarray, timings: Dict[str, float], quality: Dict[str, float]) -> None:
+    # Before card detection only blur is judged; exposure and glare wait for the card crop.
+    t0 = perf_counter()
+    quality["sharpness"] = float(cv2.Laplacian(_quality_gray(image), cv2.CV_64F).var())
+    timings["quality_check_ms"] = (perf_counter() - t0) * 1000
+    print(f"[QUALITY] sharpness={quality['sharpness']:.1f}")
+    if not app_settings.get_quality_gate_enabled():
+        return
+    if quality["sharpness"] < app_settings.get_quality_min_sharpness():
+        raise ImageQualityError("الصورة غير واضحة (مهزوزة)", "image_blurry")
+
+
+def _check_card_exposure(card_image: np.ndarray, timings: Dict[str, float], quality: Dict[str, float]) -> None:
+    # Measured on the card alone: a white desk or a dark background around it is not glare or underexposure.
+    t0 = perf_counter()
+    hist = cv2.calcHist([_quality_gray(card_image)], [0], None, [256], [0, 256]).ravel()
+    total = float(hist.sum()) or 1.0
+    quality["glare_ratio"] = float(hist[QUALITY_GLARE_LEVEL:].sum() / total)
+    quality["brightness"] = float((hist * np.arange(256)).sum() / total)
+    timings["quality_check_ms"] = timings.get("quality_check_ms", 0.0) + (perf_counter() - t0) * 1000
+    print(f"[QUALITY] card glare={quality['glare_ratio']:.3f} brightness={quality['brightness']:.1f}")
+    if not app_settings.get_quality_gate_enabled():
+        return
+    if quality["brightness"] < app_settings.get_quality_min_brightness():
+        raise ImageQualityError("الصورة مظلمة جداً", "image_too_dark")
+    if quality["brightness"] > app_settings.get_quality_max_brightness():
+        raise ImageQualityError("الصورة ساطعة جداً", "image_too_bright")
+    if quality["glare_ratio"] > app_settings.get_quality_max_glare():
+        raise ImageQualityError("يوجد انعكاس ضوء قوي على الصورة", "image_glare")
 
 
 def _prepare_card(image_bytes: bytes) -> Tuple[np.ndarray, List[Dict[str, Any]], Tuple[int, int, int, int]]:
@@ -538,28 +843,111 @@ def _prepare_card(image_bytes: bytes) -> Tuple[np.ndarray, List[Dict[str, Any]],
     return card_image, fields, card_bbox
 
 
+def _record_detect_fields_ms(elapsed_ms: float) -> None:
+    global _detect_fields_avg_ms
+    if _detect_fields_avg_ms is None:
+        _detect_fields_avg_ms = elapsed_ms
+    else:
+        _detect_fields_avg_ms = 0.9 * _detect_fields_avg_ms + 0.1 * elapsed_ms
+    # Registration jobs run field detection on every card; share their average with the fast-path processes.
+    client = cache.redis_client()
+    if client is None:
+        return
+    try:
+        client.set(_DETECT_FIELDS_AVG_KEY, f"{_detect_fields_avg_ms:.2f}")
+    except Exception as exc:
+        cache.mark_redis_down(exc)
+
+
+def _detect_fields_saved_ms() -> Optional[float]:
+    global _detect_fields_avg_ms, _detect_fields_avg_checked
+    if _detect_fields_avg_ms is not None:
+        return _detect_fields_avg_ms
+    now = perf_counter()
+    if _detect_fields_avg_checked is not None and now - _detect_fields_avg_checked < DETECT_FIELDS_AVG_REFRESH_SEC:
+        return None
+    _detect_fields_avg_checked = now
+    client = cache.redis_client()
+    if client is None:
+        return None
+    try:
+        raw = client.get(_DETECT_FIELDS_AVG_KEY)
+    except Exception as exc:
+        cache.mark_redis_down(exc)
+        return None
+    if raw:
+        _detect_fields_avg_ms = float(raw)
+    return _detect_fields_avg_ms
+
+
+def _detect_fields_timed(
+    card_image: np.ndarray,
+    timings: Dict[str, float],
+    deadline: Optional[Deadline] = None,
+) -> Tuple[np.ndarray, List[Dict[str, Any]]]:
+    t0 = perf_counter()
+    fields = _detect_fields(card_image)
+    timings["detect_fields_ms"] = (perf_counter() - t0) * 1000
+    _record_detect_fields_ms(timings["detect_fields_ms"])
+    if not fields and _card_rotation_enabled() and deadline is not None and not deadline.allows(ROTATION_MIN_BUDGET_SEC):
+        deadline.degrade("fields_rotation_search")
+    elif not fields and _card_rotation_enabled():
+        best_fields = fields
+        best_image = card_image
+        best_rotation = 0
+        for angle in (90, 180, 270):
+            rotated = _rotate_image(card_image, angle)
+            candidate = _detect_fields(rotated)
+            if candidate and len(candidate) > len(best_fields):
+                best_fields = candidate
+                best_image = rotated
+                best_rotation = angle
+        if best_rotation:
+            card_image = best_image
+            fields = best_fields
+            print(f"[PIPELINE] Fields improved after card rotation {best_rotation}°")
+    if fields:
+        preview = ", ".join(
+            f"{field.get('label')}:{field.get('conf', 0.0):.2f}" for field in fields[:6]
+        )
+        print(f"[PIPELINE] Fields detected={len(fields)} [{preview}]")
+    else:
+        print("[PIPELINE] Fields detected=0")
+    return card_image, fields
+
+
 def _prepare_assets_timed(
     image_bytes: bytes,
     timings: Dict[str, float],
+    image: Optional[np.ndarray] = None,
+    quality: Optional[Dict[str, float]] = None,
+    detect_fields: bool = True,
+    deadline: Optional[Deadline] = None,
 ) -> Tuple[np.ndarray, np.ndarray, List[Dict[str, Any]], Tuple[int, int, int, int], Optional[np.ndarray]]:
     t0 = perf_counter()
     _ensure_models()
     timings["model_load_ms"] = (perf_counter() - t0) * 1000
 
-    t0 = perf_counter()
-    image = _decode_image(image_bytes)
-    timings["decode_ms"] = (perf_counter() - t0) * 1000
+    if image is None:
+        t0 = perf_counter()
+        image = _decode_image(image_bytes)
+        timings["decode_ms"] = (perf_counter() - t0) * 1000
     try:
         height, width = image.shape[:2]
         print(f"[PIPELINE] Decoded image size={width}x{height} bytes={len(image_bytes)}")
     except Exception:
         pass
 
+    if quality is not None:
+        _check_image_quality(image, timings, quality)
+
     t0 = perf_counter()
     card_bbox, card_conf = _detect_card_bbox(image)
     rotation_used = 0
     if not card_bbox:
-        if _card_rotation_enabled():
+        if _card_rotation_enabled() and deadline is not None and not deadline.allows(ROTATION_MIN_BUDGET_SEC):
+            deadline.degrade("card_rotation_search")
+        elif _card_rotation_enabled():
             best_conf = card_conf
             best_bbox = None
             best_image = None
@@ -580,6 +968,8 @@ def _prepare_assets_timed(
     timings["detect_card_ms"] = (perf_counter() - t0) * 1000
     if not card_bbox:
         raise CardNotFoundError("فشل إيجاد بطاقة شخصية في الصورة. برجاء التأكد من التصوير بشكل صحيح")
+    if deadline is not None:
+        deadline.check("detect_card")
     try:
         print(
             "[PIPELINE] Card bbox="
@@ -606,31 +996,13 @@ def _prepare_assets_timed(
     except Exception:
         pass
 
-    t0 = perf_counter()
-    fields = _detect_fields(card_image)
-    timings["detect_fields_ms"] = (perf_counter() - t0) * 1000
-    if not fields and _card_rotation_enabled():
-        best_fields = fields
-        best_image = card_image
-        best_rotation = 0
-        for angle in (90, 180, 270):
-            rotated = _rotate_image(card_image, angle)
-            candidate = _detect_fields(rotated)
-            if candidate and len(candidate) > len(best_fields):
-                best_fields = candidate
-                best_image = rotated
-                best_rotation = angle
-        if best_rotation:
-            card_image = best_image
-            fields = best_fields
-            print(f"[PIPELINE] Fields improved after card rotation {best_rotation}°")
-    if fields:
-        preview = ", ".join(
-            f"{field.get('label')}:{field.get('conf', 0.0):.2f}" for field in fields[:6]
-        )
-        print(f"[PIPELINE] Fields detected={len(fields)} [{preview}]")
+    if quality is not None:
+        _check_card_exposure(card_image, timings, quality)
+
+    if detect_fields:
+        card_image, fields = _detect_fields_timed(card_image, timings, deadline)
     else:
-        print("[PIPELINE] Fields detected=0")
+        fields = []
 
     t0 = perf_counter()
     photo = _extract_photo_region(card_image, fields)
@@ -713,28 +1085,12 @@ def prepare_assets(image_bytes: bytes) -> Tuple[np.ndarray, List[Dict[str, Any]]
 
 def _process(image_bytes: bytes, include_tess_name: bool = False) -> Tuple[OcrResult, np.ndarray, List[Dict[str, Any]]]:
     card_image, fields, card_bbox = _prepare_card(image_bytes)
-    name_fields = _collect_name_fields(fields)
-    tesseract_nid_text = _tesseract_nid_from_fields(card_image, fields)
-    nid_text = tesseract_nid_text
-
     tesseract_full_name = ""
-    if include_tess_name and name_fields:
-        tess_name_lang = _tess_lang("ara_combined")
-        tess_parts: List[Dict[str, Any]] = []
-        for field in name_fields:
-            crop = _crop(card_image, field["bbox"])
-            text = _tesseract_text(
-                _prep_for_tesseract(crop),
-                lang=tess_name_lang,
-                config="--psm 7",
-            )
-            if text:
-                tess_parts.append({
-                    "priority": field["priority"],
-                    "x": field["x"],
-                    "text": text,
-                })
-        tesseract_full_name = _normalize_name_parts(tess_parts)
+    if include_tess_name:
+        tesseract_full_name, tesseract_nid_text = _tesseract_fields(card_image, fields)
+    else:
+        tesseract_nid_text = _tesseract_nid_from_fields(card_image, fields)
+    nid_text = tesseract_nid_text
     full_name = tesseract_full_name
 
     tesseract_payload = {
@@ -767,33 +1123,27 @@ def run_ocr(image_bytes: bytes) -> OcrResult:
 
 
 def _tesseract_name_from_fields(card_image: np.ndarray, fields: List[Dict[str, Any]]) -> str:
-    name_fields = _collect_name_fields(fields)
-    if not name_fields:
+    name_fields, jobs = _name_field_jobs(fields)
+    if not jobs:
         return ""
-    tess_name_lang = _tess_lang("ara_combined")
-    tess_parts: List[Dict[str, Any]] = []
-    for field in name_fields:
-        crop = _crop(card_image, field["bbox"])
-        text = _tesseract_text(
-            _prep_for_tesseract(crop),
-            lang=tess_name_lang,
-            config="--psm 7",
-        )
-        if text:
-            tess_parts.append({
-                "priority": field["priority"],
-                "x": field["x"],
-                "text": text,
-            })
-    return _normalize_name_parts(tess_parts)
+    return _join_name_texts(name_fields, _ocr_fields(card_image, jobs))
 
 
-def run_security_scan(image_bytes: bytes, skip_face_match: bool = False) -> ScanResult:
+def run_security_scan(
+    image_bytes: bytes,
+    skip_face_match: bool = False,
+    image: Optional[np.ndarray] = None,
+    name_for_nid: Optional[Callable[[str], str]] = None,
+    deadline: Optional[Deadline] = None,
+) -> ScanResult:
     timings: Dict[str, float] = {}
+    quality: Optional[Dict[str, float]] = None if skip_face_match else {}
     total_start = perf_counter()
     try:
-        _, card_image, fields, card_bbox, photo = _prepare_assets_timed(image_bytes, timings)
-    except CardNotFoundError as exc:
+        _, card_image, fields, card_bbox, photo = _prepare_assets_timed(
+            image_bytes, timings, image=image, quality=quality, deadline=deadline
+        )
+    except (CardNotFoundError, ImageQualityError, DeadlineExceeded) as exc:
         timings["total_ms"] = (perf_counter() - total_start) * 1000
         if timings:
             log_payload = {key: round(value, 2) for key, value in timings.items()}
@@ -815,6 +1165,8 @@ def run_security_scan(image_bytes: bytes, skip_face_match: bool = False) -> Scan
             face_embedding=None,
             timings=timings,
             error=str(exc),
+            error_code=getattr(exc, "code", None),
+            quality=quality or None,
         )
     face_match_info = None
     face_embedding = None
@@ -826,7 +1178,7 @@ def run_security_scan(image_bytes: bytes, skip_face_match: bool = False) -> Scan
         if face_embedding is not None:
             threshold = app_settings.get_face_match_threshold()
             t0 = perf_counter()
-            match = face_match.find_best_match(face_embedding, threshold)
+            match = face_match.find_best_match(face_embedding, threshold, deadline=deadline)
             timings["face_match_ms"] = (perf_counter() - t0) * 1000
             if match:
                 person, score = match
@@ -867,33 +1219,145 @@ def run_security_scan(image_bytes: bytes, skip_face_match: bool = False) -> Scan
                     face_match=face_match_info,
                     face_embedding=face_embedding,
                     timings=timings,
+                    quality=quality or None,
                 )
 
-    t0 = perf_counter()
-    docai_payload = _docai_extract_fields(card_image) or {}
-    timings["docai_ms"] = (perf_counter() - t0) * 1000
-    full_name = (docai_payload.get("full_name") or "").strip()
-    docai_nid = _normalize_digits(docai_payload.get("national_id") or "")
-    if len(docai_nid) != 14:
-        docai_nid = ""
+    scan = _run_ocr_stage(
+        card_image,
+        fields,
+        card_bbox,
+        photo,
+        timings,
+        total_start,
+        face_match_info=face_match_info,
+        face_embedding=face_embedding,
+        name_for_nid=name_for_nid,
+        deadline=deadline,
+    )
+    scan.quality = quality or None
+    return scan
+
+
+def run_security_scan_from_assets(
+    card_image: np.ndarray,
+    fields: List[Dict[str, Any]],
+    card_bbox: Optional[Tuple[int, int, int, int]],
+    photo_image: Optional[np.ndarray],
+    name_for_nid: Optional[Callable[[str], str]] = None,
+) -> ScanResult:
+    timings: Dict[str, float] = {}
+    total_start = perf_counter()
+    if card_bbox is None:
+        card_bbox = (0, 0, card_image.shape[1], card_image.shape[0])
+    if not fields:
+        # The match path may have skipped field detection (fixed-geometry face crop).
+        _ensure_models()
+        card_image, fields = _detect_fields_timed(card_image, timings)
+    return _run_ocr_stage(
+        card_image,
+        fields,
+        card_bbox,
+        photo_image,
+        timings,
+        total_start,
+        name_for_nid=name_for_nid,
+    )
+
+
+def _run_ocr_stage(
+    card_image: np.ndarray,
+    fields: List[Dict[str, Any]],
+    card_bbox: Tuple[int, int, int, int],
+    photo: Optional[np.ndarray],
+    timings: Dict[str, float],
+    total_start: float,
+    face_match_info: Optional[Dict[str, Any]] = None,
+    face_embedding: Optional[np.ndarray] = None,
+    name_for_nid: Optional[Callable[[str], str]] = None,
+    deadline: Optional[Deadline] = None,
+) -> ScanResult:
+    # Hedge: read the NID locally while DocAI is in flight, so a failed or slow
+    # DocAI call costs max(docai, tesseract) instead of docai + tesseract.
+    local_future = _ocr_executor().submit(_timed_local_nid, card_image, fields)
+    local_nid, local_valid, local_done = "", False, False
+    docai_payload: Dict[str, Any] = {}
+    docai_future: Optional[Future] = None
+    full_name = ""
+    national_id = ""
+    name_only = False
+
+    if name_for_nid is not None:
+        # Local-first: a structurally valid NID of a person we already know needs no DocAI call.
+        # Tesseract gets a short head start; past it DocAI starts alongside, so a slow read never serializes them.
+        wait([local_future], timeout=DOC_AI_HEDGE_DELAY_SEC)
+        if not local_future.done() and (deadline is None or deadline.allows(DOC_AI_MIN_BUDGET_SEC)):
+            docai_future = _docai_executor().submit(
+                _timed_docai,
+                _docai_extract_fields,
+                card_image,
+                timeout=_docai_timeout(deadline),
+                fields=fields,
+                deadline=deadline,
+            )
+        local_nid, local_valid = _await_local_nid(local_future, timings, deadline)
+        local_done = True
+        known_name = name_for_nid(local_nid) if local_valid else ""
+        if known_name:
+            if docai_future is None or docai_future.cancel():
+                docai.record_avoided()
+            docai_future = None
+            print(f"[OCR] Local NID validated for known person, DocAI skipped nid={local_nid}")
+            full_name = known_name
+            national_id = local_nid
+        elif local_valid and docai_future is None:
+            name_only = True
+
+    if not national_id and docai_future is None and deadline is not None and not deadline.allows(DOC_AI_MIN_BUDGET_SEC):
+        deadline.degrade("docai")
+        if not local_done:
+            local_nid, local_valid = _await_local_nid(local_future, timings, deadline)
+            local_done = True
+        national_id = local_nid if len(local_nid) == 14 else ""
+    elif not national_id and name_only:
+        docai_payload, timings["docai_ms"] = _timed_docai(
+            _docai_extract_name, card_image, timeout=_docai_timeout(deadline), fields=fields, deadline=deadline
+        )
+        full_name = (docai_payload.get("full_name") or "").strip()
+        national_id = local_nid
+    elif not national_id:
+        try:
+            if docai_future is not None:
+                docai_payload, timings["docai_ms"] = docai_future.result()
+            else:
+                docai_payload, timings["docai_ms"] = _timed_docai(
+                    _docai_extract_fields, card_image, timeout=_docai_timeout(deadline), fields=fields, deadline=deadline
+                )
+        except Exception as exc:
+            print(f"[DOC-AI] Extraction failed: {exc}")
+            docai_payload = {}
+        full_name = (docai_payload.get("full_name") or "").strip()
+        docai_nid = _normalize_digits(docai_payload.get("national_id") or "")
+        if len(docai_nid) != 14:
+            docai_nid = ""
+        if docai_nid and nid.is_valid_national_id(docai_nid):
+            national_id = docai_nid
+            if not local_done:
+                local_future.cancel()
+        else:
+            if not local_done:
+                local_nid, local_valid = _await_local_nid(local_future, timings, deadline)
+                local_done = True
+            if local_valid or (not docai_nid and len(local_nid) == 14):
+                national_id = local_nid
+            else:
+                national_id = docai_nid
 
     tesseract_payload = {
         "full_name_raw": "",
-        "national_id_raw": "",
+        "national_id_raw": local_nid if local_done and len(local_nid) == 14 else "",
+        "national_id_valid": local_valid,
     }
 
-    if not docai_nid:
-        t0 = perf_counter()
-        tess_nid = _tesseract_nid_from_fields(card_image, fields)
-        timings["tesseract_nid_ms"] = (perf_counter() - t0) * 1000
-        if len(tess_nid) != 14:
-            tess_nid = ""
-        tesseract_payload["national_id_raw"] = tess_nid
-        if tess_nid:
-            docai_nid = tess_nid
-
-    national_id = docai_nid
-
     if tesseract_payload["national_id_raw"]:
         print("[OCR][tesseract]", tesseract_payload)
 
@@ -923,12 +1387,22 @@ def run_security_scan(image_bytes: bytes, skip_face_match: bool = False) -> Scan
     )
 
 
-def run_face_match_scan(image_bytes: bytes) -> ScanResult:
+def run_face_match_scan(
+    image_bytes: bytes,
+    image: Optional[np.ndarray] = None,
+    deadline: Optional[Deadline] = None,
+) -> ScanResult:
     timings: Dict[str, float] = {}
+    quality: Dict[str, float] = {}
     total_start = perf_counter()
+    speculative = FACE_FAST_PATH and app_settings.get_face_match_enabled()
     try:
-        _, card_image, fields, card_bbox, photo = _prepare_assets_timed(image_bytes, timings)
-    except CardNotFoundError as exc:
+        _, card_image, fields, card_bbox, photo = _prepare_assets_timed(
+            image_bytes, timings, image=image, quality=quality, detect_fields=not speculative, deadline=deadline
+        )
+        if deadline is not None:
+            deadline.check("detect_fields")
+    except (CardNotFoundError, ImageQualityError, DeadlineExceeded) as exc:
         timings["total_ms"] = (perf_counter() - total_start) * 1000
         if timings:
             log_payload = {key: round(value, 2) for key, value in timings.items()}
@@ -945,18 +1419,34 @@ def run_face_match_scan(image_bytes: bytes) -> ScanResult:
             face_embedding=None,
             timings=timings,
             error=str(exc),
+            error_code=getattr(exc, "code", None),
+            quality=quality or None,
         )
 
     face_match_info = None
     face_embedding = None
-    if app_settings.get_face_match_enabled() and photo is not None:
+    if speculative:
         t0 = perf_counter()
-        face_embedding = face_match.extract_face_embedding(photo)
-        timings["face_embedding_ms"] = (perf_counter() - t0) * 1000
+        face_embedding = face_match.extract_face_embedding(photo) if photo is not None else None
+        if face_embedding is not None:
+            timings["face_embedding_ms"] = (perf_counter() - t0) * 1000
+            saved_ms = _detect_fields_saved_ms()
+            if saved_ms is not None:
+                timings["detect_fields_saved_ms"] = saved_ms
+        else:
+            timings["speculative_face_ms"] = (perf_counter() - t0) * 1000
+            print("[PIPELINE] Fixed-geometry face crop failed, running field detection")
+            card_image, fields = _detect_fields_timed(card_image, timings, deadline)
+            photo = _extract_photo_region(card_image, fields)
+    if app_settings.get_face_match_enabled() and photo is not None:
+        if face_embedding is None:
+            t0 = perf_counter()
+            face_embedding = face_match.extract_face_embedding(photo)
+            timings["face_embedding_ms"] = (perf_counter() - t0) * 1000
         if face_embedding is not None:
             threshold = app_settings.get_face_match_threshold()
             t0 = perf_counter()
-            match = face_match.find_best_match(face_embedding, threshold)
+            match = face_match.find_best_match(face_embedding, threshold, deadline=deadline)
             timings["face_match_ms"] = (perf_counter() - t0) * 1000
             if match:
                 person, score = match
@@ -995,6 +1485,7 @@ def run_face_match_scan(image_bytes: bytes) -> ScanResult:
         face_embedding=face_embedding,
         timings=timings,
         error=None,
+        quality=quality or None,
     )
 
 
@@ -1024,6 +1515,8 @@ def prepare_debug_artifacts(image_bytes: bytes) -> Dict[str, Any]:
         return {
             "status": "error",
             "message": scan.error,
+            "error_code": scan.error_code,
+            "quality": scan.quality,
             "timings": scan.timings,
         }
     card_image = scan.card_image
@@ -1033,7 +1526,7 @@ def prepare_debug_artifacts(image_bytes: bytes) -> Dict[str, Any]:
 
     docai_url = ""
     try:
-        docai_image = _prepare_docai_image(card_image)
+        docai_image = _prepare_docai_image(_docai_payload_image(card_image, fields)[0])
         encoded = _encode_jpeg(docai_image, quality=_docai_jpeg_quality())
         decoded = cv2.imdecode(np.frombuffer(encoded, np.uint8), cv2.IMREAD_UNCHANGED)
         if decoded is None:
@@ -1048,9 +1541,15 @@ def prepare_debug_artifacts(image_bytes: bytes) -> Dict[str, Any]:
         _save_debug_variant(scan.photo_image, "face", file_id)
         face_url = f"/debug-images/face_{file_id}.jpg"
 
+    t0 = perf_counter()
+    tess_name, tess_nid = _tesseract_fields(card_image, fields)
+    scan.timings["tesseract_fields_ms"] = (perf_counter() - t0) * 1000
     tesseract_payload = {
-        "full_name_raw": _tesseract_name_from_fields(card_image, fields),
-        "national_id_raw": _tesseract_nid_from_fields(card_image, fields),
+        "full_name_raw": tess_name,
+        "national_id_raw": tess_nid,
+        "national_id_valid": nid.is_valid_national_id(tess_nid),
+        "engine": tesseract.engine_name(),
+        "engine_stats": tesseract.stats(),
     }
     docai_payload = scan.docai or {}
 
@@ -1064,6 +1563,7 @@ def prepare_debug_artifacts(image_bytes: bytes) -> Dict[str, Any]:
         "docai_image_url": docai_url,
         "face_image_url": face_url,
         "timings": scan.timings,
+        "quality": scan.quality,
         "final": {
             "full_name": scan.ocr.full_name,
             "national_id": scan.ocr.national_id,
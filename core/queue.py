@@ -25,11 +25,24 @@ def _job_timeout() -> int:
         return 180
 
 
+def queue_depth() -> Optional[int]:
+    url = _redis_url()
+    if not url:
+        return None
+    try:
+        conn = Redis.from_url(url)
+        return Queue(_queue_name(), connection=conn).count
+    except Exception as exc:
+        print(f"[RQ] Failed to read queue depth: {exc}")
+        return None
+
+
 def enqueue_registration(
-    raw_path: str,
+    raw_path: Optional[str],
     original_card_filename: Optional[str],
     placeholder_nid: Optional[str] = None,
     gate_number: Optional[int] = None,
+    artifacts_key: Optional[str] = None,
 ) -> Optional[str]:
     url = _redis_url()
     if not url:
@@ -43,6 +56,7 @@ def enqueue_registration(
             original_card_filename,
             placeholder_nid,
             gate_number,
+            artifacts_key,
             job_timeout=_job_timeout(),
         )
         print(f"[RQ] Enqueued job {job.id}")
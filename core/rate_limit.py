@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import math
+import os
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, List, Sequence, Tuple
+
+from core import cache
+
+RATE_LIMIT_LOCAL_MAX_KEYS = int(os.getenv("RATE_LIMIT_LOCAL_MAX_KEYS", "10000"))
+_PREFIX = "gates:rl:"
+
+# GCRA over several keys at once: either every limit admits the request and all are advanced, or none are.
+_GCRA_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local tats = {}
+local retry = 0
+local limited = 0
+for i, key in ipairs(KEYS) do
+  local interval = tonumber(ARGV[2 * i - 1])
+  local window = tonumber(ARGV[2 * i])
+  local tat = tonumber(redis.call('GET', key) or '0')
+  if tat < now then tat = now end
+  local new_tat = tat + interval
+  local allow_at = new_tat - window
+  if allow_at > now and allow_at - now > retry then
+    retry = allow_at - now
+    limited = i
+  end
+  tats[i] = new_tat
+end
+if limited > 0 then
+  return {limited, math.ceil(retry)}
+end
+for i, key in ipairs(KEYS) do
+  redis.call('SET', key, tats[i], 'PX', math.ceil(tats[i] - now))
+end
+return {0, 0}
+"""
+
+Limit = Tuple[str, int, float]
+
+_lock = Lock()
+_local: "OrderedDict[str, float]" = OrderedDict()
+_script = None
+_stats = {"allowed": 0, "limited": 0, "local": 0}
+
+
+class RateLimited(Exception):
+    def __init__(self, scope: str, retry_after: float) -> None:
+        super().__init__("معدل الطلبات عالي، حاول لاحقاً")
+        self.scope = scope
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+
+
+def _check_shared(client, limits: Sequence[Limit]) -> Tuple[int, float]:
+    global _script
+    if _script is None:
+        _script = client.register_script(_GCRA_SCRIPT)
+    args: List[float] = []
+    for _, max_requests, window_sec in limits:
+        window_ms = window_sec * 1000.0
+        args.extend([window_ms / max_requests, window_ms])
+    limited, retry_ms = _script(keys=[_PREFIX + key for key, _, _ in limits], args=args, client=client)
+    return int(limited), float(retry_ms) / 1000.0
+
+
+def _check_local(limits: Sequence[Limit]) -> Tuple[int, float]:
+    now = time.monotonic()
+    with _lock:
+        tats = []
+        limited, retry = 0, 0.0
+        for idx, (key, max_requests, window_sec) in enumerate(limits, start=1):
+            interval = window_sec / max_requests
+            tat = max(_local.get(key, now), now)
+            allow_at = tat + interval - window_sec
+            if allow_at > now and allow_at - now > retry:
+                limited, retry = idx, allow_at - now
+            tats.append(tat + interval)
+        if limited:
+            return limited, retry
+        for (key, _, _), tat in zip(limits, tats):
+            _local[key] = tat
+            _local.move_to_end(key)
+        # Oldest-touched keys go first; an evicted key simply starts with a full allowance again.
+        while len(_local) > RATE_LIMIT_LOCAL_MAX_KEYS:
+            _local.popitem(last=False)
+    return 0, 0.0
+
+
+def check(limits: Sequence[Limit]) -> None:
+    limits = [item for item in limits if item[1] > 0 and item[2] > 0]
+    if not limits:
+        return
+    result = None
+    client = cache.redis_client()
+    if client is not None:
+        try:
+            result = _check_shared(client, limits)
+        except Exception as exc:
+            cache.mark_redis_down(exc)
+    if result is None:
+        result = _check_local(limits)
+        with _lock:
+            _stats["local"] += 1
+    limited, retry = result
+    with _lock:
+        _stats["limited" if limited else "allowed"] += 1
+    if limited:
+        raise RateLimited(limits[limited - 1][0].split(":", 1)[0], retry)
+
+
+def stats() -> Dict[str, int]:
+    with _lock:
+        return {**_stats, "local_keys": len(_local)}
@@ -1,9 +1,75 @@
 from __future__ import annotations
 
 import os
+import time
+from threading import Lock
+from typing import Dict, Optional
 
 from core import db
 
+SETTINGS_VERSION_FILE = db.BASE_DIR / "data" / "settings.version"
+SETTINGS_CHECK_INTERVAL_SEC = float(os.getenv("SETTINGS_CHECK_INTERVAL_SEC", "1"))
+
+_reload_lock = Lock()
+_snapshot: Optional[Dict[str, str]] = None
+_snapshot_version: Optional[str] = None
+_next_check = 0.0
+
+
+def _get_version() -> str:
+    # Compare the token itself: several writes can land within one mtime tick.
+    try:
+        return SETTINGS_VERSION_FILE.read_text().strip()
+    except Exception:
+        return ""
+
+
+def _bump_version() -> None:
+    global _next_check
+    try:
+        SETTINGS_VERSION_FILE.parent.mkdir(parents=True, exist_ok=True)
+        SETTINGS_VERSION_FILE.write_text(f"{time.time_ns()}-{os.getpid()}")
+    except Exception as exc:
+        print(f"[SETTINGS] Failed to bump version: {exc}")
+    _next_check = 0.0
+
+
+def _refresh() -> Dict[str, str]:
+    global _snapshot, _snapshot_version, _next_check
+    with _reload_lock:
+        now = time.monotonic()
+        if _snapshot is not None and now < _next_check:
+            return _snapshot
+        version = _get_version()
+        if _snapshot is None or version != _snapshot_version:
+            try:
+                _snapshot = db.get_all_settings()
+                _snapshot_version = version
+            except Exception as exc:
+                if _snapshot is None:
+                    raise
+                print(f"[SETTINGS] Reload failed, keeping previous snapshot: {exc}")
+        _next_check = now + SETTINGS_CHECK_INTERVAL_SEC
+        return _snapshot
+
+
+def _get(key: str, default: Optional[str] = None) -> Optional[str]:
+    # Hot path: a dict lookup on the current snapshot, no lock and no DB round trip.
+    snapshot = _snapshot
+    if snapshot is None or time.monotonic() >= _next_check:
+        snapshot = _refresh()
+    return snapshot.get(key, default)
+
+
+def _set(key: str, value: str) -> None:
+    global _snapshot
+    db.set_setting(key, value)
+    with _reload_lock:
+        # This worker sees its own write even if the version file cannot be written.
+        if _snapshot is not None:
+            _snapshot = {**_snapshot, key: value}
+    _bump_version()
+
 
 def _to_bool(value: str, default: bool = False) -> bool:
     if value is None:
@@ -17,25 +83,34 @@ def _to_bool(value: str, default: bool = False) -> bool:
 
 
 def get_docai_grayscale() -> bool:
-    raw = db.get_setting("docai_grayscale", "0")
+    raw = _get("docai_grayscale", "0")
     return _to_bool(raw, default=False)
 
 
 def set_docai_grayscale(enabled: bool) -> None:
-    db.set_setting("docai_grayscale", "1" if enabled else "0")
+    _set("docai_grayscale", "1" if enabled else "0")
+
+
+def get_docai_mosaic() -> bool:
+    raw = _get("docai_mosaic", "0")
+    return _to_bool(raw, default=False)
+
+
+def set_docai_mosaic(enabled: bool) -> None:
+    _set("docai_mosaic", "1" if enabled else "0")
 
 
 def get_face_match_enabled() -> bool:
-    raw = db.get_setting("face_match_enabled", "1")
+    raw = _get("face_match_enabled", "1")
     return _to_bool(raw, default=True)
 
 
 def set_face_match_enabled(enabled: bool) -> None:
-    db.set_setting("face_match_enabled", "1" if enabled else "0")
+    _set("face_match_enabled", "1" if enabled else "0")
 
 
 def get_face_match_threshold() -> float:
-    raw = db.get_setting("face_match_threshold", "0.35")
+    raw = _get("face_match_threshold", "0.35")
     try:
         value = float(raw)
     except (TypeError, ValueError):
@@ -45,11 +120,11 @@ def get_face_match_threshold() -> float:
 
 def set_face_match_threshold(value: float) -> None:
     safe = max(0.2, min(float(value), 0.9))
-    db.set_setting("face_match_threshold", f"{safe:.3f}")
+    _set("face_match_threshold", f"{safe:.3f}")
 
 
 def get_docai_max_dim() -> int:
-    raw = db.get_setting("docai_max_dim")
+    raw = _get("docai_max_dim")
     if raw is None:
         raw = os.getenv("DOC_AI_MAX_DIM", "1600")
     try:
@@ -61,11 +136,11 @@ def get_docai_max_dim() -> int:
 
 def set_docai_max_dim(value: int) -> None:
     safe = max(640, min(int(value), 3000))
-    db.set_setting("docai_max_dim", str(safe))
+    _set("docai_max_dim", str(safe))
 
 
 def get_docai_jpeg_quality() -> int:
-    raw = db.get_setting("docai_jpeg_quality")
+    raw = _get("docai_jpeg_quality")
     if raw is None:
         raw = os.getenv("DOC_AI_JPEG_QUALITY", "85")
     try:
@@ -77,4 +152,69 @@ def get_docai_jpeg_quality() -> int:
 
 def set_docai_jpeg_quality(value: int) -> None:
     safe = max(50, min(int(value), 95))
-    db.set_setting("docai_jpeg_quality", str(safe))
+    _set("docai_jpeg_quality", str(safe))
+
+
+def get_quality_gate_enabled() -> bool:
+    raw = _get("quality_gate_enabled", "0")
+    return _to_bool(raw, default=False)
+
+
+def set_quality_gate_enabled(enabled: bool) -> None:
+    _set("quality_gate_enabled", "1" if enabled else "0")
+
+
+def get_quality_min_sharpness() -> float:
+    raw = _get("quality_min_sharpness", "25")
+    try:
+        value = float(raw)
+    except (TypeError, ValueError):
+        value = 25.0
+    return max(0.0, min(value, 1000.0))
+
+
+def set_quality_min_sharpness(value: float) -> None:
+    safe = max(0.0, min(float(value), 1000.0))
+    _set("quality_min_sharpness", f"{safe:.1f}")
+
+
+def get_quality_max_glare() -> float:
+    raw = _get("quality_max_glare", "0.25")
+    try:
+        value = float(raw)
+    except (TypeError, ValueError):
+        value = 0.25
+    return max(0.01, min(value, 1.0))
+
+
+def set_quality_max_glare(value: float) -> None:
+    safe = max(0.01, min(float(value), 1.0))
+    _set("quality_max_glare", f"{safe:.3f}")
+
+
+def get_quality_min_brightness() -> int:
+    raw = _get("quality_min_brightness", "35")
+    try:
+        value = int(float(raw))
+    except (TypeError, ValueError):
+        value = 35
+    return max(0, min(value, 128))
+
+
+def set_quality_min_brightness(value: int) -> None:
+    safe = max(0, min(int(value), 128))
+    _set("quality_min_brightness", str(safe))
+
+
+def get_quality_max_brightness() -> int:
+    raw = _get("quality_max_brightness", "225")
+    try:
+        value = int(float(raw))
+    except (TypeError, ValueError):
+        value = 225
+    return max(128, min(value, 255))
+
+
+def set_quality_max_brightness(value: int) -> None:
+    safe = max(128, min(int(value), 255))
+    _set("quality_max_brightness", str(safe))
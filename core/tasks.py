@@ -12,7 +12,9 @@ except Exception:
 
 from core import db, face_match
 from core import media
-from core.ocr_pipeline import run_security_scan
+from core import metrics
+from core import telemetry
+from core.ocr_pipeline import ScanResult, run_security_scan, run_security_scan_from_assets
 
 import cv2
 import numpy as np
@@ -20,20 +22,62 @@ import numpy as np
 db.init_db()
 
 
+def _known_name(national_id: str) -> str:
+    person = db.get_person_by_nid(national_id)
+    if not person:
+        return ""
+    return (person.get("full_name") or "").strip()
+
+
+def _registration_scan(
+    raw_file: Optional[Path],
+    original_card_filename: Optional[str],
+    artifacts_key: Optional[str],
+) -> Optional[ScanResult]:
+    if artifacts_key:
+        artifacts = media.load_scan_artifacts(artifacts_key)
+        if artifacts is not None:
+            return run_security_scan_from_assets(
+                artifacts["card_image"],
+                artifacts["fields"],
+                artifacts["card_bbox"],
+                artifacts["photo_image"],
+                name_for_nid=_known_name,
+            )
+        print(f"[RQ] Scan artifacts missing for {artifacts_key}, rescanning upload.")
+
+    # JPEG uploads are stored once as the original card image, so there is no raw copy to read.
+    source_file = raw_file
+    if source_file is None and original_card_filename:
+        source_file = media.CARD_DIR / original_card_filename
+    if source_file is None:
+        print("[RQ] No upload to process, skipping registration.")
+        return None
+    try:
+        image_bytes = source_file.read_bytes()
+    except Exception as exc:
+        print(f"[RQ] Failed to read raw upload: {exc}")
+        return None
+    return run_security_scan(image_bytes, skip_face_match=True, name_for_nid=_known_name)
+
+
 def register_person_job(
-    raw_path: str,
+    raw_path: Optional[str],
     original_card_filename: Optional[str],
     placeholder_nid: Optional[str] = None,
     gate_number: Optional[int] = None,
+    artifacts_key: Optional[str] = None,
 ) -> None:
-    raw_file = Path(raw_path)
-    try:
-        image_bytes = raw_file.read_bytes()
-    except Exception as exc:
-        print(f"[RQ] Failed to read raw upload: {exc}")
-        return
+    raw_file = Path(raw_path) if raw_path else None
     try:
-        scan = run_security_scan(image_bytes, skip_face_match=True)
+        scan = _registration_scan(raw_file, original_card_filename, artifacts_key)
+        if scan is None:
+            return
+        outcome = scan.error_code or ("error" if scan.error else "ok")
+        metrics.observe_scan(scan.timings, outcome, path="registration")
+        metrics.flush()
+        telemetry.record_scan(scan.timings, outcome, gate_number=gate_number, path="registration")
+        telemetry.flush()
         if scan.error:
             print(f"[RQ] OCR failed: {scan.error}")
         if scan.photo_image is None:
@@ -74,18 +118,17 @@ def register_person_job(
         if national_id:
             existing = db.get_person_by_nid(national_id)
             if existing and (not placeholder or existing.get("national_id") != placeholder_nid):
-                db.increment_visit(national_id)
-                db.update_name_if_missing(national_id, full_name)
-                db.update_gate_number_if_missing(national_id, effective_gate)
-                if photo_filename or card_filename or embedding_blob:
-                    db.update_media(
-                        national_id,
-                        photo_path=photo_filename,
-                        card_path=card_filename,
-                        face_embedding=embedding_blob,
-                    )
-                    if embedding_blob:
-                        face_match.mark_index_dirty()
+                db.record_visit(
+                    national_id,
+                    photo_path=photo_filename,
+                    card_path=card_filename,
+                    face_embedding=embedding_blob,
+                    gate_number=effective_gate,
+                    full_name=full_name,
+                    fetch=False,
+                )
+                if embedding_blob:
+                    face_match.mark_index_dirty()
                 if placeholder:
                     db.delete_person(placeholder_nid)
                 return
@@ -96,29 +139,32 @@ def register_person_job(
                         placeholder_nid,
                         full_name=full_name or None,
                         new_national_id=national_id,
+                        fetch=False,
                     )
                 except ValueError:
-                    db.update_name_if_missing(national_id, full_name)
-                    db.update_gate_number_if_missing(national_id, effective_gate)
+                    db.update_name_if_missing(national_id, full_name, fetch=False)
+                    db.update_gate_number_if_missing(national_id, effective_gate, fetch=False)
                     if photo_filename or card_filename or embedding_blob:
                         db.update_media(
                             national_id,
                             photo_path=photo_filename,
                             card_path=card_filename,
                             face_embedding=embedding_blob,
+                            fetch=False,
                         )
                     if embedding_blob:
                         face_match.mark_index_dirty()
                     if placeholder:
                         db.delete_person(placeholder_nid)
                     return
-                db.update_gate_number_if_missing(national_id, effective_gate)
+                db.update_gate_number_if_missing(national_id, effective_gate, fetch=False)
                 if photo_filename or card_filename or embedding_blob:
                     db.update_media(
                         national_id,
                         photo_path=photo_filename,
                         card_path=card_filename,
                         face_embedding=embedding_blob,
+                        fetch=False,
                     )
                 if embedding_blob:
                     face_match.mark_index_dirty()
@@ -131,6 +177,7 @@ def register_person_job(
                 card_filename,
                 embedding_blob,
                 gate_number=effective_gate,
+                fetch=False,
             )
             if embedding_blob:
                 face_match.mark_index_dirty()
@@ -138,14 +185,15 @@ def register_person_job(
 
         if placeholder and placeholder_nid:
             if full_name:
-                db.update_name_if_missing(placeholder_nid, full_name)
-            db.update_gate_number_if_missing(placeholder_nid, effective_gate)
+                db.update_name_if_missing(placeholder_nid, full_name, fetch=False)
+            db.update_gate_number_if_missing(placeholder_nid, effective_gate, fetch=False)
             if photo_filename or card_filename or embedding_blob:
                 db.update_media(
                     placeholder_nid,
                     photo_path=photo_filename,
                     card_path=card_filename,
                     face_embedding=embedding_blob,
+                    fetch=False,
                 )
                 if embedding_blob:
                     face_match.mark_index_dirty()
@@ -159,14 +207,17 @@ def register_person_job(
             card_filename,
             embedding_blob,
             gate_number=effective_gate,
+            fetch=False,
         )
         if embedding_blob:
             face_match.mark_index_dirty()
     finally:
-        try:
-            raw_file.unlink()
-        except Exception:
-            pass
+        if raw_file is not None:
+            try:
+                raw_file.unlink()
+            except Exception:
+                pass
+        media.delete_scan_artifacts(artifacts_key)
 
 
 def reprocess_person_job(national_id: str, direction: str) -> None:
@@ -235,6 +286,7 @@ def reprocess_person_job(national_id: str, direction: str) -> None:
                 national_id,
                 full_name=full_name or None,
                 new_national_id=ocr_nid,
+                fetch=False,
             )
             target_nid = ocr_nid
         except ValueError:
@@ -242,9 +294,9 @@ def reprocess_person_job(national_id: str, direction: str) -> None:
             update_nid = False
             target_nid = national_id
             if full_name:
-                db.update_person(national_id, full_name=full_name)
+                db.update_person(national_id, full_name=full_name, fetch=False)
     elif full_name:
-        db.update_person(national_id, full_name=full_name)
+        db.update_person(national_id, full_name=full_name, fetch=False)
 
     new_card_filename = media.save_card_image(rotated, target_nid)
     new_photo_filename = None
@@ -259,8 +311,9 @@ def reprocess_person_job(national_id: str, direction: str) -> None:
         photo_path=new_photo_filename,
         card_path=new_card_filename,
         face_embedding=embedding_blob,
+        fetch=False,
     )
-    db.update_gate_number_if_missing(target_nid, 1)
+    db.update_gate_number_if_missing(target_nid, 1, fetch=False)
 
     if embedding_blob:
         face_match.mark_index_dirty()
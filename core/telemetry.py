@@ -0,0 +1,252 @@
+from __future__ import annotations
+
+import atexit
+import datetime
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from threading import Event, Lock
+from typing import Any, Dict, List, Optional, Tuple
+
+from core import db
+from core import metrics
+
+TELEMETRY_ENABLED = os.getenv("TELEMETRY_ENABLED", "1").strip().lower() in {"1", "true", "yes", "on"}
+TELEMETRY_FLUSH_SEC = float(os.getenv("TELEMETRY_FLUSH_SEC", "5"))
+TELEMETRY_BATCH_SIZE = int(os.getenv("TELEMETRY_BATCH_SIZE", "200"))
+TELEMETRY_BUFFER_MAX = int(os.getenv("TELEMETRY_BUFFER_MAX", "10000"))
+SCAN_EVENTS_RETENTION_DAYS = int(os.getenv("SCAN_EVENTS_RETENTION_DAYS", "90"))
+PURGE_INTERVAL_SEC = 3600
+
+BUCKETS_MS = (
+    1, 2, 3, 5, 7, 10, 15, 20, 30, 40, 50, 75, 100, 150, 200, 300, 400, 500,
+    750, 1000, 1500, 2000, 3000, 4000, 5000, 7500, 10000, 15000, 20000, 30000, 60000,
+)
+PERCENTILES = (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))
+
+_lock = Lock()
+_buffer: deque = deque()
+_wakeup = Event()
+_writer: Optional[threading.Thread] = None
+_writer_pid: Optional[int] = None
+_stats = {"written": 0, "dropped": 0, "flush_errors": 0}
+
+
+def _bucket_start(created_at: datetime.datetime) -> str:
+    return created_at.strftime("%Y-%m-%dT%H:00:00")
+
+
+def record_scan(
+    timings: Dict[str, float],
+    outcome: str,
+    gate_number: Optional[int] = None,
+    path: str = "match",
+    match_score: Optional[float] = None,
+    image_bytes: Optional[int] = None,
+    image_size: Optional[Tuple[int, int]] = None,
+) -> None:
+    if not TELEMETRY_ENABLED:
+        return
+    event = {
+        "created_at": datetime.datetime.utcnow(),
+        "gate_number": gate_number,
+        "path": path,
+        "outcome": outcome or "unknown",
+        "match_score": match_score,
+        "image_bytes": image_bytes,
+        "image_size": image_size,
+        "timings": {key: round(float(value), 2) for key, value in timings.items() if key.endswith("_ms")},
+    }
+    with _lock:
+        if len(_buffer) >= TELEMETRY_BUFFER_MAX:
+            _buffer.popleft()
+            _stats["dropped"] += 1
+        _buffer.append(event)
+        full = len(_buffer) >= TELEMETRY_BATCH_SIZE
+    _ensure_writer()
+    if full:
+        _wakeup.set()
+
+
+def _ensure_writer() -> None:
+    global _writer, _writer_pid
+    pid = os.getpid()
+    if _writer is not None and _writer_pid == pid:
+        return
+    with _lock:
+        if _writer is not None and _writer_pid == pid:
+            return
+        _writer = threading.Thread(target=_run_writer, name="telemetry-writer", daemon=True)
+        _writer_pid = pid
+        _writer.start()
+
+
+def _run_writer() -> None:
+    last_purge = 0.0
+    while True:
+        _wakeup.wait(TELEMETRY_FLUSH_SEC)
+        _wakeup.clear()
+        flush()
+        if time.monotonic() - last_purge >= PURGE_INTERVAL_SEC:
+            last_purge = time.monotonic()
+            _purge_old_events()
+
+
+def _purge_old_events() -> None:
+    if SCAN_EVENTS_RETENTION_DAYS <= 0:
+        return
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=SCAN_EVENTS_RETENTION_DAYS)
+    try:
+        removed = db.purge_scan_events(cutoff.isoformat())
+        if removed:
+            print(f"[TELEMETRY] Purged {removed} scan events older than {SCAN_EVENTS_RETENTION_DAYS} days")
+    except Exception as exc:
+        print(f"[TELEMETRY] Purge failed: {exc}")
+
+
+def flush() -> None:
+    with _lock:
+        batch = list(_buffer)
+        _buffer.clear()
+    if not batch:
+        return
+    events: List[Tuple[Any, ...]] = []
+    buckets: Dict[Tuple[str, str, int, str, int], List[float]] = {}
+    for event in batch:
+        timings = event["timings"]
+        width, height = event["image_size"] or (None, None)
+        total_ms = timings.get("request_ms", timings.get("total_ms"))
+        events.append(
+            (
+                event["created_at"].isoformat(),
+                event["gate_number"],
+                event["path"],
+                event["outcome"],
+                event["match_score"],
+                event["image_bytes"],
+                width,
+                height,
+                total_ms,
+                json.dumps(timings),
+            )
+        )
+        bucket_start = _bucket_start(event["created_at"])
+        gate = event["gate_number"] if event["gate_number"] is not None else 0
+        for key, value in timings.items():
+            if key not in metrics.SCAN_STAGES:
+                continue
+            item_key = (bucket_start, event["path"], gate, key[:-3], bisect_left(BUCKETS_MS, value))
+            item = buckets.setdefault(item_key, [0, 0.0])
+            item[0] += 1
+            item[1] += value
+    rows = [(*key, int(item[0]), float(item[1])) for key, item in buckets.items()]
+    try:
+        db.insert_scan_telemetry(events, rows)
+        with _lock:
+            _stats["written"] += len(events)
+    except Exception as exc:
+        with _lock:
+            _stats["flush_errors"] += 1
+        print(f"[TELEMETRY] Flush failed, dropped {len(events)} events: {exc}")
+
+
+atexit.register(flush)
+
+
+def stats() -> Dict[str, int]:
+    with _lock:
+        return {**_stats, "buffered": len(_buffer)}
+
+
+def _bucket_bounds(idx: int) -> Tuple[float, float]:
+    lower = float(BUCKETS_MS[idx - 1]) if idx > 0 else 0.0
+    upper = float(BUCKETS_MS[idx]) if idx < len(BUCKETS_MS) else float(BUCKETS_MS[-1])
+    return lower, upper
+
+
+def percentiles(hist: Dict[int, int]) -> Dict[str, Optional[float]]:
+    total = sum(hist.values())
+    result: Dict[str, Optional[float]] = {}
+    for name, q in PERCENTILES:
+        if total <= 0:
+            result[name] = None
+            continue
+        target = q * total
+        seen = 0
+        for idx in sorted(hist):
+            count = hist[idx]
+            if seen + count >= target:
+                lower, upper = _bucket_bounds(idx)
+                fraction = (target - seen) / count if count else 0.0
+                result[name] = round(lower + (upper - lower) * fraction, 1)
+                break
+            seen += count
+    return result
+
+
+def _summarize(rows: List[Dict[str, Any]], key: str) -> List[Dict[str, Any]]:
+    grouped: Dict[Any, Dict[str, Any]] = {}
+    for row in rows:
+        item = grouped.setdefault(row[key], {"hist": {}, "count": 0, "sum_ms": 0.0})
+        item["hist"][row["le_idx"]] = item["hist"].get(row["le_idx"], 0) + row["hits"]
+        item["count"] += row["hits"]
+        item["sum_ms"] += row["sum_ms"]
+    summary = []
+    for name, item in grouped.items():
+        summary.append(
+            {
+                key: name,
+                "count": item["count"],
+                "avg_ms": round(item["sum_ms"] / item["count"], 1) if item["count"] else None,
+                **percentiles(item["hist"]),
+            }
+        )
+    return summary
+
+
+def dashboard(
+    since: datetime.datetime,
+    until: datetime.datetime,
+    gate_number: Optional[int] = None,
+    path: str = "match",
+    stage: str = "request",
+) -> Dict[str, Any]:
+    # Hourly rollups keep these queries proportional to hours x stages, not to scans.
+    flush()
+    since = since.replace(minute=0, second=0, microsecond=0)
+    since_text = since.strftime("%Y-%m-%dT%H:%M:%S")
+    until_text = until.strftime("%Y-%m-%dT%H:%M:%S")
+    stage_rows = db.get_scan_stage_histogram(since_text, until_text, path=path, gate_number=gate_number)
+    stages = sorted(_summarize(stage_rows, "stage"), key=lambda item: -(item["avg_ms"] or 0))
+    if not any(item["stage"] == stage for item in stages):
+        stage = "total"
+    gate_rows = db.get_scan_stage_histogram(
+        since_text, until_text, path=path, gate_number=gate_number, by_gate=True, stage=stage
+    )
+    gates = sorted(_summarize(gate_rows, "gate_number"), key=lambda item: item["gate_number"] or 0)
+    daily = until - since > datetime.timedelta(days=3)
+    series_rows = db.get_scan_stage_series(
+        since_text, until_text, stage, path=path, gate_number=gate_number, daily=daily
+    )
+    series_hist: Dict[str, Dict[int, int]] = {}
+    for row in series_rows:
+        series_hist.setdefault(row["bucket"], {})[row["le_idx"]] = row["hits"]
+    series = [
+        {"bucket": bucket, "count": sum(hist.values()), **percentiles(hist)}
+        for bucket, hist in sorted(series_hist.items())
+    ]
+    return {
+        "since": since_text,
+        "until": until_text,
+        "stage": stage,
+        "granularity": "day" if daily else "hour",
+        "stages": stages,
+        "gates": gates,
+        "series": series,
+        "outcomes": db.get_scan_outcomes(since_text, until_text, path=path, gate_number=gate_number),
+        "events": db.get_scan_events(since_text, until_text, path=path, gate_number=gate_number),
+        "writer": stats(),
+    }
@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import os
+import shlex
+import threading
+from threading import Lock
+from time import perf_counter
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+import pytesseract
+
+try:
+    import tesserocr
+except Exception:  # pragma: no cover - optional in dev
+    tesserocr = None
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+TESSDATA_DIR = BASE_DIR / "tessdata"
+
+_local = threading.local()
+_failed_keys: set = set()
+_stats_lock = Lock()
+_stats: Dict[str, Dict[str, float]] = {}
+
+
+def _engine_mode() -> str:
+    return os.getenv("TESS_ENGINE", "auto").strip().lower() or "auto"
+
+
+def engine_name() -> str:
+    if _engine_mode() == "subprocess" or tesserocr is None:
+        return "subprocess"
+    return "tesserocr"
+
+
+def _parse_config(config: str) -> Tuple[int, Tuple[Tuple[str, str], ...]]:
+    psm = 3
+    variables = []
+    tokens = shlex.split(config or "")
+    idx = 0
+    while idx < len(tokens):
+        token = tokens[idx]
+        if token == "--psm" and idx + 1 < len(tokens):
+            psm = int(tokens[idx + 1])
+            idx += 2
+            continue
+        if token == "-c" and idx + 1 < len(tokens) and "=" in tokens[idx + 1]:
+            name, value = tokens[idx + 1].split("=", 1)
+            variables.append((name, value))
+            idx += 2
+            continue
+        idx += 1
+    return psm, tuple(variables)
+
+
+def _tessdata_path() -> Optional[str]:
+    if TESSDATA_DIR.exists():
+        return str(TESSDATA_DIR) + os.sep
+    return None
+
+
+def _get_api(lang: str, psm: int, variables: Tuple[Tuple[str, str], ...]):
+    apis = getattr(_local, "apis", None)
+    if apis is None:
+        apis = {}
+        _local.apis = apis
+    key = (lang, psm, variables)
+    api = apis.get(key)
+    if api is not None:
+        return api
+    if key in _failed_keys:
+        return None
+    try:
+        path = _tessdata_path()
+        if path:
+            api = tesserocr.PyTessBaseAPI(path=path, lang=lang, psm=psm)
+        else:
+            api = tesserocr.PyTessBaseAPI(lang=lang, psm=psm)
+        for name, value in variables:
+            api.SetVariable(name, value)
+    except Exception as exc:
+        print(f"[TESSERACT] In-process init failed for lang={lang} psm={psm}: {exc}")
+        _failed_keys.add(key)
+        return None
+    apis[key] = api
+    return api
+
+
+def _set_image(api: Any, image: np.ndarray) -> None:
+    if image.ndim == 2:
+        buffer = np.ascontiguousarray(image, dtype=np.uint8)
+        bytes_per_pixel = 1
+    else:
+        buffer = np.ascontiguousarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB), dtype=np.uint8)
+        bytes_per_pixel = 3
+    height, width = buffer.shape[:2]
+    api.SetImageBytes(buffer.tobytes(), width, height, bytes_per_pixel, width * bytes_per_pixel)
+
+
+def _record(engine: str, elapsed_ms: float) -> None:
+    with _stats_lock:
+        item = _stats.setdefault(engine, {"calls": 0, "total_ms": 0.0})
+        item["calls"] += 1
+        item["total_ms"] += elapsed_ms
+
+
+def stats() -> Dict[str, Dict[str, float]]:
+    with _stats_lock:
+        return {
+            engine: {
+                "calls": item["calls"],
+                "avg_ms": round(item["total_ms"] / item["calls"], 2) if item["calls"] else 0.0,
+            }
+            for engine, item in _stats.items()
+        }
+
+
+def _subprocess_text(image: np.ndarray, lang: str, config: str) -> str:
+    if TESSDATA_DIR.exists():
+        config = f"{config} --tessdata-dir {TESSDATA_DIR}".strip()
+    return pytesseract.image_to_string(image, lang=lang, config=config)
+
+
+def image_to_text(image: np.ndarray, lang: str, config: str = "") -> str:
+    t0 = perf_counter()
+    text = None
+    engine = "subprocess"
+    if engine_name() == "tesserocr":
+        psm, variables = _parse_config(config)
+        api = _get_api(lang, psm, variables)
+        if api is not None:
+            engine = "tesserocr"
+            try:
+                _set_image(api, image)
+                text = api.GetUTF8Text()
+            finally:
+                api.Clear()
+    if text is None:
+        text = _subprocess_text(image, lang, config)
+    _record(engine, (perf_counter() - t0) * 1000)
+    return (text or "").strip()
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from starlette.requests import Request  # noqa: E402
+
+import app as gates_app  # noqa: E402
+
+CHUNK_SIZE = 64 * 1024
+
+
+def _request(body: bytes, content_type: str) -> Request:
+    chunks = [body[i : i + CHUNK_SIZE] for i in range(0, len(body), CHUNK_SIZE)] or [b""]
+    state = {"idx": 0}
+
+    async def receive() -> dict:
+        idx = state["idx"]
+        state["idx"] += 1
+        if idx >= len(chunks):
+            return {"type": "http.disconnect"}
+        return {"type": "http.request", "body": chunks[idx], "more_body": idx < len(chunks) - 1}
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/",
+        "query_string": b"",
+        "headers": [
+            (b"content-type", content_type.encode()),
+            (b"content-length", str(len(body)).encode()),
+        ],
+    }
+    return Request(scope, receive)
+
+
+async def _parse_base64(body: bytes) -> int:
+    request = _request(body, "application/json")
+    payload = gates_app.Base64ScanRequest(**(await request.json()))
+    return len(gates_app._decode_base64_image(payload.image_base64))
+
+
+async def _parse_binary(body: bytes) -> int:
+    request = _request(body, "application/octet-stream")
+    image_bytes, _ = await gates_app._read_binary_upload(request)
+    return len(image_bytes)
+
+
+def _measure(label: str, parse, body: bytes, rounds: int) -> None:
+    durations = []
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        asyncio.run(parse(body))
+        durations.append((time.perf_counter() - t0) * 1000)
+    tracemalloc.start()
+    asyncio.run(parse(body))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{label:<8} wire={len(body) / 1024:.0f}KB "
+        f"p50={statistics.median(durations):.2f}ms max={max(durations):.2f}ms "
+        f"peak_alloc={peak / (1024 * 1024):.2f}MB"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare scan-base64 and binary upload parsing cost.")
+    parser.add_argument("image", nargs="?", help="JPEG to send (random bytes when omitted)")
+    parser.add_argument("--size-kb", type=int, default=1500)
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    image_bytes = Path(args.image).read_bytes() if args.image else b"\xff\xd8\xff" + os.urandom(args.size_kb * 1024)
+    json_body = json.dumps({"image_base64": base64.b64encode(image_bytes).decode(), "gate_number": 1}).encode()
+    print(f"image={len(image_bytes) / 1024:.0f}KB rounds={args.rounds}")
+    _measure("base64", _parse_base64, json_body, args.rounds)
+    _measure("binary", _parse_binary, image_bytes, args.rounds)
+
+
+if __name__ == "__main__":
+    main()
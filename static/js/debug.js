@@ -255,6 +255,20 @@ async function sendImage(blob) {
   }
 }
 
+function qualityRows(quality) {
+  if (!quality) {
+    return "";
+  }
+  const sharpness = Number(quality.sharpness);
+  const glare = Number(quality.glare_ratio);
+  const brightness = Number(quality.brightness);
+  return `
+    <div class="field-item"><strong>الوضوح:</strong> <span>${Number.isFinite(sharpness) ? sharpness.toFixed(1) : "—"}</span></div>
+    <div class="field-item"><strong>الانعكاس:</strong> <span>${Number.isFinite(glare) ? (glare * 100).toFixed(1) + "%" : "—"}</span></div>
+    <div class="field-item"><strong>الإضاءة:</strong> <span>${Number.isFinite(brightness) ? brightness.toFixed(0) : "—"}</span></div>
+  `;
+}
+
 function renderDebug(data) {
   const timings = data.timings || {};
   if (data.debug_image_url) {
@@ -274,6 +288,7 @@ function renderDebug(data) {
     const message = data.message || "تعذر تحليل الصورة";
     debugFinal.innerHTML = `
       <div class="field-item"><strong>النتيجة:</strong> <span>${message}</span></div>
+      ${qualityRows(data.quality)}
     `;
     debugTess.innerHTML = "—";
     debugFields.innerHTML = "—";
@@ -283,14 +298,18 @@ function renderDebug(data) {
       total_ms: "الإجمالي",
       model_load_ms: "تحميل الموديلات",
       decode_ms: "قراءة الصورة",
+      quality_check_ms: "فحص الجودة",
       detect_card_ms: "اكتشاف البطاقة",
       detect_fields_ms: "اكتشاف الحقول",
+      detect_fields_saved_ms: "توفير اكتشاف الحقول",
+      speculative_face_ms: "قص الوجه الثابت",
       extract_photo_ms: "استخراج الوجه",
       face_embedding_ms: "بصمة الوجه",
       face_match_ms: "مطابقة الوجه",
       docai_ms: "Document AI",
       tesseract_nid_ms: "Tesseract الرقم",
-      tesseract_name_ms: "Tesseract الاسم"
+      tesseract_name_ms: "Tesseract الاسم",
+      tesseract_fields_ms: "Tesseract الحقول"
     };
     const timingEntries = Object.entries(timings);
     if (timingEntries.length) {
@@ -314,11 +333,13 @@ function renderDebug(data) {
   debugFinal.innerHTML = `
     <div class="field-item"><strong>الاسم:</strong> <span>${final.full_name || "—"}</span></div>
     <div class="field-item"><strong>الرقم القومي:</strong> <span>${final.national_id || "—"}</span></div>
+    ${qualityRows(data.quality)}
   `;
 
   debugTess.innerHTML = `
     <div class="field-item"><strong>الرقم الخام:</strong> <span>${tess.national_id_raw || "—"}</span></div>
     <div class="field-item"><strong>الاسم الخام:</strong> <span>${tess.full_name_raw || "—"}</span></div>
+    <div class="field-item"><strong>المحرك:</strong> <span>${tess.engine || "—"}</span></div>
   `;
 
   if (docaiEntities.length) {
@@ -333,14 +354,18 @@ function renderDebug(data) {
     total_ms: "الإجمالي",
     model_load_ms: "تحميل الموديلات",
     decode_ms: "قراءة الصورة",
+    quality_check_ms: "فحص الجودة",
     detect_card_ms: "اكتشاف البطاقة",
     detect_fields_ms: "اكتشاف الحقول",
+    detect_fields_saved_ms: "توفير اكتشاف الحقول",
+    speculative_face_ms: "قص الوجه الثابت",
     extract_photo_ms: "استخراج الوجه",
     face_embedding_ms: "بصمة الوجه",
     face_match_ms: "مطابقة الوجه",
     docai_ms: "Document AI",
     tesseract_nid_ms: "Tesseract الرقم",
-    tesseract_name_ms: "Tesseract الاسم"
+    tesseract_name_ms: "Tesseract الاسم",
+    tesseract_fields_ms: "Tesseract الحقول"
   };
 
   const timingEntries = Object.entries(timings);
@@ -1,4 +1,5 @@
 const toggle = document.getElementById("docaiGrayscaleToggle");
+const mosaicToggle = document.getElementById("docaiMosaicToggle");
 const faceToggle = document.getElementById("faceMatchToggle");
 const thresholdInput = document.getElementById("faceMatchThreshold");
 const thresholdValue = document.getElementById("faceMatchThresholdValue");
@@ -6,6 +7,17 @@ const maxDimInput = document.getElementById("docaiMaxDim");
 const maxDimValue = document.getElementById("docaiMaxDimValue");
 const jpegInput = document.getElementById("docaiJpegQuality");
 const jpegValue = document.getElementById("docaiJpegQualityValue");
+const qualityToggle = document.getElementById("qualityGateToggle");
+const qualityInputs = [
+  { key: "quality_min_sharpness", id: "qualityMinSharpness", min: 0, max: 1000, fallback: 25 },
+  { key: "quality_max_glare", id: "qualityMaxGlare", min: 0.01, max: 1, fallback: 0.25 },
+  { key: "quality_min_brightness", id: "qualityMinBrightness", min: 0, max: 128, fallback: 35 },
+  { key: "quality_max_brightness", id: "qualityMaxBrightness", min: 128, max: 255, fallback: 225 }
+].map(item => ({
+  ...item,
+  input: document.getElementById(item.id),
+  label: document.getElementById(`${item.id}Value`)
+})).filter(item => item.input && item.label);
 const statusEl = document.getElementById("settingsStatus");
 
 function setStatus(message, type = "") {
@@ -43,6 +55,7 @@ async function loadSettings() {
     const res = await fetch("/api/settings");
     const data = await res.json();
     toggle.checked = Boolean(data.docai_grayscale);
+    if (mosaicToggle) mosaicToggle.checked = Boolean(data.docai_mosaic);
     faceToggle.checked = Boolean(data.face_match_enabled);
     const threshold = Number(data.face_match_threshold ?? 0.35);
     setNumericField(thresholdInput, thresholdValue, threshold, "");
@@ -50,6 +63,10 @@ async function loadSettings() {
     setNumericField(maxDimInput, maxDimValue, maxDim, " px");
     const jpegQuality = Number(data.docai_jpeg_quality ?? 85);
     setNumericField(jpegInput, jpegValue, jpegQuality, "%");
+    if (qualityToggle) qualityToggle.checked = Boolean(data.quality_gate_enabled);
+    qualityInputs.forEach(item => {
+      setNumericField(item.input, item.label, Number(data[item.key] ?? item.fallback), "");
+    });
     setStatus("");
   } catch (err) {
     console.error(err);
@@ -70,6 +87,15 @@ async function saveSettings() {
   const safeThreshold = clamp(threshold, 0.2, 0.9);
   const safeMaxDim = clamp(maxDim, 640, 3000);
   const safeJpeg = clamp(jpegQuality, 50, 95);
+  const qualityValues = {};
+  for (const item of qualityInputs) {
+    const value = toNumberSafe(item.input.value);
+    if (value === null) {
+      setStatus("قيمة غير صحيحة. استخدم أرقام واضحة.", "error");
+      return;
+    }
+    qualityValues[item.key] = clamp(value, item.min, item.max);
+  }
 
   setStatus("جاري الحفظ...");
   try {
@@ -78,14 +104,18 @@ async function saveSettings() {
       headers: { "Content-Type": "application/json" },
       body: JSON.stringify({
         docai_grayscale: toggle.checked,
+        docai_mosaic: mosaicToggle ? mosaicToggle.checked : undefined,
         face_match_enabled: faceToggle.checked,
         face_match_threshold: safeThreshold,
         docai_max_dim: safeMaxDim,
-        docai_jpeg_quality: safeJpeg
+        docai_jpeg_quality: safeJpeg,
+        quality_gate_enabled: qualityToggle ? qualityToggle.checked : undefined,
+        ...qualityValues
       })
     });
     const data = await res.json();
     toggle.checked = Boolean(data.docai_grayscale);
+    if (mosaicToggle) mosaicToggle.checked = Boolean(data.docai_mosaic);
     faceToggle.checked = Boolean(data.face_match_enabled);
     const srvThreshold = Number(data.face_match_threshold ?? safeThreshold);
     const srvMaxDim = Number(data.docai_max_dim ?? safeMaxDim);
@@ -93,6 +123,10 @@ async function saveSettings() {
     setNumericField(thresholdInput, thresholdValue, srvThreshold, "");
     setNumericField(maxDimInput, maxDimValue, srvMaxDim, " px");
     setNumericField(jpegInput, jpegValue, srvJpeg, "%");
+    if (qualityToggle) qualityToggle.checked = Boolean(data.quality_gate_enabled);
+    qualityInputs.forEach(item => {
+      setNumericField(item.input, item.label, Number(data[item.key] ?? qualityValues[item.key]), "");
+    });
 
     const adjusted = (
       Math.abs(srvThreshold - safeThreshold) > 0.001 ||
@@ -110,6 +144,30 @@ toggle.addEventListener("change", () => {
   saveSettings();
 });
 
+if (mosaicToggle) {
+  mosaicToggle.addEventListener("change", () => {
+    saveSettings();
+  });
+}
+
+if (qualityToggle) {
+  qualityToggle.addEventListener("change", () => {
+    saveSettings();
+  });
+}
+
+qualityInputs.forEach(item => {
+  item.input.addEventListener("input", () => {
+    const value = toNumberSafe(item.input.value);
+    if (value !== null) {
+      item.label.textContent = String(value);
+    }
+  });
+  item.input.addEventListener("change", () => {
+    saveSettings();
+  });
+});
+
 faceToggle.addEventListener("change", () => {
   saveSettings();
 });
@@ -0,0 +1,145 @@
+const sinceInput = document.getElementById("telemetrySince");
+const untilInput = document.getElementById("telemetryUntil");
+const gateInput = document.getElementById("telemetryGate");
+const pathSelect = document.getElementById("telemetryPath");
+const refreshBtn = document.getElementById("telemetryRefreshBtn");
+const statusEl = document.getElementById("telemetryStatus");
+const outcomesEl = document.getElementById("telemetryOutcomes");
+const gateStageEl = document.getElementById("telemetryGateStage");
+const stagesBody = document.querySelector("#telemetryStagesTable tbody");
+const gatesBody = document.querySelector("#telemetryGatesTable tbody");
+const seriesBody = document.querySelector("#telemetrySeriesTable tbody");
+const eventsBody = document.querySelector("#telemetryEventsTable tbody");
+
+const stageLabels = {
+  request: "الطلب كامل",
+  total: "الإجمالي",
+  model_load: "تحميل الموديلات",
+  upload_read: "استلام الجسم",
+  decode: "قراءة الصورة",
+  persist_upload: "حفظ الصورة",
+  media_queue: "جدولة حفظ الصور",
+  record_visit: "تسجيل الزيارة",
+  quality_check: "فحص الجودة",
+  detect_card: "اكتشاف البطاقة",
+  detect_fields: "اكتشاف الحقول",
+  speculative_face: "قص الوجه الثابت",
+  extract_photo: "استخراج الوجه",
+  face_embedding: "بصمة الوجه",
+  face_match: "مطابقة الوجه",
+  docai: "Document AI",
+  tesseract_wait: "انتظار Tesseract",
+  tesseract_nid: "Tesseract الرقم",
+  tesseract_name: "Tesseract الاسم",
+  inference_wait: "انتظار المعالجة",
+  inference_decode: "قراءة الصورة (المعالجة)"
+};
+
+function setStatus(message, type = "") {
+  statusEl.textContent = message;
+  statusEl.className = `settings-status ${type}`.trim();
+}
+
+function toLocalInput(date) {
+  const pad = (value) => String(value).padStart(2, "0");
+  return `${date.getFullYear()}-${pad(date.getMonth() + 1)}-${pad(date.getDate())}T${pad(date.getHours())}:${pad(date.getMinutes())}`;
+}
+
+function formatMs(value) {
+  const num = Number(value);
+  return value === null || value === undefined || !Number.isFinite(num) ? "—" : `${num.toFixed(1)} ms`;
+}
+
+function formatUtc(value, withMinutes = true) {
+  if (!value) {
+    return "—";
+  }
+  let text = String(value);
+  if (text.length === 10) {
+    text += "T00:00:00";
+  } else if (text.length === 13) {
+    text += ":00:00";
+  }
+  const date = new Date(text.endsWith("Z") ? text : `${text}Z`);
+  if (Number.isNaN(date.getTime())) {
+    return value;
+  }
+  return withMinutes ? date.toLocaleString("ar-EG") : date.toLocaleDateString("ar-EG");
+}
+
+function percentileCells(item) {
+  return `<td>${formatMs(item.p50)}</td><td>${formatMs(item.p95)}</td><td>${formatMs(item.p99)}</td>`;
+}
+
+function renderRows(body, rows, emptyColumns) {
+  body.innerHTML = rows.length ? rows.join("") : `<tr><td colspan="${emptyColumns}">—</td></tr>`;
+}
+
+function render(data) {
+  const outcomes = Object.entries(data.outcomes || {});
+  outcomesEl.innerHTML = outcomes.length
+    ? outcomes.map(([name, total]) => `<div class="field-item"><span>${name}</span><span>${total}</span></div>`).join("")
+    : "—";
+
+  renderRows(stagesBody, (data.stages || []).map(item => (
+    `<tr><td>${stageLabels[item.stage] || item.stage}</td><td>${item.count}</td><td>${formatMs(item.avg_ms)}</td>${percentileCells(item)}</tr>`
+  )), 6);
+
+  gateStageEl.textContent = stageLabels[data.stage] || data.stage || "";
+  renderRows(gatesBody, (data.gates || []).map(item => (
+    `<tr><td>${item.gate_number || "غير محدد"}</td><td>${item.count}</td><td>${formatMs(item.avg_ms)}</td>${percentileCells(item)}</tr>`
+  )), 6);
+
+  const daily = data.granularity === "day";
+  renderRows(seriesBody, (data.series || []).map(item => (
+    `<tr><td>${formatUtc(item.bucket, !daily)}</td><td>${item.count}</td>${percentileCells(item)}</tr>`
+  )), 5);
+
+  renderRows(eventsBody, (data.events || []).map(item => {
+    const score = Number(item.match_score);
+    const size = item.image_width && item.image_height ? `${item.image_width}x${item.image_height}` : "—";
+    const kb = item.image_bytes ? ` (${Math.round(item.image_bytes / 1024)} KB)` : "";
+    return `<tr><td>${formatUtc(item.created_at)}</td><td>${item.gate_number ?? "—"}</td><td>${item.outcome}</td>`
+      + `<td>${Number.isFinite(score) && item.match_score !== null ? score.toFixed(3) : "—"}</td>`
+      + `<td>${size}${kb}</td><td>${formatMs(item.total_ms)}</td></tr>`;
+  }), 6);
+}
+
+async function loadTelemetry() {
+  const params = new URLSearchParams();
+  if (sinceInput.value) {
+    params.set("since", new Date(sinceInput.value).toISOString());
+  }
+  if (untilInput.value) {
+    params.set("until", new Date(untilInput.value).toISOString());
+  }
+  const gate = gateInput.value.trim();
+  if (gate) {
+    params.set("gate_number", gate);
+  }
+  params.set("path", pathSelect.value);
+  setStatus("جاري التحميل...");
+  try {
+    const res = await fetch(`/api/admin/telemetry?${params.toString()}`);
+    const data = await res.json();
+    if (!res.ok) {
+      setStatus(data.detail || "تعذر تحميل البيانات", "error");
+      return;
+    }
+    render(data);
+    setStatus("");
+  } catch (err) {
+    console.error(err);
+    setStatus("تعذر تحميل البيانات", "error");
+  }
+}
+
+const now = new Date();
+untilInput.value = toLocalInput(now);
+sinceInput.value = toLocalInput(new Date(now.getTime() - 24 * 3600 * 1000));
+
+refreshBtn.addEventListener("click", () => {
+  loadTelemetry();
+});
+
+loadTelemetry();